@@ -1,6 +1,6 @@
 import requests
 import psycopg2
-import ollama
+from llm_backends import OllamaBackend, LLMErro
 import json
 
 # Configuração do banco de dados
@@ -51,9 +51,18 @@ def comparar_com_gpt(api_data, texto_carta):
       ...
     ]
     """
-    resposta = ollama.chat(model="gpt-4o-mini", messages=[{"role": "user", "content": prompt}])
     try:
-        return json.loads(resposta["message"]["content"])
+        resposta = OllamaBackend().completar(
+            messages=[{"role": "user", "content": prompt}],
+            model="gpt-4o-mini",
+            temperature=0.2,
+            max_tokens=1000,
+            timeout=120
+        )
+        return json.loads(resposta.texto)
+    except LLMErro as e:
+        print(f"Erro ao consultar o modelo: {str(e)}")
+        return []
     except json.JSONDecodeError:
         print("Erro ao interpretar resposta do GPT.")
         return []
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, NamedTuple, Optional
+from dotenv import load_dotenv
+
+# Carrega as variáveis do arquivo .env
+load_dotenv()
+
+SILB_CACHE_PATH = Path(os.getenv("SILB_CACHE_PATH", "cache/silb_catalogo.sqlite3"))
+SILB_CACHE_TTL_S = float(os.getenv("SILB_CACHE_TTL_S", str(24 * 3600)))
+SILB_CACHE_MAX_ITENS = int(os.getenv("SILB_CACHE_MAX_ITENS", "2048"))
+
+
+class EntradaCatalogo(NamedTuple):
+    dados: Dict
+    etag: Optional[str]
+    last_modified: Optional[str]
+    obtido_em: float
+
+    @property
+    def expirada(self) -> bool:
+        return time.time() - self.obtido_em > SILB_CACHE_TTL_S
+
+
+class CatalogCache:
+    """
+    Cache dos dados catalogados do SILB em dois níveis:
+    LRU em memória e uma tabela SQLite persistente, ambos com TTL.
+    """
+
+    def __init__(self, caminho: Path = SILB_CACHE_PATH, max_itens: int = SILB_CACHE_MAX_ITENS):
+        self.caminho = Path(caminho)
+        self.max_itens = max_itens
+        self._memoria: "OrderedDict[str, EntradaCatalogo]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+        # O arquivo e a tabela só são criados na primeira consulta: importar o módulo não grava nada
+        self._pronto = False
+
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        if not self._pronto:
+            self._preparar()
+        # Uma conexão por operação: sqlite3 não compartilha conexões entre threads
+        conexao = sqlite3.connect(self.caminho, timeout=10)
+        try:
+            with conexao:  # Commit ao final ou rollback em caso de erro
+                yield conexao
+        finally:
+            conexao.close()
+
+    def _preparar(self):
+        with self._lock:
+            if self._pronto:
+                return
+            self.caminho.parent.mkdir(parents=True, exist_ok=True)
+            conexao = sqlite3.connect(self.caminho, timeout=10)
+            try:
+                conexao.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS catalogo (
+                        reference TEXT PRIMARY KEY,
+                        dados TEXT NOT NULL,
+                        etag TEXT,
+                        last_modified TEXT,
+                        obtido_em REAL NOT NULL
+                    )
+                    """
+                )
+            finally:
+                conexao.close()
+            self._pronto = True
+
+    def _guardar_em_memoria(self, reference: str, entrada: EntradaCatalogo):
+        with self._lock:
+            self._memoria[reference] = entrada
+            self._memoria.move_to_end(reference)
+            while len(self._memoria) > self.max_itens:
+                self._memoria.popitem(last=False)
+
+    def obter(self, reference: str) -> Optional[EntradaCatalogo]:
+        """Retorna a entrada em cache (mesmo expirada, para revalidação condicional)"""
+        with self._lock:
+            entrada = self._memoria.get(reference)
+            if entrada is not None:
+                self._memoria.move_to_end(reference)
+
+        if entrada is None:
+            with self._conectar() as conexao:
+                linha = conexao.execute(
+                    "SELECT dados, etag, last_modified, obtido_em FROM catalogo WHERE reference = ?",
+                    (reference,)
+                ).fetchone()
+            if linha is not None:
+                entrada = EntradaCatalogo(json.loads(linha[0]), linha[1], linha[2], linha[3])
+                self._guardar_em_memoria(reference, entrada)
+
+        if entrada is None or entrada.expirada:
+            self.falhas += 1
+        else:
+            self.acertos += 1
+        return entrada
+
+    def salvar(self, reference: str, dados: Dict, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        entrada = EntradaCatalogo(dados, etag, last_modified, time.time())
+        self._guardar_em_memoria(reference, entrada)
+        with self._conectar() as conexao:
+            conexao.execute(
+                "INSERT OR REPLACE INTO catalogo (reference, dados, etag, last_modified, obtido_em) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (reference, json.dumps(dados, ensure_ascii=False), etag, last_modified, entrada.obtido_em)
+            )
+
+    def renovar(self, reference: str, entrada: EntradaCatalogo) -> EntradaCatalogo:
+        """Renova o TTL de uma entrada confirmada pelo servidor (HTTP 304)"""
+        renovada = entrada._replace(obtido_em=time.time())
+        self._guardar_em_memoria(reference, renovada)
+        with self._conectar() as conexao:
+            conexao.execute(
+                "UPDATE catalogo SET obtido_em = ? WHERE reference = ?",
+                (renovada.obtido_em, reference)
+            )
+        return renovada
+
+    def invalidar(self, reference: str) -> bool:
+        with self._lock:
+            em_memoria = self._memoria.pop(reference, None) is not None
+        with self._conectar() as conexao:
+            removidas = conexao.execute("DELETE FROM catalogo WHERE reference = ?", (reference,)).rowcount
+        return em_memoria or removidas > 0
+
+    def estatisticas(self) -> Dict:
+        return {
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "em_memoria": len(self._memoria),
+            "max_itens": self.max_itens,
+            "ttl_s": SILB_CACHE_TTL_S,
+        }
+
+
+catalog_cache = CatalogCache()
@@ -1,10 +1,27 @@
 import os
+import re
 import json
-from typing import Dict, Optional
+import hashlib
+import unicodedata
+from datetime import datetime
+from concurrent.futures import Future, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 import requests
-from gpt_client import GPTClient
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from gpt_client import criar_cliente
+from llm_backends import LLMErro, LLMRespostaInvalidaErro
+from json_stream import ParserErrosIncremental, interpretar_resposta
+from prompt_builder import ConstrutorPrompt, dividir_texto, json_compacto
+from roteamento import GRUPOS_CAMPOS, GrupoCampos, agrupar_campos, selecionar_trechos
+import executores
+from persistencia import escritor_catalogacao, INSERIR
+from catalog_cache import catalog_cache
 from db import get_catalogacao_db, get_silb_db
-from models import CatalogacaoErro, Request, File, FileRequests
+from prefetch import CatalogPrefetcher
+from metricas import ERROS, ETAPAS_VERIFICACAO
+from models import CatalogacaoErro, Request, File, FileRequests, VerificacaoRegistro, ORIGEM_LLM, ORIGEM_REGRA
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 import logging
 from dotenv import load_dotenv
@@ -16,52 +33,136 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Configurações da API
-SILB_API_BASE_URL =  (
-        f"http://plataformasilb.cchla.ufrn.br/api/get/tabela?")
-GPT_CLIENT = GPTClient(api_key=os.getenv("LLM_VARREDOR_API_KEY"))
+SILB_API_BASE_URL = os.getenv(
+    "SILB_API_BASE_URL", "http://plataformasilb.cchla.ufrn.br/api/get/tabela")
+SILB_TIMEOUT_CONEXAO = float(os.getenv("SILB_TIMEOUT_CONEXAO", "5"))
+SILB_TIMEOUT_LEITURA = float(os.getenv("SILB_TIMEOUT_LEITURA", "30"))
+SILB_MAX_TENTATIVAS = int(os.getenv("SILB_MAX_TENTATIVAS", "3"))
+GPT_CLIENT = criar_cliente("analisador", api_key=os.getenv("LLM_VARREDOR_API_KEY"))
+
+# O prompt de análise cabe num orçamento de tokens (PROMPT_MAX_TOKENS_ANALISADOR);
+# do PDF só é extraído o texto que pode caber nele
+PROMPT_ANALISE = ConstrutorPrompt("analisador", GPT_CLIENT.model, GPT_CLIENT.max_tokens)
+
+# Cartas longas podem ser divididas em trechos sobrepostos, analisados em paralelo
+ANALISE_EM_PARTES = os.getenv("ANALISE_EM_PARTES", "0") == "1"
+ANALISE_SOBREPOSICAO_TOKENS = int(os.getenv("ANALISE_SOBREPOSICAO_TOKENS", "200"))
+ANALISE_MAX_PARTES = int(os.getenv("ANALISE_MAX_PARTES", "8"))
+
+# Conferências determinísticas (datas, total de sesmeiros, léguas) antes do LLM
+REGRAS_ATIVAS = os.getenv("REGRAS_ATIVAS", "1") == "1"
+
+# "completo" (padrão): todos os campos num prompt. "roteado": um prompt focado por grupo de
+# campos (partes, datas, localização, área, deferimento) só com os trechos da carta ligados a ele
+MODO_ANALISE = os.getenv("MODO_ANALISE", "completo").lower()
+
+# Nos modos em partes e roteado o texto é extraído por inteiro
+LIMITE_TEXTO_PROMPT = None if ANALISE_EM_PARTES or MODO_ANALISE == "roteado" else PROMPT_ANALISE.limite_caracteres
+
+ASSISTENTE_ANALISE = "Você é um historiador especializado em documentos coloniais."
+
+# Versão do prompt de análise guardada no histórico de verificações. Mudanças nos modelos do
+# prompt, no roteamento, no modo de análise ou em DeterministicChecker.VERSAO já geram outra
+# versão; aumente para invalidar o histórico quando mudar algo que elas não captam
+PROMPT_VERSAO = os.getenv("PROMPT_VERSAO", "1")
+if len(PROMPT_VERSAO) > 80:
+    # verificacao_registros.prompt_version guarda PROMPT_VERSAO mais "-" e 12 caracteres de hash
+    raise ValueError("PROMPT_VERSAO deve ter no máximo 80 caracteres")
+
+def _criar_sessao_silb() -> requests.Session:
+    """Sessão com pool de conexões e novas tentativas limitadas para a API do SILB"""
+    sessao = requests.Session()
+    tentativas = Retry(
+        total=SILB_MAX_TENTATIVAS,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+        respect_retry_after_header=True,
+    )
+    adaptador = HTTPAdapter(max_retries=tentativas, pool_maxsize=int(os.getenv("IO_THREAD_WORKERS", "16")))
+    sessao.mount("http://", adaptador)
+    sessao.mount("https://", adaptador)
+    return sessao
 
 class SILBDataFetcher:
-    @staticmethod
-    def fetch_catalog_data(reference: str) -> Optional[Dict]:
-        """Busca dados catalogados na API do SILB"""
-        url = (
-        f"http://plataformasilb.cchla.ufrn.br/api/get/tabela?"
-        f"reference={reference}"
-        f"&captaincy_name="
-        f"&owner="
-        f"&date_request="
-        f"&date_request_fim="
-        f"&dateConcession="
-        f"&dateConcession_fim="
-        f"&location="
-        f"&marcos="
-        f"&typeArea="
-        f"&landrecord_comments="
-        f"&comments="
-        f"&limitant="
-        f"&comments_justification="
-        f"&sources="
-        f"&comments_deferment="
-        f"&comments_demands="
-        )
+    # Filtros aceitos pela API; apenas reference é preenchido
+    FILTROS_VAZIOS = [
+        "captaincy_name", "owner", "date_request", "date_request_fim",
+        "dateConcession", "dateConcession_fim", "location", "marcos",
+        "typeArea", "landrecord_comments", "comments", "limitant",
+        "comments_justification", "sources", "comments_deferment", "comments_demands",
+    ]
+
+    session = _criar_sessao_silb()
+    cache = catalog_cache
+
+    @classmethod
+    def fetch_catalog_data(cls, reference: str, usar_cache: bool = True) -> Optional[Dict]:
+        """Busca dados catalogados na API do SILB, com cache e revalidação condicional"""
+        entrada = cls.cache.obter(reference) if usar_cache else None
+        if entrada is not None and not entrada.expirada:
+            return entrada.dados
+
+        params = {"reference": reference}
+        params.update({filtro: "" for filtro in cls.FILTROS_VAZIOS})
+
+        # Entrada expirada: pergunta ao servidor se os dados mudaram
+        headers = {}
+        if entrada is not None:
+            if entrada.etag:
+                headers["If-None-Match"] = entrada.etag
+            if entrada.last_modified:
+                headers["If-Modified-Since"] = entrada.last_modified
+
         try:
-            params = {
-                "reference": reference,
-                # Outros parâmetros podem ser adicionados conforme necessidade
-            }
-            
-            response = requests.get(url)
+            response = cls.session.get(
+                SILB_API_BASE_URL,
+                params=params,
+                headers=headers,
+                timeout=(SILB_TIMEOUT_CONEXAO, SILB_TIMEOUT_LEITURA)
+            )
+            if response.status_code == 304 and entrada is not None:
+                return cls.cache.renovar(reference, entrada).dados
+
             response.raise_for_status()
             data = response.json()
             
             # A API retorna uma lista, pegamos o primeiro item
             if isinstance(data, list) and len(data) > 0:
+                cls.cache.salvar(
+                    reference,
+                    data[0],
+                    etag=response.headers.get("ETag"),
+                    last_modified=response.headers.get("Last-Modified")
+                )
                 return data[0]
             return None
         except Exception as e:
             logger.error(f"Erro ao buscar dados do SILB para {reference}: {str(e)}")
+            if entrada is not None:
+                # Melhor usar dados expirados do que interromper a análise
+                logger.warning(f"Usando dados em cache expirados para {reference}")
+                return entrada.dados
             return None
 
+def buscar_lote_catalogo(references: List[str]) -> Dict[str, Dict]:
+    """Carrega um lote de references para o prefetch pela API do SILB"""
+    resultados = {}
+    for reference in references:
+        dados = SILBDataFetcher.fetch_catalog_data(reference)
+        if dados:
+            resultados[reference] = dados
+    return resultados
+
+catalog_prefetcher = CatalogPrefetcher(buscar_lote_catalogo)
+
+def buscar_dados_catalogo(reference: str) -> Optional[Dict]:
+    """Obtém os dados catalogados da reference: primeiro o que o prefetch já carregou, depois a API"""
+    dados = catalog_prefetcher.obter(reference)
+    if dados:
+        return dados
+    return SILBDataFetcher.fetch_catalog_data(reference)
+
 class DataParser:
     """Responsável por processar e traduzir os dados da API do SILB"""
     
@@ -135,53 +236,356 @@ class DataParser:
 
     
     @classmethod
-    def parse_and_filter(cls, api_data: Dict) -> Dict:
-        """Filtra e traduz os campos relevantes para análise"""
-        if not api_data:
-            return {}
-            
+    def _indice_campos(cls) -> Dict[str, Tuple[int, str]]:
+        """
+        Índice chave-em-minúsculas → (posição no FIELD_MAPPING, campo traduzido),
+        montado uma vez por classe. Quando várias chaves levam ao mesmo campo
+        ("Tipo de petição", "Confrontantes", "Observações da petição"), vale a
+        última do FIELD_MAPPING que tiver valor, como no mapeamento original.
+        """
+        indice = cls.__dict__.get("_indice")
+        if indice is None:
+            indice = {
+                original_field.lower(): (posicao, translated_field)
+                for posicao, (original_field, translated_field) in enumerate(cls.FIELD_MAPPING.items())
+            }
+            cls._indice = indice
+        return indice
+
+    @staticmethod
+    def _valor_valido(value) -> bool:
+        # Trata valores "NC" como vazios
+        return bool(value) and str(value).strip().upper() != "NC"
+
+    @classmethod
+    def _parse(cls, api_data: Dict, indice: Dict[str, Tuple[int, str]], total_campos: int) -> Dict:
+        # Um slot por entrada do FIELD_MAPPING, preenchido em uma passada pelas chaves do registro
+        slots = [None] * total_campos
+        for key, value in api_data.items():
+            entrada = indice.get(key.lower())
+            if entrada is not None and slots[entrada[0]] is None and cls._valor_valido(value):
+                slots[entrada[0]] = (entrada[1], value)
+
         parsed_data = {}
-        
-        # Primeiro verifica todas as chaves disponíveis no response
-        available_keys = set(api_data.keys())
-        logger.debug(f"Chaves disponíveis na resposta: {available_keys}")
-        
-        for original_field, translated_field in cls.FIELD_MAPPING.items():
-            # Verifica se a chave existe no response (case insensitive)
-            matching_keys = [k for k in available_keys if k.lower() == original_field.lower()]
-            
-            if matching_keys:
-                actual_key = matching_keys[0]
-                value = api_data[actual_key]
-                
-                # Trata valores "NC" como vazios
-                if value and str(value).strip().upper() != "NC":
-                    parsed_data[translated_field] = value
-        
+        for slot in slots:
+            if slot is not None:
+                parsed_data[slot[0]] = slot[1]
+
         # Adiciona o reference se não estiver presente
         if 'reference' in api_data and 'referencia' not in parsed_data:
             parsed_data['referencia'] = api_data['reference']
-            
-        logger.debug(f"Dados parseados: {parsed_data}")
         return parsed_data
 
+    @classmethod
+    def parse_and_filter(cls, api_data: Dict) -> Dict:
+        """Filtra e traduz os campos relevantes para análise"""
+        if not api_data:
+            return {}
+
+        parsed_data = cls._parse(api_data, cls._indice_campos(), len(cls.FIELD_MAPPING))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Dados parseados: {parsed_data}")
+        return parsed_data
+
+    @classmethod
+    def parse_many(cls, registros: List[Dict]) -> List[Dict]:
+        """Versão em lote de parse_and_filter, reaproveitando o índice para todos os registros"""
+        indice = cls._indice_campos()
+        total_campos = len(cls.FIELD_MAPPING)
+        return [cls._parse(registro, indice, total_campos) if registro else {} for registro in registros]
+
+class DeterministicChecker:
+    """
+    Conferências feitas sem o modelo, com expressões regulares pré-compiladas.
+    Cada regra confirma o campo (sem erro), aponta um erro ou deixa o campo para o LLM.
+    """
+
+    # Entra na versão do histórico de verificações: aumente ao mudar o que as regras resolvem
+    VERSAO = 3
+
+    _MESES = ["janeiro", "fevereiro", "marco", "abril", "maio", "junho", "julho",
+              "agosto", "setembro", "outubro", "novembro", "dezembro"]
+    _NUMEROS = {
+        "um": 1, "uma": 1, "dois": 2, "duas": 2, "tres": 3, "quatro": 4, "cinco": 5,
+        "seis": 6, "sete": 7, "oito": 8, "nove": 9, "dez": 10, "onze": 11, "doze": 12,
+        "quinze": 15, "vinte": 20, "trinta": 30,
+    }
+    _NUM = r"(\d+(?:[.,]\d+)?|" + "|".join(_NUMEROS) + r")"
+
+    # Dias e anos por extenso ("aos vinte e tres dias do mes de maio de mil setecentos e dois")
+    _EXTENSO = {
+        "primeiro": 1, "um": 1, "uma": 1, "dois": 2, "duas": 2, "tres": 3, "quatro": 4, "cinco": 5,
+        "seis": 6, "sete": 7, "oito": 8, "nove": 9, "dez": 10, "onze": 11, "doze": 12, "treze": 13,
+        "catorze": 14, "quatorze": 14, "quinze": 15, "dezesseis": 16, "dezaseis": 16, "dezessete": 17,
+        "dezasete": 17, "dezoito": 18, "dezenove": 19, "dezanove": 19, "vinte": 20, "trinta": 30,
+        "quarenta": 40, "cinquenta": 50, "cincoenta": 50, "sessenta": 60, "setenta": 70, "oitenta": 80,
+        "noventa": 90, "cem": 100, "cento": 100, "duzentos": 200, "trezentos": 300, "quatrocentos": 400,
+        "quinhentos": 500, "seiscentos": 600, "setecentos": 700, "oitocentos": 800, "novecentos": 900,
+        "mil": 1000,
+    }
+    _PALAVRA_NUMERO = r"(?:" + "|".join(sorted(_EXTENSO, key=len, reverse=True)) + r")"
+    _NUMERO_EXTENSO = _PALAVRA_NUMERO + r"(?:(?: e | )" + _PALAVRA_NUMERO + r")*"
+
+    _DATA_EXTENSO = re.compile(
+        r"\b(\d{1,2}|" + _NUMERO_EXTENSO + r")(?: dias?)?(?: do mes)? de (" + "|".join(_MESES) + r")"
+        r"(?: do ano)? de (1[5-8]\d\d|mil(?:(?: e | )" + _PALAVRA_NUMERO + r")+)\b"
+    )
+    _DATA_NUMERICA = re.compile(r"\b(\d{1,2})/(\d{1,2})/(1[5-8]\d\d)\b")
+    _DATA_ISO = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})")
+    _MEDIDA_CARTA = re.compile(
+        r"\b" + _NUM + r"(?P<meia1> e meia)?(?: (?P<unidade>leguas?|legoas?|bracas?))?(?P<meia2> e meia)?"
+        r"(?: de terra)? (?P<dimensao>em quadr[oa]|de comprido|de comprimento|de largo|de largura)"
+    )
+    _MEDIDA_CATALOGO = re.compile(r"\b" + _NUM + r"(?P<meia> e meia)?")
+    # Palavras que ligam uma data da carta ao campo; a data precisa estar a até
+    # _JANELA_DATA caracteres de uma delas (e de nenhuma do outro campo)
+    _PALAVRAS_DATA = {
+        "Data da petição": re.compile(r"\b(?:petic|requer)"),
+        "Data da concessão": re.compile(r"\b(?:concess|conced)"),
+    }
+    _JANELA_DATA = 150
+    # Nomes do campo Nome: separados por vírgula, ponto e vírgula ou " e " antes de maiúscula
+    _SEPARADOR_NOMES = re.compile(r"\s*[,;]\s*|\s+e\s+(?=[A-ZÁÉÍÓÚÂÊÔÃÕÇ])")
+    CAMPO_TOTAL_SESMEIROS = "Total de sesmeiros que solicitaram a sesmaria"
+
+    @staticmethod
+    def _normalizar(texto: str) -> str:
+        decomposto = unicodedata.normalize("NFKD", str(texto).lower())
+        sem_acentos = "".join(caractere for caractere in decomposto if not unicodedata.combining(caractere))
+        return re.sub(r"\s+", " ", sem_acentos)
+
+    @classmethod
+    def _inteiro(cls, valor: str) -> Optional[int]:
+        """Número em algarismos ou por extenso ("mil seiscentos e noventa e oito")"""
+        if valor.isdigit():
+            return int(valor)
+        total, parcial = 0, 0
+        for palavra in valor.split():
+            if palavra == "e":
+                continue
+            if palavra == "mil":
+                total += (parcial or 1) * 1000
+                parcial = 0
+            elif palavra in cls._EXTENSO:
+                parcial += cls._EXTENSO[palavra]
+            else:
+                return None
+        return total + parcial
+
+    @classmethod
+    def _numero(cls, valor: str) -> Optional[float]:
+        if valor in cls._NUMEROS:
+            return float(cls._NUMEROS[valor])
+        try:
+            return float(valor.replace(",", "."))
+        except ValueError:
+            return None
+
+    @classmethod
+    def _datas_carta(cls, texto: str) -> Dict[str, set]:
+        """
+        Datas da carta por campo. Uma data só conta para o campo cuja palavra-chave está perto
+        dela: com as datas de petição e concessão trocadas no catálogo, nenhuma é confirmada
+        """
+        encontradas = []
+        for encontrada in cls._DATA_EXTENSO.finditer(texto):
+            dia, mes, ano = encontrada.groups()
+            dia, ano = cls._inteiro(dia), cls._inteiro(ano)
+            if dia and ano and 1 <= dia <= 31 and 1500 <= ano <= 1899:
+                encontradas.append((encontrada, (ano, cls._MESES.index(mes) + 1, dia)))
+        for encontrada in cls._DATA_NUMERICA.finditer(texto):
+            dia, mes, ano = encontrada.groups()
+            encontradas.append((encontrada, (int(ano), int(mes), int(dia))))
+
+        datas = {campo: set() for campo in cls._PALAVRAS_DATA}
+        for encontrada, data in encontradas:
+            vizinhanca = texto[max(0, encontrada.start() - cls._JANELA_DATA):encontrada.end() + cls._JANELA_DATA]
+            campos = [campo for campo, palavras in cls._PALAVRAS_DATA.items() if palavras.search(vizinhanca)]
+            if len(campos) == 1:
+                datas[campos[0]].add(data)
+        return datas
+
+    @classmethod
+    def _data_catalogo(cls, valor) -> Optional[Tuple[Tuple[int, int, int], bool]]:
+        """(ano, mês, dia) e se o valor está em ISO; None se não for uma data reconhecível"""
+        texto = str(valor).strip()
+        encontrada = cls._DATA_ISO.match(texto)
+        if encontrada:
+            ano, mes, dia = encontrada.groups()
+            return (int(ano), int(mes), int(dia)), True
+        encontrada = cls._DATA_NUMERICA.search(texto)
+        if encontrada:
+            dia, mes, ano = encontrada.groups()
+            return (int(ano), int(mes), int(dia)), False
+        return None
+
+    @classmethod
+    def _checar_data(cls, campo: str, valor, datas_carta: set) -> Tuple[bool, Optional[Dict]]:
+        catalogada = cls._data_catalogo(valor)
+        if catalogada is None or not datas_carta:
+            return False, None
+        data, iso = catalogada
+        if data in datas_carta:
+            return True, None
+
+        # Só aponta erro quando uma única data da carta difere em apenas um componente
+        proximas = {
+            candidata for candidata in datas_carta
+            if sum(a == b for a, b in zip(data, candidata)) == 2
+        }
+        if len(proximas) != 1:
+            return False, None
+        ano, mes, dia = proximas.pop()
+        correta = f"{ano:04d}-{mes:02d}-{dia:02d}" if iso else f"{dia:02d}/{mes:02d}/{ano:04d}"
+        return True, {
+            "campo": campo,
+            "valor_incorreto": str(valor),
+            "valor_correto": correta,
+            "motivo": f"Verificação automática: a carta registra {dia:02d}/{mes:02d}/{ano:04d}, "
+                      f"que difere da data catalogada em um único componente",
+        }
+
+    @classmethod
+    def _sesmeiros_na_carta(cls, nomes, texto: str) -> Optional[int]:
+        """
+        Quantos sesmeiros do campo Nome são nomeados na carta (texto já normalizado).
+        None se a lista não é conclusiva ("e outros") ou se algum nome não aparece no texto
+        """
+        lista = [nome for nome in cls._SEPARADOR_NOMES.split(str(nomes).strip()) if nome.strip()]
+        if not lista or any("outros" in cls._normalizar(nome) for nome in lista):
+            return None
+        for nome in lista:
+            padrao = r"\b" + re.escape(cls._normalizar(nome).strip()) + r"\b"
+            if not re.search(padrao, texto):
+                return None
+        return len(lista)
+
+    @classmethod
+    def _checar_total_sesmeiros(cls, catalog_data: Dict, texto: str) -> Tuple[bool, Optional[Dict]]:
+        """
+        Compara o total catalogado com os sesmeiros nomeados na carta. Só confirma quando todos
+        os nomes catalogados aparecem no texto; um total menor que os nomeados é erro, um total
+        maior fica para o LLM (a carta pode citar sesmeiros que o campo Nome não lista)
+        """
+        campo = cls.CAMPO_TOTAL_SESMEIROS
+        total = cls._inteiro(cls._normalizar(catalog_data[campo]).strip())
+        nomeados = cls._sesmeiros_na_carta(catalog_data.get("Nome", ""), texto)
+        if total is None or nomeados is None or total > nomeados:
+            return False, None
+        if total == nomeados:
+            return True, None
+        return True, {
+            "campo": campo,
+            "valor_incorreto": str(catalog_data[campo]),
+            "valor_correto": str(nomeados),
+            "motivo": f"Verificação automática: a carta nomeia {nomeados} sesmeiros",
+        }
+
+    @classmethod
+    def _medidas_carta(cls, texto: str) -> Dict[str, set]:
+        """Valores em léguas de largura e comprimento encontrados na carta"""
+        medidas = {"Largura": set(), "Comprimento": set()}
+        for encontrada in cls._MEDIDA_CARTA.finditer(texto):
+            unidade = encontrada.group("unidade") or ""
+            dimensao = encontrada.group("dimensao")
+            if unidade.startswith("braca") or (not unidade and dimensao.startswith("em quadr")):
+                continue
+            valor = cls._numero(encontrada.group(1))
+            if valor is None:
+                continue
+            if encontrada.group("meia1") or encontrada.group("meia2"):
+                valor += 0.5
+            if dimensao.startswith("em quadr"):
+                medidas["Largura"].add(valor)
+                medidas["Comprimento"].add(valor)
+            elif "larg" in dimensao:
+                medidas["Largura"].add(valor)
+            else:
+                medidas["Comprimento"].add(valor)
+        return medidas
+
+    @classmethod
+    def _checar_medida(cls, campo: str, valor, medidas: set) -> Tuple[bool, Optional[Dict]]:
+        normalizado = cls._normalizar(valor)
+        encontrada = cls._MEDIDA_CATALOGO.search(normalizado)
+        # Só compara quando a carta traz um único valor e o catálogo um número em léguas
+        if len(medidas) != 1 or encontrada is None or "braca" in normalizado:
+            return False, None
+        catalogada = cls._numero(encontrada.group(1))
+        if catalogada is None:
+            return False, None
+        if encontrada.group("meia"):
+            catalogada += 0.5
+        correta = next(iter(medidas))
+        if abs(catalogada - correta) < 1e-6:
+            return True, None
+        return True, {
+            "campo": campo,
+            "valor_incorreto": str(valor),
+            "valor_correto": f"{correta:g} léguas",
+            "motivo": f"Verificação automática: a carta indica {correta:g} léguas de {campo.lower()}",
+        }
+
+    @classmethod
+    def check(cls, catalog_data: Dict, document_text: str) -> Tuple[List[Dict], set]:
+        """Retorna os erros encontrados e os campos resolvidos (que não precisam ir ao LLM)"""
+        texto = cls._normalizar(document_text or "")
+        erros, resolvidos = [], set()
+
+        def registrar(campo: str, resultado: Tuple[bool, Optional[Dict]]):
+            resolvido, erro = resultado
+            if resolvido:
+                resolvidos.add(campo)
+            if erro:
+                erros.append(erro)
+
+        datas = cls._datas_carta(texto)
+        for campo in ("Data da petição", "Data da concessão"):
+            if campo in catalog_data:
+                registrar(campo, cls._checar_data(campo, catalog_data[campo], datas[campo]))
+
+        if cls.CAMPO_TOTAL_SESMEIROS in catalog_data:
+            registrar(cls.CAMPO_TOTAL_SESMEIROS, cls._checar_total_sesmeiros(catalog_data, texto))
+
+        medidas = cls._medidas_carta(texto)
+        for campo in ("Largura", "Comprimento"):
+            if campo in catalog_data:
+                registrar(campo, cls._checar_medida(campo, catalog_data[campo], medidas[campo]))
+
+        return erros, resolvidos
+
 class HistoricalDocumentAnalyzer:
     """Coordena todo o processo de análise documental"""
     
     @staticmethod
-    def build_analysis_prompt(reference: str, 
-                            catalog_data: Dict, 
-                            document_text: str) -> str:
-        """Constroi o prompt para análise histórica"""
-        return f"""
+    def _modelo_prompt(reference: str,
+                       catalogo: str,
+                       parte: Optional[Tuple[int, int]] = None,
+                       grupo: Optional[GrupoCampos] = None) -> Callable[[str], str]:
+        """
+        Modelo do prompt de análise; parte=(i, n) identifica um trecho de carta longa
+        e grupo, um prompt focado só nos trechos ligados a um grupo de campos
+        """
+        if grupo:
+            titulo = f"Trechos da Carta sobre {grupo.descricao} (Reference: {reference})"
+            aviso = ("\n        Estes são só os trechos da carta ligados a esses campos: não aponte como erro "
+                     "informações ausentes deles.")
+        elif parte:
+            titulo = f"Trecho {parte[0]} de {parte[1]} da Carta (Reference: {reference})"
+            aviso = ("\n        Este é só um trecho da carta: não aponte como erro informações "
+                     "que podem estar em outros trechos.")
+        else:
+            titulo = f"Conteúdo Original da Carta (Reference: {reference})"
+            aviso = ""
+        return lambda texto: f"""
         Você é um especialista em documentos históricos do período colonial brasileiro.
         Analise a carta de sesmaria abaixo comparando com os dados catalogados:
 
         **Dados Catalogados**:
-        {json.dumps(catalog_data, indent=2, ensure_ascii=False)}
+        {catalogo}
 
-        **Conteúdo Original da Carta (Reference: {reference})**:
-        {document_text[:10000]}... [texto truncado para economia]
+        **{titulo}**:
+        {texto}
 
         **Sua Tarefa**:
         1. Identifique discrepâncias entre o conteúdo e os dados catalogados
@@ -190,7 +594,7 @@ class HistoricalDocumentAnalyzer:
            - Valor catalogado incorreto
            - Valor correto baseado no texto
            - Justificativa histórica para a correção
-    
+        {aviso}
 
         **Formato de Resposta JSON**:
         {{
@@ -206,109 +610,533 @@ class HistoricalDocumentAnalyzer:
         }}
         """
 
+    @classmethod
+    def build_analysis_prompt(cls,
+                            reference: str, 
+                            catalog_data: Dict, 
+                            document_text: str,
+                            parte: Optional[Tuple[int, int]] = None,
+                            grupo: Optional[GrupoCampos] = None) -> str:
+        """Constroi o prompt para análise histórica"""
+        with ETAPAS_VERIFICACAO.medir(etapa="montagem_prompt"):
+            modelo = cls._modelo_prompt(reference, json_compacto(catalog_data), parte, grupo)
+            return PROMPT_ANALISE.montar(modelo, document_text)
+
+    @staticmethod
+    def _dados_catalogo(reference: str) -> Dict:
+        """Busca e filtra os dados catalogados da reference"""
+        # 1. Busca dados catalogados
+        with ETAPAS_VERIFICACAO.medir(etapa="busca_silb"):
+            raw_data = buscar_dados_catalogo(reference)
+
+        if not raw_data:
+            raise ValueError(f"Dados não encontrados para {reference}")
+
+        # 2. Parseia e filtra os dados
+        logger.debug(f"Dados encontrados para {reference}: {raw_data}")
+        catalog_data = DataParser.parse_and_filter(raw_data)
+        if not catalog_data:
+            raise ValueError("Nenhum dado relevante encontrado para análise")
+        return catalog_data
+
+    @classmethod
+    def _dividir_carta(cls, reference: str, catalog_data: Dict, document_text: str) -> List[str]:
+        """Trechos analisados separadamente; sem ANALISE_EM_PARTES, a carta inteira (cortada no orçamento)"""
+        if not ANALISE_EM_PARTES:
+            return [document_text]
+
+        # O cabeçalho de trecho entra na conta da parte fixa do prompt
+        modelo = cls._modelo_prompt(reference, json_compacto(catalog_data), (ANALISE_MAX_PARTES, ANALISE_MAX_PARTES))
+        partes = dividir_texto(
+            document_text, PROMPT_ANALISE.orcamento_texto(modelo), ANALISE_SOBREPOSICAO_TOKENS, PROMPT_ANALISE.model
+        )
+        if len(partes) > ANALISE_MAX_PARTES:
+            logger.warning(f"{reference} tem {len(partes)} trechos; só os {ANALISE_MAX_PARTES} primeiros serão analisados")
+            partes = partes[:ANALISE_MAX_PARTES]
+        return partes
+
+    @classmethod
+    def _planejar(cls, reference: str, catalog_data: Dict, document_text: str) -> List[Tuple[Dict, str, Optional[GrupoCampos]]]:
+        """
+        Prompts da análise como (dados catalogados, texto, grupo). Com MODO_ANALISE=roteado,
+        um prompt focado por grupo de campos; senão a carta inteira ou seus trechos
+        """
+        if MODO_ANALISE == "roteado":
+            dados_por_grupo = agrupar_campos(catalog_data)
+            tarefas = [
+                (dados_por_grupo[grupo.nome],
+                 selecionar_trechos(document_text, grupo, dados_por_grupo[grupo.nome], PROMPT_ANALISE.model),
+                 grupo)
+                for grupo in GRUPOS_CAMPOS if grupo.nome in dados_por_grupo
+            ]
+            if tarefas:
+                return tarefas
+            logger.info(f"{reference} não tem campos roteáveis; analisando a carta inteira")
+
+        return [(catalog_data, parte, None) for parte in cls._dividir_carta(reference, catalog_data, document_text)]
+
+    @classmethod
+    def _analisar_parte(cls, reference: str, catalog_data: Dict, texto: str, parte: Tuple[int, int],
+                        grupo: Optional[GrupoCampos] = None) -> Dict:
+        prompt = cls.build_analysis_prompt(reference, catalog_data, texto, parte, grupo)
+        with ETAPAS_VERIFICACAO.medir(etapa="chamada_llm"):
+            response = GPT_CLIENT.generate_content(
+                assistant_prompt=ASSISTENTE_ANALISE,
+                user_prompt=prompt
+            )
+        resultado = cls._process_gpt_response(response, reference, prompt)
+        resultado["parte"] = parte[0]
+        return resultado
+
+    @classmethod
+    def _analisar_partes(cls, reference: str, tarefas: List[Tuple[Dict, str, Optional[GrupoCampos]]]) -> Iterator[Dict]:
+        """Analisa os trechos (ou grupos) em paralelo e produz cada resultado assim que fica pronto"""
+        total = len(tarefas)
+        futuros = [
+            executores.pool_llm.submeter(cls._analisar_parte, reference, dados, texto, (i, total), grupo)
+            for i, (dados, texto, grupo) in enumerate(tarefas, start=1)
+        ]
+        try:
+            for futuro in as_completed(futuros):
+                yield futuro.result()
+        finally:
+            # Se um trecho falhou, os que ainda não começaram são descartados
+            for futuro in futuros:
+                futuro.cancel()
+
+    @staticmethod
+    def _chave_erro(erro: Dict) -> Tuple[str, str]:
+        return (
+            str(erro.get("campo", "")).strip().lower(),
+            str(erro.get("valor_incorreto", "")).strip().lower(),
+        )
+
+    @classmethod
+    def _combinar(cls, resultados: Iterable[Dict]) -> Dict:
+        """
+        Junta os resultados dos trechos, sem repetir erros com o mesmo (campo, valor_incorreto).
+        Se a resposta de algum trecho veio truncada, o resultado combinado também é truncado
+        """
+        erros, vistos, analises, truncada = [], set(), [], False
+        for resultado in sorted(resultados, key=lambda resultado: resultado["parte"]):
+            truncada = truncada or bool(resultado.get("truncada"))
+            for erro in resultado["erros"]:
+                chave = cls._chave_erro(erro)
+                if chave not in vistos:
+                    vistos.add(chave)
+                    erros.append(erro)
+            if resultado.get("analise_geral"):
+                analises.append(resultado["analise_geral"])
+        return {"erros": erros, "analise_geral": "\n".join(analises), "truncada": truncada}
+
     @classmethod
     def analyze_document(cls,
                        reference: str,
                        document_text: str,
-                       db_session: Session) -> Dict:
-        """Executa o pipeline completo de análise"""
+                       db_session: Session,
+                       silb_db: Optional[Session] = None,
+                       pdf_hash: Optional[str] = None,
+                       catalog_data: Optional[Dict] = None) -> Dict:
+        """
+        Executa o pipeline completo de análise; com pdf_hash, o resultado entra no histórico.
+        catalog_data evita buscar de novo os dados já lidos na consulta ao histórico
+        """
+        inicio = datetime.utcnow()
         try:
-            # 1. Busca dados catalogados
-            raw_data = SILBDataFetcher.fetch_catalog_data(reference)
-            print("===============================")
-            print("Dados encontrados")
+            if catalog_data is None:
+                catalog_data = cls._dados_catalogo(reference)
+            chave = VerificationLedger.chave(reference, pdf_hash, catalog_data) if pdf_hash else None
             
-            if not raw_data:
-                raise ValueError(f"Dados não encontrados para {reference}")
+            # 3. Conferências determinísticas; só os campos não resolvidos seguem para o LLM
+            erros_regras, catalog_data, gravacoes = cls._aplicar_regras(reference, catalog_data, document_text)
+            tarefas = cls._planejar(reference, catalog_data, document_text) if cls._tem_campos(catalog_data) else []
             
-            # 2. Parseia e filtra os dados
-            print(raw_data)
-            catalog_data = DataParser.parse_and_filter(raw_data)
-            if not catalog_data:
-                raise ValueError("Nenhum dado relevante encontrado para análise")
-            
-            # 3. Prepara e envia para análise do GPT
-            prompt = cls.build_analysis_prompt(reference, catalog_data, document_text)
-            
-            response = GPT_CLIENT.generate_content(
-                assistant_prompt="Você é um historiador especializado em documentos coloniais.",
-                user_prompt=prompt
-            )
+            if not tarefas:
+                result = {"erros": [], "analise_geral": "Todos os campos foram conferidos por regras"}
+            elif len(tarefas) == 1 and tarefas[0][2] is None:
+                # 4. Prepara e envia para análise do GPT
+                prompt = cls.build_analysis_prompt(reference, catalog_data, tarefas[0][1])
+                with ETAPAS_VERIFICACAO.medir(etapa="chamada_llm"):
+                    response = GPT_CLIENT.generate_content(
+                        assistant_prompt=ASSISTENTE_ANALISE,
+                        user_prompt=prompt
+                    )
+                
+                # 5. Processa a resposta
+                result = cls._process_gpt_response(response, reference, prompt)
+            else:
+                # 4. Carta longa ou análise roteada: vários prompts menores, todos ao mesmo tempo
+                logger.info(f"Analisando {reference} em {len(tarefas)} prompts")
+                result = cls._combinar(cls._analisar_partes(reference, tarefas))
             
-            # 4. Processa a resposta
-            result = cls._process_gpt_response(response, reference, db_session)
+            # 6. Os erros entram no próximo lote do escritor; o resultado só é registrado
+            # (e devolvido) depois do commit
+            gravacao = cls._persistir_resultado(result, reference)
+            if gravacao is not None:
+                gravacoes.append(gravacao)
+            cls._aguardar_gravacoes(gravacoes)
             
-            return {
+            truncada = bool(result.get("truncada"))
+            if truncada:
+                logger.warning(f"Resposta truncada para {reference}: {len(result['erros'])} erros aproveitados")
+            resultado = {
                 "status": "success",
                 "reference": reference,
-                "erros_identificados": result["erros"],
-                "analise_geral": result["analise_geral"]
+                "erros_identificados": erros_regras + result.get("erros", []),
+                "analise_geral": result.get("analise_geral", ""),
+                "truncada": truncada,
             }
+            # Uma resposta truncada não entra no histórico: a próxima verificação tenta de novo
+            if chave and not truncada:
+                VerificationLedger.registrar(db_session, chave, resultado, inicio)
+            return resultado
             
         except Exception as e:
             logger.error(f"Erro na análise de {reference}: {str(e)}")
             raise
 
-    @staticmethod
-    def _process_gpt_response(response: Dict, 
-                            reference: str,
-                            db_session: Session) -> Dict:
-        """Processa a resposta do GPT e persiste os erros"""
+    @classmethod
+    def analyze_document_stream(cls,
+                                reference: str,
+                                document_text: str,
+                                db_session: Session,
+                                silb_db: Optional[Session] = None,
+                                pdf_hash: Optional[str] = None,
+                                catalog_data: Optional[Dict] = None) -> Iterator[Dict]:
+        """
+        Versão em streaming: cada erro é gravado e emitido ({"evento": "erro"}) assim que
+        o modelo fecha o objeto; o último evento ("fim") traz o mesmo resultado de analyze_document.
+        Com vários prompts (trechos ou grupos de campos), os erros de cada um saem quando ele termina.
+        """
+        inicio = datetime.utcnow()
         try:
-            # Extrai a resposta JSON
-            raw_response = response.get("response", "{}")
-            clean_response = raw_response.strip("```json").strip("```").strip()
-            analysis_result = json.loads(clean_response)
-            
-            # Persiste cada erro encontrado
-            for erro in analysis_result.get("erros", []):
-                db_session.add(CatalogacaoErro(
-                    reference=reference,
-                    campo=erro["campo"],
-                    conteudo_errado=erro["valor_incorreto"],
-                    resposta_correta=erro["valor_correto"],
-                    motivo=erro["motivo"],
-                    julgado=False,
-                ))
-            
-            db_session.commit()
-            return analysis_result
-            
-        except json.JSONDecodeError:
-            logger.error("Resposta do GPT em formato inválido")
-            raise ValueError("Resposta da análise em formato inválido")
+            if catalog_data is None:
+                catalog_data = cls._dados_catalogo(reference)
+            chave = VerificationLedger.chave(reference, pdf_hash, catalog_data) if pdf_hash else None
+            erros_regras, catalog_data, gravacoes = cls._aplicar_regras(reference, catalog_data, document_text)
+            for erro in erros_regras:
+                yield {"evento": "erro", "dados": erro}
+
+            tarefas = cls._planejar(reference, catalog_data, document_text) if cls._tem_campos(catalog_data) else []
+            truncada = False
+
+            if not tarefas:
+                result = {"erros": [], "analise_geral": "Todos os campos foram conferidos por regras"}
+            elif len(tarefas) == 1 and tarefas[0][2] is None:
+                prompt = cls.build_analysis_prompt(reference, catalog_data, tarefas[0][1])
+                parser = ParserErrosIncremental()
+                for pedaco in GPT_CLIENT.generate_content_stream(
+                    assistant_prompt=ASSISTENTE_ANALISE,
+                    user_prompt=prompt
+                ):
+                    for erro in parser.alimentar(pedaco):
+                        gravacao = cls._persistir_erros([erro], reference)
+                        if gravacao is not None:
+                            gravacoes.append(gravacao)
+                            yield {"evento": "erro", "dados": erro}
+
+                try:
+                    result = parser.finalizar()
+                except LLMRespostaInvalidaErro:
+                    GPT_CLIENT.invalidar(ASSISTENTE_ANALISE, prompt)
+                    raise
+                truncada = result.get("truncada", False)
+                if truncada:
+                    GPT_CLIENT.invalidar(ASSISTENTE_ANALISE, prompt)
+                    logger.warning(f"Resposta truncada para {reference}: {len(result['erros'])} erros aproveitados")
+            else:
+                resultados = []
+                vistos = set()
+                for resultado in cls._analisar_partes(reference, tarefas):
+                    resultados.append(resultado)
+                    for erro in resultado["erros"]:
+                        chave = cls._chave_erro(erro)
+                        if chave in vistos:
+                            continue
+                        vistos.add(chave)
+                        gravacao = cls._persistir_erros([erro], reference)
+                        if gravacao is not None:
+                            gravacoes.append(gravacao)
+                            yield {"evento": "erro", "dados": erro}
+                result = cls._combinar(resultados)
+                truncada = result["truncada"]
+
+            # Os erros já emitidos precisam estar gravados antes do evento final
+            cls._aguardar_gravacoes(gravacoes)
+
+            resultado = {
+                "status": "success",
+                "reference": reference,
+                "erros_identificados": erros_regras + result["erros"],
+                "analise_geral": result.get("analise_geral", ""),
+                "truncada": truncada,
+            }
+            # Uma resposta truncada não entra no histórico: a próxima verificação tenta de novo
+            if chave and not truncada:
+                VerificationLedger.registrar(db_session, chave, resultado, inicio)
+            yield {"evento": "fim", "dados": resultado}
+
         except Exception as e:
             db_session.rollback()
-            logger.error(f"Erro ao processar resposta: {str(e)}")
+            logger.error(f"Erro na análise de {reference}: {str(e)}")
             raise
 
+    @staticmethod
+    def _tem_campos(catalog_data: Dict) -> bool:
+        return any(campo != "referencia" for campo in catalog_data)
+
+    @classmethod
+    def _aplicar_regras(cls, reference: str, catalog_data: Dict,
+                        document_text: str) -> Tuple[List[Dict], Dict, List[Future]]:
+        """
+        Roda o DeterministicChecker, agenda a gravação dos erros com origem "regra" e devolve
+        esses erros, os dados catalogados que ainda precisam do LLM e as gravações pendentes
+        """
+        if not REGRAS_ATIVAS:
+            return [], catalog_data, []
+
+        with ETAPAS_VERIFICACAO.medir(etapa="regras"):
+            erros, resolvidos = DeterministicChecker.check(catalog_data, document_text)
+        gravacao = cls._persistir_erros(erros, reference, origem=ORIGEM_REGRA)
+
+        if resolvidos:
+            logger.info(f"{reference}: {len(resolvidos)} campos resolvidos por regras, {len(erros)} erros")
+        dados_llm = {campo: valor for campo, valor in catalog_data.items() if campo not in resolvidos}
+        return erros, dados_llm, [gravacao] if gravacao is not None else []
+
+    @staticmethod
+    def _linha_erro(erro: Dict, reference: str, origem: str) -> Optional[Dict]:
+        """
+        Linha de catalogacao_erros do erro; objetos sem os campos esperados (ou com valores
+        nulos ou que não são texto) são ignorados antes de entrar no lote do escritor
+        """
+        if not isinstance(erro, dict) or not all(
+            isinstance(erro.get(chave), str) for chave in ("campo", "valor_incorreto", "valor_correto", "motivo")
+        ):
+            logger.warning(f"Erro incompleto ignorado para {reference}: {erro}")
+            return None
+        return {
+            "reference": reference,
+            "campo": erro["campo"],
+            "conteudo_errado": erro["valor_incorreto"],
+            "resposta_correta": erro["valor_correto"],
+            "motivo": erro["motivo"],
+            "julgado": False,
+            "origem": origem,
+            "data_registro": datetime.utcnow(),
+        }
+
+    @classmethod
+    def _persistir_erros(cls, erros: List[Dict], reference: str, origem: str = ORIGEM_LLM) -> Optional[Future]:
+        """Agenda os erros no escritor em lote; None se nenhum erro é válido"""
+        linhas = [linha for linha in (cls._linha_erro(erro, reference, origem) for erro in erros) if linha]
+        if not linhas:
+            return None
+        return escritor_catalogacao.enfileirar([(INSERIR, CatalogacaoErro, linhas)])
+
+    @staticmethod
+    def _aguardar_gravacoes(gravacoes: List[Future]):
+        """Espera o commit dos erros agendados; uma falha de gravação interrompe a análise"""
+        with ETAPAS_VERIFICACAO.medir(etapa="gravacao_banco"):
+            for gravacao in gravacoes:
+                gravacao.result()
+
+    @classmethod
+    def _persistir_resultado(cls, analysis_result: Dict, reference: str) -> Optional[Future]:
+        """Agenda todos os erros do resultado; eles entram juntos num mesmo commit"""
+        return cls._persistir_erros(analysis_result["erros"], reference)
+
+    @classmethod
+    def _process_gpt_response(cls,
+                              response: Dict,
+                              reference: str,
+                              prompt: str) -> Dict:
+        """
+        Processa a resposta do GPT. Respostas inválidas ou truncadas saem do cache do LLM,
+        para que uma nova verificação consulte o modelo em vez de repetir a mesma resposta
+        """
+        try:
+            # Extrai a resposta JSON (tolera cercas de código e respostas truncadas)
+            with ETAPAS_VERIFICACAO.medir(etapa="interpretacao_json"):
+                analysis_result = interpretar_resposta(response.get("response", "{}"))
+        except LLMRespostaInvalidaErro:
+            logger.error(f"Resposta do GPT em formato inválido para {reference}")
+            GPT_CLIENT.invalidar(ASSISTENTE_ANALISE, prompt)
+            raise
+
+        if analysis_result.get("truncada"):
+            GPT_CLIENT.invalidar(ASSISTENTE_ANALISE, prompt)
+        return analysis_result
+
+class VerificationLedger:
+    """
+    Histórico de verificações: (reference, pdf_hash, catalog_hash, model, prompt_version)
+    identifica uma análise já feita. Se nada mudou, o resultado registrado é reaproveitado
+    sem extrair o PDF de novo, chamar o LLM ou gravar erros repetidos.
+    """
+
+    @staticmethod
+    def _hash(dados) -> str:
+        return hashlib.sha256(json.dumps(dados, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    @classmethod
+    def versao_prompt(cls) -> str:
+        """
+        PROMPT_VERSAO mais um hash dos modelos do prompt (carta inteira, trecho e cada grupo
+        de campos), dos grupos do roteamento e das opções que mudam a análise
+        """
+        if not hasattr(cls, "_versao"):
+            modelo = HistoricalDocumentAnalyzer._modelo_prompt
+            modelos = [modelo("", "")(""), modelo("", "", (1, 2))("")]
+            modelos += [modelo("", "", grupo=grupo)("") for grupo in GRUPOS_CAMPOS]
+            opcoes = [
+                modelos, GRUPOS_CAMPOS, MODO_ANALISE, ANALISE_EM_PARTES, ANALISE_SOBREPOSICAO_TOKENS,
+                REGRAS_ATIVAS, DeterministicChecker.VERSAO, PROMPT_ANALISE.orcamento, PROMPT_ANALISE.minimo_texto,
+            ]
+            cls._versao = f"{PROMPT_VERSAO}-{cls._hash(opcoes)[:12]}"
+        return cls._versao
+
+    @classmethod
+    def chave(cls, reference: str, pdf_hash: str, catalog_data: Dict) -> Dict:
+        return {
+            "reference": reference,
+            "pdf_hash": pdf_hash,
+            "catalog_hash": cls._hash(catalog_data),
+            "model": GPT_CLIENT.model,
+            "prompt_version": cls.versao_prompt(),
+        }
+
+    @staticmethod
+    def consultar(db_session: Session, chave: Dict) -> Optional[VerificacaoRegistro]:
+        return db_session.query(VerificacaoRegistro).filter_by(**chave).first()
+
+    @classmethod
+    def registrar(cls, db_session: Session, chave: Dict, resultado: Dict, inicio: datetime):
+        """
+        Grava (ou atualiza, numa verificação forçada) o resultado da análise iniciada em inicio.
+        Ao substituir um registro, os erros ainda não julgados que a verificação anterior gravou
+        para a carta são apagados na mesma transação: a nova análise acabou de gravá-los de novo.
+        Erros já julgados ficam, com seus julgamentos
+        """
+        conteudo = json.dumps(resultado, ensure_ascii=False, default=str)
+        try:
+            registro = cls.consultar(db_session, chave)
+            if registro is None:
+                db_session.add(VerificacaoRegistro(resultado=conteudo, **chave))
+            else:
+                anteriores = db_session.query(CatalogacaoErro).filter(
+                    CatalogacaoErro.reference == chave["reference"],
+                    CatalogacaoErro.julgado == False,
+                    CatalogacaoErro.data_registro < inicio,
+                ).delete(synchronize_session=False)
+                if anteriores:
+                    logger.info(f"{anteriores} erros da verificação anterior de {chave['reference']} substituídos")
+                registro.resultado = conteudo
+                registro.data_verificacao = datetime.utcnow()
+            db_session.commit()
+        except IntegrityError:
+            # Outra requisição registrou a mesma verificação ao mesmo tempo
+            db_session.rollback()
+            logger.info(f"Verificação de {chave['reference']} já registrada")
+
+
+def verificacao_registrada(reference: str,
+                           pdf_hash: str,
+                           catalogacao_db: Session,
+                           silb_db: Session) -> Tuple[Optional[Dict], Optional[Dict]]:
+    """
+    Retorna (resultado registrado, dados catalogados). O resultado só vem se a carta, o registro
+    do SILB, o modelo e o prompt são os mesmos da última verificação. Os dados catalogados
+    (None se não foi possível obtê-los) seguem para a análise, que assim não os busca de novo
+    nem consome outra vez o registro do prefetch
+    """
+    catalog_data = None
+    try:
+        catalog_data = HistoricalDocumentAnalyzer._dados_catalogo(reference)
+        with ETAPAS_VERIFICACAO.medir(etapa="historico"):
+            registro = VerificationLedger.consultar(
+                catalogacao_db, VerificationLedger.chave(reference, pdf_hash, catalog_data)
+            )
+    except Exception as e:
+        # Falhas aqui (SILB fora do ar, reference inexistente) são tratadas pelo pipeline normal
+        logger.warning(f"Não foi possível consultar o histórico de {reference}: {str(e)}")
+        catalogacao_db.rollback()
+        return None, catalog_data
+
+    if registro is None:
+        return None, catalog_data
+    logger.info(f"{reference} sem alterações desde {registro.data_verificacao}; reaproveitando o resultado")
+    resultado = json.loads(registro.resultado)
+    resultado["reaproveitado"] = True
+    resultado["data_verificacao"] = registro.data_verificacao
+    return resultado, catalog_data
+
 def analyze_data(reference: str, 
                 carta_texto: str, 
                 catalogacao_db: Session, 
-                silb_db: Session) -> Dict:
+                silb_db: Session,
+                pdf_hash: Optional[str] = None,
+                catalog_data: Optional[Dict] = None) -> Dict:
     """Função principal para integração com o FastAPI"""
     try:
-       
         analyzer = HistoricalDocumentAnalyzer()
-        return analyzer.analyze_document(reference, carta_texto, catalogacao_db)
+        with ETAPAS_VERIFICACAO.medir(etapa="total"):
+            return analyzer.analyze_document(reference, carta_texto, catalogacao_db, silb_db, pdf_hash, catalog_data)
+
+    except LLMErro as e:
+        # Timeout, limite de taxa e indisponibilidade não são erros da carta:
+        # sobem para quem chamou decidir se tenta de novo
+        if e.transitorio:
+            ERROS.incrementar(componente="analise", tipo=type(e).__name__)
+            raise
+        return _registrar_falha(reference, catalogacao_db, e)
+
+    except Exception as e:
+        return _registrar_falha(reference, catalogacao_db, e)
+
+
+def _registrar_falha(reference: str, catalogacao_db: Session, e: Exception) -> Dict:
+    """Registra a falha como erro de sistema da carta e devolve o resultado de erro"""
+    ERROS.incrementar(componente="analise", tipo=type(e).__name__)
+    logger.error(f"Falha na análise de {reference}: {str(e)}")
+    
+    # Registra erro genérico no banco
+    catalogacao_db.add(CatalogacaoErro(
+        reference=reference,
+        campo="sistema",
+        conteudo_errado="N/A",
+        motivo=f"Erro na análise: {str(e)}",
+        resposta_correta="Revisar processamento",
+        julgado=False
+    ))
+    catalogacao_db.commit()
     
+    return {
+        "status": "error",
+        "reference": reference,
+        "message": str(e),
+        "erros_identificados": []
+    }
+
+def analyze_data_stream(reference: str,
+                        carta_texto: str,
+                        catalogacao_db: Session,
+                        silb_db: Session,
+                        pdf_hash: Optional[str] = None,
+                        catalog_data: Optional[Dict] = None) -> Iterator[Dict]:
+    """Igual a analyze_data, mas emite os erros à medida que o modelo os produz"""
+    try:
+        yield from HistoricalDocumentAnalyzer.analyze_document_stream(
+            reference, carta_texto, catalogacao_db, silb_db, pdf_hash, catalog_data
+        )
     except Exception as e:
-        logger.error(f"Falha na análise de {reference}: {str(e)}")
-        
-        # Registra erro genérico no banco
-        catalogacao_db.add(CatalogacaoErro(
-            reference=reference,
-            campo="sistema",
-            conteudo_errado="N/A",
-            motivo=f"Erro na análise: {str(e)}",
-            resposta_correta="Revisar processamento",
-            julgado=False
-        ))
-        catalogacao_db.commit()
-        
-        return {
-            "status": "error",
-            "reference": reference,
-            "message": str(e),
-            "erros_identificados": []
-        }
\ No newline at end of file
+        # Depois do primeiro evento não há mais como responder com status HTTP de erro
+        if isinstance(e, LLMErro) and e.transitorio:
+            ERROS.incrementar(componente="analise", tipo=type(e).__name__)
+            logger.error(f"Falha temporária do LLM para {reference}: {str(e)}")
+            yield {"evento": "fim", "dados": {
+                "status": "error", "reference": reference, "message": str(e),
+                "erros_identificados": [], "transitorio": True
+            }}
+            return
+        yield {"evento": "fim", "dados": _registrar_falha(reference, catalogacao_db, e)}
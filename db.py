@@ -1,22 +1,180 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import QueuePool
+from typing import Dict
+from metricas import BANCO_ESPERA_CONEXAO, BANCO_TIMEOUTS_CONEXAO
 from dotenv import load_dotenv
+import threading
+import logging
+import time
 import os
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+class MetricasPool:
+    """Esperas por conexão, timeouts e conexões abertas de um pool; esperas e timeouts vão também para /metrics"""
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.espera_total = 0.0
+        self.espera_max = 0.0
+        self.timeouts = 0
+        self.conexoes_criadas = 0
+        self.invalidacoes = 0
+
+    def registrar_espera(self, segundos: float, timeout: bool = False):
+        if timeout:
+            BANCO_TIMEOUTS_CONEXAO.incrementar(banco=self.nome)
+        else:
+            BANCO_ESPERA_CONEXAO.observar(segundos, banco=self.nome)
+        with self._lock:
+            if timeout:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.espera_total += segundos
+            self.espera_max = max(self.espera_max, segundos)
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "espera_media_ms": round(self.espera_total / self.checkouts * 1000, 2) if self.checkouts else None,
+                "espera_max_ms": round(self.espera_max * 1000, 2),
+                "timeouts": self.timeouts,
+                "conexoes_criadas": self.conexoes_criadas,
+                "invalidacoes": self.invalidacoes,
+            }
+
+
+class PoolMedido(QueuePool):
+    """QueuePool que mede quanto cada checkout esperou por uma conexão livre"""
+    metricas: MetricasPool
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            conexao = super()._do_get()
+        except PoolTimeoutError:
+            self.metricas.registrar_espera(0, timeout=True)
+            raise
+        self.metricas.registrar_espera(time.perf_counter() - inicio)
+        return conexao
+
+
+_metricas: Dict[str, MetricasPool] = {}
+_engines: Dict[str, Engine] = {}
+
+
+def _configurar_timeout(engine: Engine, timeout_ms: int):
+    """Limite de tempo por instrução, aplicado a cada conexão nova"""
+    if not timeout_ms:
+        return
+
+    @event.listens_for(engine, "connect")
+    def definir_timeout(conexao_dbapi, registro):
+        cursor = conexao_dbapi.cursor()
+        try:
+            if engine.dialect.name == "postgresql":
+                cursor.execute(f"SET statement_timeout = {int(timeout_ms)}")
+            elif engine.dialect.name in ("mysql", "mariadb"):
+                try:
+                    cursor.execute(f"SET SESSION max_statement_time = {timeout_ms / 1000:.3f}")  # MariaDB
+                except Exception:
+                    cursor.execute(f"SET SESSION max_execution_time = {int(timeout_ms)}")  # MySQL
+            else:
+                return
+            # O commit evita que o SET deixe uma transação aberta na conexão
+            conexao_dbapi.commit()
+        finally:
+            cursor.close()
+
+
+def criar_engine(nome: str, url: str, pool_size: int, max_overflow: int, pool_recycle: int,
+                 statement_timeout_ms: int, connect_args: Dict = None) -> Engine:
+    """
+    Engine com pool configurável por variáveis <NOME>_DB_POOL_SIZE, _MAX_OVERFLOW, _POOL_TIMEOUT,
+    _POOL_RECYCLE, _PRE_PING e _STATEMENT_TIMEOUT_MS; os argumentos são os valores padrão
+    """
+    prefixo = f"{nome.upper()}_DB_"
+    metricas = MetricasPool(nome)
+    opcoes = {
+        "poolclass": type(f"PoolMedido{nome.capitalize()}", (PoolMedido,), {"metricas": metricas}),
+        "pool_size": int(os.getenv(f"{prefixo}POOL_SIZE", pool_size)),
+        "max_overflow": int(os.getenv(f"{prefixo}MAX_OVERFLOW", max_overflow)),
+        "pool_timeout": float(os.getenv(f"{prefixo}POOL_TIMEOUT", "10")),
+        "pool_recycle": int(os.getenv(f"{prefixo}POOL_RECYCLE", pool_recycle)),
+        # Descarta conexões derrubadas pelo servidor antes de entregá-las a uma requisição
+        "pool_pre_ping": os.getenv(f"{prefixo}PRE_PING", "1") == "1",
+    }
+    engine = create_engine(url, connect_args=connect_args or {}, **opcoes)
+    _configurar_timeout(engine, int(os.getenv(f"{prefixo}STATEMENT_TIMEOUT_MS", statement_timeout_ms)))
+
+    @event.listens_for(engine, "connect")
+    def contar_conexao(conexao_dbapi, registro):
+        with metricas._lock:
+            metricas.conexoes_criadas += 1
+
+    @event.listens_for(engine, "invalidate")
+    def contar_invalidacao(conexao_dbapi, registro, excecao):
+        with metricas._lock:
+            metricas.invalidacoes += 1
+
+    _metricas[nome] = metricas
+    _engines[nome] = engine
+    logger.info(
+        f"Banco {nome}: pool_size={opcoes['pool_size']}, max_overflow={opcoes['max_overflow']}, "
+        f"pre_ping={opcoes['pool_pre_ping']}"
+    )
+    return engine
+
+
+def estatisticas_pools() -> Dict:
+    """Ocupação atual e esperas acumuladas dos pools de cada banco"""
+    resultado = {}
+    for nome, engine in _engines.items():
+        pool = engine.pool
+        resultado[nome] = {
+            "tamanho": pool.size(),
+            "em_uso": pool.checkedout(),
+            "livres": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "max_overflow": pool._max_overflow,
+            **_metricas[nome].to_dict(),
+        }
+    return resultado
+
+
 # Configuração SILB (MariaDB) - Apenas para consulta de arquivos
 SILB_DATABASE_URL = os.getenv("SILB_DATABASE_URL")
-silb_engine = create_engine(
+silb_engine = criar_engine(
+    "silb",
     SILB_DATABASE_URL,
+    pool_size=5,
+    max_overflow=10,
     pool_recycle=3600,
+    statement_timeout_ms=30000,
     connect_args={"connect_timeout": 5}  # Timeout reduzido para consultas rápidas
 )
 
 # Configuração Catalogação (PostgreSQL) - Para operações principais
+# O padrão comporta as threads de I/O, os workers da fila, o escritor em lote e o juiz ao mesmo tempo
 CATALOGACAO_DATABASE_URL = os.getenv("CATALOGACAO_DATABASE_URL")
-catalogacao_engine = create_engine(CATALOGACAO_DATABASE_URL)
+catalogacao_engine = criar_engine(
+    "catalogacao",
+    CATALOGACAO_DATABASE_URL,
+    pool_size=10,
+    max_overflow=20,
+    pool_recycle=1800,
+    statement_timeout_ms=60000,
+)
 
 # Sessões
 SilbSessionLocal = sessionmaker(
@@ -32,8 +190,6 @@ CatalogacaoSessionLocal = sessionmaker(
     bind=catalogacao_engine
 )
 
-Base = declarative_base()
-
 # Dependências FastAPI
 def get_silb_db():
     """Fornece conexão rápida e descartável apenas para consulta de arquivos"""
@@ -49,4 +205,4 @@ def get_catalogacao_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
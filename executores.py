@@ -0,0 +1,211 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Callable, Dict, Iterator
+import logging
+from dotenv import load_dotenv
+
+# Carrega as variáveis do arquivo .env
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Extração de PDF (CPU) roda em processos separados; SILB, LLM e banco (I/O) em threads
+PDF_PROCESS_WORKERS = int(os.getenv("PDF_PROCESS_WORKERS", min(4, os.cpu_count() or 1)))
+IO_THREAD_WORKERS = int(os.getenv("IO_THREAD_WORKERS", "16"))
+# Chamadas ao LLM disparadas de dentro de uma tarefa de I/O (ex.: partes de uma carta longa).
+# Pool separado para que uma tarefa do pool de I/O nunca espere por outra na mesma fila
+LLM_THREAD_WORKERS = int(os.getenv("LLM_THREAD_WORKERS", "8"))
+
+# Limite de tarefas aceitas por pool (em execução + aguardando um worker livre)
+PDF_MAX_CONCORRENTE = int(os.getenv("PDF_MAX_CONCORRENTE", PDF_PROCESS_WORKERS * 2))
+IO_MAX_CONCORRENTE = int(os.getenv("IO_MAX_CONCORRENTE", IO_THREAD_WORKERS * 2))
+
+
+class PoolLimitado:
+    """
+    Executor com limite próprio de concorrência e contadores para o endpoint de estatísticas.
+    O limite vale tanto para o event loop (executar) quanto para threads de outros pools (submeter)
+    """
+
+    def __init__(self, nome: str, criar_executor: Callable, workers: int, max_concorrente: int):
+        self.nome = nome
+        self.workers = workers
+        self.max_concorrente = max_concorrente
+        self._criar_executor = criar_executor
+        self._executor = None
+        self._lock = threading.Lock()
+        self._semaforo = asyncio.Semaphore(max_concorrente)
+        # Vagas compartilhadas por executar e submeter
+        self._vagas = threading.BoundedSemaphore(max_concorrente)
+        self.em_execucao = 0
+        self.em_espera = 0
+        self.concluidas = 0
+        self.falhas = 0
+
+    @property
+    def executor(self):
+        # Criado sob demanda para não abrir processos/threads na importação
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._criar_executor(self.workers)
+            return self._executor
+
+    async def executar(self, func: Callable, *args, **kwargs):
+        """Executa a função no pool sem bloquear o event loop"""
+        loop = asyncio.get_running_loop()
+        self.em_espera += 1
+        try:
+            await self._semaforo.acquire()
+            if not self._vagas.acquire(blocking=False):
+                # Vagas ocupadas por submeter: espera fora do event loop
+                espera = loop.run_in_executor(None, self._vagas.acquire)
+                try:
+                    await asyncio.shield(espera)
+                except BaseException:
+                    # Cancelada: a vaga obtida depois é devolvida
+                    espera.add_done_callback(lambda _: self._vagas.release())
+                    self._semaforo.release()
+                    raise
+        finally:
+            self.em_espera -= 1
+
+        self.em_execucao += 1
+        try:
+            resultado = await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+            self.concluidas += 1
+            return resultado
+        except Exception:
+            self.falhas += 1
+            raise
+        finally:
+            self.em_execucao -= 1
+            self._vagas.release()
+            self._semaforo.release()
+
+    def submeter(self, func: Callable, *args, **kwargs) -> Future:
+        """
+        Versão síncrona de executar, para quem já está numa thread de outro pool.
+        Bloqueia a thread chamadora enquanto o pool estiver no limite
+        """
+        with self._lock:
+            self.em_espera += 1
+        try:
+            self._vagas.acquire()
+        finally:
+            with self._lock:
+                self.em_espera -= 1
+
+        with self._lock:
+            self.em_execucao += 1
+        try:
+            futuro = self.executor.submit(func, *args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self.em_execucao -= 1
+            self._vagas.release()
+            raise
+        futuro.add_done_callback(self._concluir)
+        return futuro
+
+    def _concluir(self, futuro: Future):
+        self._vagas.release()
+        with self._lock:
+            self.em_execucao -= 1
+            if futuro.cancelled():
+                return
+            if futuro.exception() is None:
+                self.concluidas += 1
+            else:
+                self.falhas += 1
+
+    def estatisticas(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "max_concorrente": self.max_concorrente,
+            "em_execucao": self.em_execucao,
+            "em_espera": self.em_espera,
+            "concluidas": self.concluidas,
+            "falhas": self.falhas,
+        }
+
+    def encerrar(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+pool_pdf = PoolLimitado(
+    "pdf",
+    lambda workers: ProcessPoolExecutor(max_workers=workers),
+    PDF_PROCESS_WORKERS,
+    PDF_MAX_CONCORRENTE,
+)
+
+pool_io = PoolLimitado(
+    "io",
+    lambda workers: ThreadPoolExecutor(max_workers=workers, thread_name_prefix="io"),
+    IO_THREAD_WORKERS,
+    IO_MAX_CONCORRENTE,
+)
+
+pool_llm = PoolLimitado(
+    "llm",
+    lambda workers: ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm"),
+    LLM_THREAD_WORKERS,
+    LLM_THREAD_WORKERS,
+)
+
+
+async def executar_cpu(func: Callable, *args, **kwargs):
+    """Tarefas CPU-bound (extração de texto do PDF). A função precisa ser serializável"""
+    return await pool_pdf.executar(func, *args, **kwargs)
+
+
+async def executar_io(func: Callable, *args, **kwargs):
+    """Tarefas bloqueantes de I/O (API do SILB, LLM, commits no banco)"""
+    return await pool_io.executar(func, *args, **kwargs)
+
+
+_FIM = object()
+
+
+async def iterar_io(gerador: Iterator) -> AsyncIterator:
+    """
+    Consome um gerador síncrono bloqueante no pool de I/O, um item por tarefa, em vez de
+    deixá-lo no pool de threads padrão do Starlette. Não usa o pool do LLM: o gerador
+    pode submeter chamadas a ele e esperar por elas
+    """
+    # Um item em andamento termina antes do fechamento, mesmo se a espera por ele for cancelada
+    lock = threading.Lock()
+
+    def proximo():
+        with lock:
+            return next(gerador, _FIM)
+
+    def fechar():
+        with lock:
+            gerador.close()
+
+    try:
+        while True:
+            item = await pool_io.executar(proximo)
+            if item is _FIM:
+                return
+            yield item
+    finally:
+        # Cliente desconectado: fecha o gerador (e libera as sessões dele) numa thread do pool
+        await pool_io.executar(fechar)
+
+
+def estatisticas() -> Dict:
+    return {pool.nome: pool.estatisticas() for pool in (pool_pdf, pool_io, pool_llm)}
+
+
+def encerrar():
+    logger.info("Encerrando pools de execução")
+    for pool in (pool_pdf, pool_io, pool_llm):
+        pool.encerrar()
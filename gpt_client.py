@@ -1,31 +1,187 @@
-import openai
 import os
+import time
+import random
+from typing import Iterator, Optional
+from llm_cache import LLMCache, fingerprint, obter_cache_padrao
+from llm_backends import LLMBackend, LLMErro, LLMLimiteTaxaErro, OpenAIBackend, RespostaLLM, criar_backend
+from limitador import LimitadorTaxa, obter_limitador
+from metricas import ERROS, LLM_CHAMADAS, LLM_TOKENS
+import logging
+from dotenv import load_dotenv
+
+# Carrega as variáveis do arquivo .env
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "120"))
+LLM_MAX_TENTATIVAS = int(os.getenv("LLM_MAX_TENTATIVAS", "3"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "1"))
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "60"))
+
+
+def calcular_espera(tentativa: int, erro: LLMErro) -> float:
+    """Backoff exponencial com jitter completo; o Retry-After do provedor é o piso"""
+    espera = random.uniform(0, min(LLM_BACKOFF_MAX_S, LLM_BACKOFF_BASE_S * 2 ** (tentativa - 1)))
+    if isinstance(erro, LLMLimiteTaxaErro) and erro.retry_after is not None:
+        espera = max(espera, erro.retry_after)
+    return espera
+
 
 class GPTClient:
-    def __init__(self, api_key: str, model: str = "gpt-4o-mini", temperature: float = 0.2, max_tokens: int = 1000):
-        self.client = openai.OpenAI(api_key=api_key)
+    def __init__(self, api_key: str, model: str = "gpt-4o-mini", temperature: float = 0.2, max_tokens: int = 1000,
+                 cache: Optional[LLMCache] = None, client=None, backend: Optional[LLMBackend] = None,
+                 timeout: float = LLM_TIMEOUT_S, max_tentativas: int = LLM_MAX_TENTATIVAS,
+                 limitador: Optional[LimitadorTaxa] = None, estagio: str = "llm"):
+        # client permite injetar um stub com a mesma interface de openai.OpenAI
+        self.backend = backend if backend is not None else OpenAIBackend(api_key=api_key, client=client)
         self.model = model
         self.temperature = temperature
         self.max_tokens = max_tokens
+        self.cache = cache
+        self.timeout = timeout
+        self.max_tentativas = max_tentativas
+        self.estagio = estagio  # Rótulo das métricas de chamadas e tokens
+        # Clientes do mesmo backend/modelo dividem o mesmo orçamento de requisições e tokens
+        self.limitador = limitador if limitador is not None else obter_limitador(f"{self.backend.nome}:{model}")
 
-    def generate_content(self, assistant_prompt: str, user_prompt: str) -> dict:
-        messages = [
+    @staticmethod
+    def _mensagens(assistant_prompt: str, user_prompt: str) -> list:
+        return [
             {"role": "assistant", "content": assistant_prompt},
             {"role": "user", "content": user_prompt}
         ]
+
+    def _estimar_tokens(self, messages: list) -> int:
+        # ~4 caracteres por token no prompt, mais o máximo que a resposta pode ocupar
+        return sum(len(mensagem["content"]) for mensagem in messages) // 4 + self.max_tokens
+
+    def _aguardar_nova_tentativa(self, tentativa: int, erro: LLMErro):
+        """Levanta o erro se não valer repetir; senão espera o backoff da tentativa"""
+        ERROS.incrementar(componente=f"llm_{self.estagio}", tipo=type(erro).__name__)
+        if not erro.transitorio or tentativa == self.max_tentativas:
+            raise erro
+        espera = calcular_espera(tentativa, erro)
+        if isinstance(erro, LLMLimiteTaxaErro):
+            # As demais threads que usam o mesmo limitador também esperam
+            self.limitador.pausar(espera)
+        logger.warning(
+            f"Falha no backend {self.backend.nome} (tentativa {tentativa}): "
+            f"{type(erro).__name__}: {str(erro)}. Nova tentativa em {espera:.1f}s"
+        )
+        time.sleep(espera)
+
+    def _completar(self, messages: list) -> RespostaLLM:
+        estimados = self._estimar_tokens(messages)
+        with LLM_CHAMADAS.medir(estagio=self.estagio, model=self.model):
+            for tentativa in range(1, self.max_tentativas + 1):
+                self.limitador.adquirir(estimados)
+                try:
+                    resposta = self.backend.completar(
+                        messages, self.model, self.temperature, self.max_tokens, self.timeout
+                    )
+                except LLMErro as e:
+                    self._aguardar_nova_tentativa(tentativa, e)
+                    continue
+                self.limitador.ajustar(estimados, resposta.tokens_used)
+                if resposta.tokens_used:
+                    LLM_TOKENS.incrementar(resposta.tokens_used, estagio=self.estagio, model=self.model)
+                return resposta
+
+    def _chave_cache(self, messages: list) -> Optional[str]:
+        if self.cache is None:
+            return None
+        # O nome do backend entra na chave para não misturar respostas de backends diferentes
+        return fingerprint(f"{self.backend.nome}:{self.model}", self.temperature, self.max_tokens, messages)
+
+    def invalidar(self, assistant_prompt: str, user_prompt: str):
+        """
+        Tira do cache a resposta deste prompt. Quem chama faz isso quando a resposta não pôde
+        ser interpretada ou veio truncada, para que uma nova execução consulte o modelo de novo
+        """
+        chave = self._chave_cache(self._mensagens(assistant_prompt, user_prompt))
+        if chave is not None:
+            self.cache.remover(chave)
+
+    def generate_content(self, assistant_prompt: str, user_prompt: str) -> dict:
+        """
+        Retorna {"response", "tokens_used"}. Falhas transitórias são repetidas com backoff;
+        esgotadas as tentativas, levanta a subclasse de LLMErro correspondente.
+        """
+        messages = self._mensagens(assistant_prompt, user_prompt)
+
+        chave = self._chave_cache(messages)
+        if chave is not None:
+            em_cache = self.cache.obter(chave)
+            if em_cache is not None:
+                # Resposta reaproveitada não consome tokens
+                return {"response": em_cache["response"], "tokens_used": 0, "cache": True}
+
         #print(user_prompt)
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens
-            )
-
-            return {
-                "response": response.choices[0].message.content,
-                "tokens_used": response.usage.total_tokens
-            }
-
-        except openai.OpenAIError as e:
-            return {"error": str(e)}
+        resposta = self._completar(messages)
+
+        if chave is not None:
+            self.cache.salvar(chave, self.model, resposta.texto, resposta.tokens_used)
+
+        return {
+            "response": resposta.texto,
+            "tokens_used": resposta.tokens_used
+        }
+
+    def generate_content_stream(self, assistant_prompt: str, user_prompt: str) -> Iterator[str]:
+        """
+        Produz a resposta em pedaços, com o mesmo timeout e limitador das chamadas completas.
+        Só repete a chamada enquanto nenhum pedaço foi entregue.
+        """
+        messages = self._mensagens(assistant_prompt, user_prompt)
+
+        chave = self._chave_cache(messages)
+        if chave is not None:
+            em_cache = self.cache.obter(chave)
+            if em_cache is not None:
+                yield em_cache["response"]
+                return
+
+        estimados = self._estimar_tokens(messages)
+        for tentativa in range(1, self.max_tentativas + 1):
+            self.limitador.adquirir(estimados)
+            partes = []
+            try:
+                stream = self.backend.completar_stream(
+                    messages, self.model, self.temperature, self.max_tokens, self.timeout
+                )
+                # O backend retorna os tokens usados ao fim do stream (StopIteration.value)
+                while True:
+                    try:
+                        parte = next(stream)
+                    except StopIteration as fim:
+                        tokens_used = fim.value or 0
+                        break
+                    partes.append(parte)
+                    yield parte
+                break
+            except LLMErro as e:
+                if partes:
+                    raise
+                self._aguardar_nova_tentativa(tentativa, e)
+
+        if tokens_used:
+            # Sem o uso informado, a estimativa fica cobrada
+            self.limitador.ajustar(estimados, tokens_used)
+            LLM_TOKENS.incrementar(tokens_used, estagio=self.estagio, model=self.model)
+        # Só respostas completas vão para o cache
+        if chave is not None:
+            self.cache.salvar(chave, self.model, "".join(partes), tokens_used or None)
+
+
+def criar_cliente(estagio: str, api_key: Optional[str] = None, **kwargs) -> GPTClient:
+    """
+    Cliente configurado para um estágio do pipeline ("analisador" ou "juiz").
+    LLM_BACKEND_<ESTAGIO> escolhe openai, ollama ou replay; LLM_MODELO_<ESTAGIO> o modelo.
+    """
+    sufixo = estagio.upper()
+    backend = criar_backend(os.getenv(f"LLM_BACKEND_{sufixo}", "openai"), api_key=api_key)
+    model = os.getenv(f"LLM_MODELO_{sufixo}", "gpt-4o-mini")
+    logger.info(f"Estágio {estagio}: backend {backend.nome}, modelo {model}")
+    return GPTClient(api_key=api_key, model=model, backend=backend, cache=obter_cache_padrao(),
+                     estagio=estagio, **kwargs)
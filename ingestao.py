@@ -0,0 +1,248 @@
+"""
+Ingestão em massa das cartas do SILB.
+
+Percorre o join Request/FileRequests/File com cursor no servidor e envia os PDFs
+para a API com concorrência configurável. As references concluídas são gravadas
+num arquivo de checkpoint, então uma execução interrompida continua de onde parou.
+
+Uso:
+    python ingestao.py --concorrencia 8 --checkpoint ingestao.checkpoint
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from itertools import groupby, islice
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from db import SilbSessionLocal
+from models import Request, File, FileRequests
+from dotenv import load_dotenv
+
+# Carrega as variáveis do arquivo .env
+load_dotenv()
+
+API_BASE_URL = os.getenv("API_BASE_URL", "http://127.0.0.1:8000")
+UPLOADS_DIR = os.getenv("SILB_UPLOADS_DIR", "./uploads")  # Onde o SILB original armazena os PDFs
+
+
+def contar_references(silb_db: Session) -> int:
+    consulta = select(func.count(func.distinct(Request.reference))).select_from(Request).join(
+        FileRequests, FileRequests.request_id == Request.id
+    ).join(File, File.id == FileRequests.file_id)
+    return silb_db.execute(consulta).scalar() or 0
+
+
+def iterar_references(silb_db: Session, lote: int = 500) -> Iterator[Tuple[str, List[str]]]:
+    """Percorre o join com cursor no servidor, agrupando os arquivos de cada reference"""
+    consulta = select(Request.reference, File.file).join(
+        FileRequests, FileRequests.request_id == Request.id
+    ).join(
+        File, File.id == FileRequests.file_id
+    ).order_by(Request.reference).execution_options(stream_results=True, yield_per=lote)
+
+    linhas = silb_db.execute(consulta)
+    for reference, grupo in groupby(linhas, key=lambda linha: linha[0]):
+        yield reference, [linha[1] for linha in grupo if linha[1]]
+
+
+class Checkpoint:
+    """Arquivo append-only com uma reference concluída por linha"""
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self.concluidas: Set[str] = set()
+        if os.path.exists(caminho):
+            with open(caminho, encoding="utf-8") as f:
+                self.concluidas = {linha.strip() for linha in f if linha.strip()}
+
+    def marcar(self, reference: str):
+        with self._lock:
+            self.concluidas.add(reference)
+            with open(self.caminho, "a", encoding="utf-8") as f:
+                f.write(reference + "\n")
+
+
+class Progresso:
+    def __init__(self, total: int, intervalo: float = 5.0):
+        self.total = total
+        self.intervalo = intervalo
+        self.concluidas = 0
+        self.falhas = 0
+        self.inicio = time.monotonic()
+        self._ultimo = 0.0
+        self._lock = threading.Lock()
+
+    def registrar(self, sucesso: bool):
+        with self._lock:
+            if sucesso:
+                self.concluidas += 1
+            else:
+                self.falhas += 1
+            agora = time.monotonic()
+            if agora - self._ultimo >= self.intervalo:
+                self._ultimo = agora
+                self.imprimir()
+
+    def imprimir(self):
+        decorrido = time.monotonic() - self.inicio
+        processadas = self.concluidas + self.falhas
+        vazao = processadas / decorrido if decorrido > 0 else 0.0
+        restantes = max(self.total - processadas, 0)
+        eta = restantes / vazao if vazao > 0 else float("inf")
+        eta_texto = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta != float("inf") else "--:--:--"
+        print(
+            f"[{processadas}/{self.total}] {self.concluidas} ok, {self.falhas} falhas | "
+            f"{vazao:.2f} refs/s | ETA {eta_texto}",
+            flush=True
+        )
+
+
+def criar_sessao_http(concorrencia: int) -> requests.Session:
+    """Sessão HTTP com pool de conexões do tamanho da concorrência"""
+    sessao = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=concorrencia)
+    sessao.mount("http://", adaptador)
+    sessao.mount("https://", adaptador)
+    return sessao
+
+
+def enviar_reference(sessao: requests.Session,
+                     url: str,
+                     reference: str,
+                     arquivos: List[str],
+                     timeout: float) -> bool:
+    """Envia todos os PDFs de uma reference; só retorna True se todos forem aceitos"""
+    sucesso = True
+    for filename in arquivos:
+        filepath = os.path.join(UPLOADS_DIR, filename)
+        if not os.path.exists(filepath):
+            print(f"Arquivo não encontrado no SILB: {filepath}")
+            sucesso = False
+            continue
+
+        try:
+            with open(filepath, "rb") as file:
+                files = {"file": (filename, file, "application/pdf")}
+                response = sessao.post(url, files=files, params={"reference": reference}, timeout=timeout)
+            if response.status_code not in (200, 202):
+                print(f"Erro ao processar {filename}: {response.text}")
+                sucesso = False
+        except requests.RequestException as e:
+            print(f"Falha ao enviar {filename} ({reference}): {str(e)}")
+            sucesso = False
+    return sucesso
+
+
+def solicitar_prefetch(sessao: requests.Session, references: List[str]):
+    try:
+        sessao.post(f"{API_BASE_URL}/verificar/lote/", json={"references": references}, timeout=30)
+    except requests.RequestException as e:
+        print(f"Falha ao solicitar prefetch: {str(e)}")
+
+
+def ingerir(concorrencia: int = 4,
+            checkpoint_path: str = "ingestao.checkpoint",
+            usar_jobs: bool = False,
+            limite: Optional[int] = None,
+            timeout: float = 300.0,
+            prefetch: int = 200):
+    """Executa a ingestão em massa"""
+    url = f"{API_BASE_URL}/jobs/" if usar_jobs else f"{API_BASE_URL}/verificar/"
+    checkpoint = Checkpoint(checkpoint_path)
+    sessao = criar_sessao_http(concorrencia)
+    silb_db = SilbSessionLocal()
+
+    try:
+        total = contar_references(silb_db)
+        if limite:
+            total = min(total, limite)
+        pendentes = max(total - len(checkpoint.concluidas), 0)
+        print(f"{total} references no SILB, {len(checkpoint.concluidas)} já concluídas, {pendentes} pendentes")
+
+        progresso = Progresso(pendentes)
+        # Limita as tarefas enfileiradas para não materializar o join inteiro em memória
+        vagas = threading.BoundedSemaphore(concorrencia * 2)
+
+        def processar(reference: str, arquivos: List[str]):
+            try:
+                try:
+                    sucesso = enviar_reference(sessao, url, reference, arquivos, timeout)
+                except Exception as e:
+                    # Ex.: OSError ao abrir o PDF; a reference fica fora do checkpoint e é reenviada
+                    print(f"Erro inesperado em {reference}: {type(e).__name__}: {str(e)}")
+                    sucesso = False
+                if sucesso:
+                    checkpoint.marcar(reference)
+                progresso.registrar(sucesso)
+            finally:
+                vagas.release()
+
+        def pendentes_do_stream() -> Iterator[Tuple[str, List[str]]]:
+            lidas = 0
+            for reference, arquivos in iterar_references(silb_db):
+                if limite and lidas >= limite:
+                    break
+                lidas += 1
+                if reference not in checkpoint.concluidas:
+                    yield reference, arquivos
+
+        futuros: Dict[Future, str] = {}
+        with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+            stream = pendentes_do_stream()
+            tamanho_lote = prefetch or concorrencia
+            lote = list(islice(stream, tamanho_lote))
+            if prefetch and lote:
+                solicitar_prefetch(sessao, [reference for reference, _ in lote])
+
+            while lote:
+                # O catálogo do próximo lote é carregado enquanto as cartas deste sobem
+                seguinte = list(islice(stream, tamanho_lote))
+                if prefetch and seguinte:
+                    solicitar_prefetch(sessao, [reference for reference, _ in seguinte])
+
+                for reference, arquivos in lote:
+                    vagas.acquire()
+                    futuros[executor.submit(processar, reference, arquivos)] = reference
+                lote = seguinte
+
+        # Falhas fora do envio (ex.: ao gravar o checkpoint) não podem passar em silêncio
+        for futuro in as_completed(futuros):
+            if futuro.exception() is not None:
+                print(f"Falha ao processar {futuros[futuro]}: {futuro.exception()}")
+
+        progresso.imprimir()
+    finally:
+        silb_db.close()
+        sessao.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Ingestão em massa das cartas do SILB")
+    parser.add_argument("--concorrencia", type=int, default=4, help="Uploads simultâneos")
+    parser.add_argument("--checkpoint", default="ingestao.checkpoint", help="Arquivo de references concluídas")
+    parser.add_argument("--jobs", action="store_true", help="Enfileira em /jobs/ em vez de aguardar /verificar/")
+    parser.add_argument("--limite", type=int, default=None, help="Número máximo de references")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Timeout de cada upload (s)")
+    parser.add_argument("--prefetch", type=int, default=200,
+                        help="References enviadas por vez para /verificar/lote/ (0 desativa)")
+    args = parser.parse_args(argv)
+
+    ingerir(
+        concorrencia=args.concorrencia,
+        checkpoint_path=args.checkpoint,
+        usar_jobs=args.jobs,
+        limite=args.limite,
+        timeout=args.timeout,
+        prefetch=args.prefetch,
+    )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
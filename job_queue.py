@@ -0,0 +1,248 @@
+import os
+import json
+import shutil
+import time
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from data_comparator import analyze_data, verificacao_registrada, LIMITE_TEXTO_PROMPT
+from llm_backends import LLMErro
+from db import CatalogacaoSessionLocal, SilbSessionLocal
+from models import VerificacaoJob
+from pdf_extractor import extrair_texto
+from text_cache import text_cache, hash_conteudo
+import executores
+import logging
+from dotenv import load_dotenv
+
+# Carrega as variáveis do arquivo .env
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_TENTATIVAS = int(os.getenv("JOB_MAX_TENTATIVAS", "3"))
+JOB_INTERVALO_CONSULTA = float(os.getenv("JOB_INTERVALO_CONSULTA", "2"))
+# Um job em processamento há mais tempo que isso é considerado abandonado (worker ou réplica
+# que caiu) e volta para a fila; precisa ser maior que a duração de qualquer verificação
+JOB_TIMEOUT_S = float(os.getenv("JOB_TIMEOUT_S", "1800"))
+# Espera antes de um job devolvido por falha transitória do LLM voltar a ser reservado
+JOB_BACKOFF_BASE_S = float(os.getenv("JOB_BACKOFF_BASE_S", "30"))
+JOB_BACKOFF_MAX_S = float(os.getenv("JOB_BACKOFF_MAX_S", "600"))
+
+# PDF da carta lido pelo juiz; os jobs guardam o seu próprio arquivo, nomeado pelo hash do conteúdo
+CACHE_DIR = Path("cache")
+
+STATUS_PENDENTE = "pendente"
+STATUS_PROCESSANDO = "processando"
+STATUS_CONCLUIDO = "concluido"
+STATUS_ERRO = "erro"
+
+_parar = threading.Event()
+_workers: List[threading.Thread] = []
+_recuperacao_lock = threading.Lock()
+_ultima_recuperacao = 0.0
+
+
+def enfileirar(db: Session, reference: str, pdf_path: str, forcar: bool = False) -> VerificacaoJob:
+    """Registra um novo job de verificação na fila persistida"""
+    job = VerificacaoJob(reference=reference, pdf_path=pdf_path, status=STATUS_PENDENTE, forcar=forcar)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def serializar_job(job: VerificacaoJob) -> Dict:
+    return {
+        "job_id": job.id,
+        "reference": job.reference,
+        "status": job.status,
+        "tentativas": job.tentativas,
+        "forcar": job.forcar,
+        "resultado": json.loads(job.resultado) if job.resultado else None,
+        "erro": job.erro,
+        "data_criacao": job.data_criacao,
+        "data_inicio": job.data_inicio,
+        "disponivel_em": job.disponivel_em,
+        "data_conclusao": job.data_conclusao,
+    }
+
+
+def recuperar_jobs_interrompidos():
+    """
+    Jobs em processamento há mais de JOB_TIMEOUT_S (o worker que os reservou caiu) voltam
+    para a fila; os mais recentes podem estar rodando em outro worker ou réplica e ficam
+    como estão. Os que já esgotaram as tentativas são marcados como erro.
+    """
+    global _ultima_recuperacao
+    _ultima_recuperacao = time.monotonic()
+    limite = datetime.utcnow() - timedelta(seconds=JOB_TIMEOUT_S)
+    db = CatalogacaoSessionLocal()
+    try:
+        interrompidos = db.query(VerificacaoJob).filter(
+            VerificacaoJob.status == STATUS_PROCESSANDO,
+            or_(VerificacaoJob.data_inicio.is_(None), VerificacaoJob.data_inicio < limite),
+        ).with_for_update(skip_locked=True).all()
+        for job in interrompidos:
+            if (job.tentativas or 0) >= JOB_MAX_TENTATIVAS:
+                job.status = STATUS_ERRO
+                job.erro = "Número máximo de tentativas excedido"
+                job.data_conclusao = datetime.utcnow()
+            else:
+                job.status = STATUS_PENDENTE
+        db.commit()
+        if interrompidos:
+            logger.info(f"{len(interrompidos)} jobs interrompidos recuperados")
+    finally:
+        db.close()
+
+
+def _recuperar_periodicamente():
+    """Repete a recuperação com a fila ociosa: réplicas que caíram não passam pelo startup desta"""
+    with _recuperacao_lock:
+        if time.monotonic() - _ultima_recuperacao < JOB_TIMEOUT_S / 2:
+            return
+        recuperar_jobs_interrompidos()
+
+
+def _publicar_pdf(job: VerificacaoJob):
+    """Copia o PDF do job para cache/<reference>.pdf, de onde o juiz lê a carta"""
+    destino = CACHE_DIR / f"{job.reference}.pdf"
+    if Path(job.pdf_path) == destino:
+        return
+    temporario = destino.with_name(f"{destino.name}.{job.id}.tmp")
+    shutil.copyfile(job.pdf_path, temporario)
+    os.replace(temporario, destino)
+
+
+def _reservar_proximo(db: Session) -> Optional[VerificacaoJob]:
+    """Reserva o job pendente mais antigo já disponível (SKIP LOCKED evita disputa entre workers)"""
+    job = db.query(VerificacaoJob).filter(
+        VerificacaoJob.status == STATUS_PENDENTE,
+        or_(VerificacaoJob.disponivel_em.is_(None), VerificacaoJob.disponivel_em <= datetime.utcnow()),
+    ).order_by(VerificacaoJob.id).with_for_update(skip_locked=True).first()
+
+    if job is None:
+        db.rollback()
+        return None
+
+    job.status = STATUS_PROCESSANDO
+    job.tentativas = (job.tentativas or 0) + 1
+    job.data_inicio = datetime.utcnow()
+    db.commit()
+    return job
+
+
+def _espera_nova_tentativa(tentativas: int, erro: LLMErro) -> float:
+    """Backoff exponencial pelo número de tentativas do job; o Retry-After do provedor é o piso"""
+    espera = min(JOB_BACKOFF_MAX_S, JOB_BACKOFF_BASE_S * 2 ** (max(tentativas, 1) - 1))
+    return max(espera, getattr(erro, "retry_after", None) or 0)
+
+
+def _processar(job: VerificacaoJob, catalogacao_db: Session, silb_db: Session) -> Dict:
+    """Executa o pipeline PDF → SILB → LLM → banco para um job"""
+    with open(job.pdf_path, "rb") as f:
+        conteudo = f.read()
+    pdf_hash = hash_conteudo(conteudo)
+    _publicar_pdf(job)
+
+    # Nada mudou desde a última verificação: o job termina sem extração nem LLM
+    catalog_data = None
+    if not job.forcar:
+        registrado, catalog_data = verificacao_registrada(job.reference, pdf_hash, catalogacao_db, silb_db)
+        if registrado is not None:
+            return registrado
+
+    carta_texto = text_cache.obter(pdf_hash, LIMITE_TEXTO_PROMPT)
+    if carta_texto is None:
+        # Extração CPU-bound vai para o pool de processos, dentro do mesmo limite das requisições
+        carta_texto, completo = executores.pool_pdf.submeter(
+            extrair_texto, conteudo, LIMITE_TEXTO_PROMPT
+        ).result()
+        text_cache.salvar(pdf_hash, carta_texto, completo)
+
+    return analyze_data(
+        reference=job.reference,
+        carta_texto=carta_texto,
+        catalogacao_db=catalogacao_db,
+        silb_db=silb_db,
+        pdf_hash=pdf_hash,
+        catalog_data=catalog_data
+    )
+
+
+def _executar_worker():
+    while not _parar.is_set():
+        catalogacao_db = CatalogacaoSessionLocal()
+        silb_db = SilbSessionLocal()
+        try:
+            job = _reservar_proximo(catalogacao_db)
+            if job is None:
+                _recuperar_periodicamente()
+                _parar.wait(JOB_INTERVALO_CONSULTA)
+                continue
+
+            logger.info(f"Processando job {job.id} ({job.reference})")
+            try:
+                resultado = _processar(job, catalogacao_db, silb_db)
+                job.resultado = json.dumps(resultado, ensure_ascii=False, default=str)
+                job.status = STATUS_CONCLUIDO if resultado.get("status") == "success" else STATUS_ERRO
+                job.erro = resultado.get("message")
+            except LLMErro as e:
+                catalogacao_db.rollback()
+                job.erro = f"{type(e).__name__}: {str(e)}"
+                if e.transitorio and job.tentativas < JOB_MAX_TENTATIVAS:
+                    # Timeout/limite de taxa do LLM: o job volta para a fila depois do backoff
+                    espera = _espera_nova_tentativa(job.tentativas, e)
+                    logger.warning(f"Job {job.id} devolvido à fila por {espera:.0f}s: {job.erro}")
+                    job.status = STATUS_PENDENTE
+                    job.disponivel_em = datetime.utcnow() + timedelta(seconds=espera)
+                    catalogacao_db.commit()
+                    continue
+                job.status = STATUS_ERRO
+            except Exception as e:
+                logger.exception(f"Falha no job {job.id}")
+                catalogacao_db.rollback()
+                job.status = STATUS_ERRO
+                job.erro = str(e)
+
+            job.data_conclusao = datetime.utcnow()
+            catalogacao_db.commit()
+
+        except Exception as e:
+            logger.error(f"Erro no worker da fila: {str(e)}")
+            catalogacao_db.rollback()
+            _parar.wait(JOB_INTERVALO_CONSULTA)
+        finally:
+            silb_db.close()
+            catalogacao_db.close()
+
+
+def iniciar_workers(quantidade: int = JOB_WORKERS):
+    _parar.clear()
+    for i in range(quantidade):
+        worker = threading.Thread(target=_executar_worker, name=f"job-worker-{i}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+    logger.info(f"{quantidade} workers da fila de verificação iniciados")
+
+
+def parar_workers():
+    _parar.set()
+    for worker in _workers:
+        worker.join()
+    _workers.clear()
+
+
+def estatisticas(db: Session) -> Dict:
+    contagem = db.query(VerificacaoJob.status, func.count(VerificacaoJob.id)).group_by(
+        VerificacaoJob.status
+    ).all()
+    return {
+        "workers": len(_workers),
+        "jobs": {status: total for status, total in contagem},
+    }
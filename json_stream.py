@@ -0,0 +1,142 @@
+import re
+import json
+from typing import Dict, List, Optional
+
+from llm_backends import LLMRespostaInvalidaErro
+
+
+def extrair_objeto(texto: str) -> Dict:
+    """
+    Objeto JSON de uma resposta completa do modelo, do primeiro "{" ao último "}".
+    Tolera cercas de código (```json) e texto antes ou depois do objeto
+    """
+    inicio, fim = texto.find("{"), texto.rfind("}")
+    if inicio < 0 or fim < inicio:
+        raise LLMRespostaInvalidaErro("Resposta sem objeto JSON")
+    try:
+        objeto = json.loads(texto[inicio:fim + 1])
+    except json.JSONDecodeError as e:
+        raise LLMRespostaInvalidaErro(f"Resposta não é JSON válido: {str(e)}") from e
+    if not isinstance(objeto, dict):
+        raise LLMRespostaInvalidaErro("Resposta JSON não é um objeto")
+    return objeto
+
+
+class ParserErrosIncremental:
+    """
+    Lê a resposta do modelo no formato {"erros": [...], "analise_geral": "..."} em pedaços
+    e devolve cada objeto de "erros" assim que ele fecha. Cercas de código e texto fora
+    do objeto JSON são ignorados; um objeto incompleto no fim (resposta truncada) é descartado.
+    """
+
+    CHAVE_LISTA = "erros"
+    _PADRAO_ANALISE = re.compile(r'"analise_geral"\s*:\s*"((?:[^"\\]|\\.)*)"', re.DOTALL)
+
+    def __init__(self):
+        self._texto: List[str] = []
+        self._pilha: List[str] = []
+        self._em_string = False
+        self._escape = False
+        self._ultima_string = ""
+        self._string_atual: List[str] = []
+        self._profundidade_lista: Optional[int] = None  # Tamanho da pilha dentro de "erros"
+        self._objeto_atual: List[str] = []
+        self.erros: List[Dict] = []
+        self.fechado = False  # O objeto raiz chegou ao fim
+
+    def alimentar(self, pedaco: str) -> List[Dict]:
+        """Consome um pedaço da resposta e retorna os erros completados por ele"""
+        novos = []
+        self._texto.append(pedaco)
+        for caractere in pedaco:
+            if (self._profundidade_lista or 0) > 0 and len(self._pilha) > self._profundidade_lista:
+                self._objeto_atual.append(caractere)
+
+            if self._em_string:
+                if self._escape:
+                    self._escape = False
+                elif caractere == "\\":
+                    self._escape = True
+                elif caractere == '"':
+                    self._em_string = False
+                    self._ultima_string = "".join(self._string_atual)
+                    continue
+                if len(self._pilha) == 1:
+                    self._string_atual.append(caractere)
+                continue
+
+            if self.fechado or (not self._pilha and caractere != "{"):
+                continue  # Texto antes/depois do JSON (ex.: ```json)
+
+            if caractere == '"':
+                self._em_string = True
+                self._string_atual = []
+            elif caractere in "{[":
+                if (caractere == "[" and len(self._pilha) == 1 and self._profundidade_lista is None
+                        and self._ultima_string == self.CHAVE_LISTA):
+                    self._pilha.append(caractere)
+                    self._profundidade_lista = len(self._pilha)
+                    continue
+                self._pilha.append(caractere)
+                if caractere == "{" and self._profundidade_lista is not None \
+                        and len(self._pilha) == self._profundidade_lista + 1:
+                    self._objeto_atual = ["{"]
+            elif caractere in "}]":
+                if not self._pilha:
+                    continue
+                self._pilha.pop()
+                if self._profundidade_lista is not None:
+                    if caractere == "}" and len(self._pilha) == self._profundidade_lista:
+                        erro = self._decodificar("".join(self._objeto_atual))
+                        self._objeto_atual = []
+                        if erro is not None:
+                            self.erros.append(erro)
+                            novos.append(erro)
+                    elif caractere == "]" and len(self._pilha) == self._profundidade_lista - 1:
+                        self._profundidade_lista = -1  # A lista terminou; não reabre
+                if not self._pilha:
+                    self.fechado = True
+        return novos
+
+    @staticmethod
+    def _decodificar(trecho: str) -> Optional[Dict]:
+        try:
+            objeto = json.loads(trecho)
+        except json.JSONDecodeError:
+            return None
+        return objeto if isinstance(objeto, dict) else None
+
+    @property
+    def texto(self) -> str:
+        return "".join(self._texto)
+
+    def finalizar(self) -> Dict:
+        """
+        Resultado final no mesmo formato da resposta completa. Se a resposta foi truncada,
+        mantém os erros que chegaram inteiros e marca "truncada".
+        """
+        texto = self.texto
+        resultado = None
+        if self.fechado:
+            try:
+                resultado = extrair_objeto(texto)
+            except LLMRespostaInvalidaErro:
+                resultado = None
+
+        if not isinstance(resultado, dict):
+            if not self.erros and self._profundidade_lista is None:
+                raise LLMRespostaInvalidaErro("Resposta da análise em formato inválido")
+            resultado = {"truncada": not self.fechado}
+            encontrada = self._PADRAO_ANALISE.search(texto)
+            if encontrada:
+                resultado["analise_geral"] = json.loads(f'"{encontrada.group(1)}"')
+
+        resultado["erros"] = self.erros
+        return resultado
+
+
+def interpretar_resposta(texto: str) -> Dict:
+    """Interpreta uma resposta completa com o mesmo parser usado no streaming"""
+    parser = ParserErrosIncremental()
+    parser.alimentar(texto)
+    return parser.finalizar()
@@ -1,12 +1,24 @@
 import os
-import json
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
 from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Tuple
 
-import fitz
-from db import get_catalogacao_db
+from db import get_catalogacao_db, CatalogacaoSessionLocal
 from models import CatalogacaoErro, Julgamento
+from sqlalchemy import or_, and_
 from sqlalchemy.orm import Session
-from gpt_client import GPTClient
+from gpt_client import criar_cliente
+from llm_backends import LLMErro, LLMRespostaInvalidaErro
+from prompt_builder import ConstrutorPrompt, json_compacto
+from json_stream import extrair_objeto
+from text_cache import text_cache
+from persistencia import escritor_catalogacao, INSERIR, ATUALIZAR
+from metricas import ERROS, ETAPAS_JULGAMENTO
 import logging
 from dotenv import load_dotenv
 
@@ -22,56 +34,116 @@ logger = logging.getLogger(__name__)
 
 # Configuração da API OpenAI (pode ser diferente do agente varredor)
 API_KEY = os.getenv("LLM_JUIZ_API_KEY2")
-gpt_client = GPTClient(api_key=API_KEY)
+gpt_client = criar_cliente("juiz", api_key=API_KEY)
 
-def julgar_erros(db: Session):
-    """
-    Consulta erros não julgados, reavalia com LLM e registra julgamentos.
-    Acessa os PDFs originais no diretório de cache para análise.
-    """
-    print("api juiz key")
-    print(API_KEY)
-    try:
-        # 1. Busca erros não julgados
-        erros_nao_julgados = db.query(CatalogacaoErro).filter(
-            CatalogacaoErro.julgado == False
-        ).all()
+# A carta inteira não cabe em qualquer orçamento: o texto é cortado em PROMPT_MAX_TOKENS_JUIZ
+PROMPT_JUIZ = ConstrutorPrompt("juiz", gpt_client.model, gpt_client.max_tokens)
 
-        if not erros_nao_julgados:
-            logger.info("Nenhum erro pendente para julgamento")
-            return
+ASSISTENTE_JUIZ = "Você é um especialista em documentos históricos da América portuguesa."
 
-        logger.info(f"Iniciando julgamento de {len(erros_nao_julgados)} erros")
+# Chamadas simultâneas ao LLM e tamanho das páginas lidas do banco
+JUIZ_CONCORRENCIA = int(os.getenv("JUIZ_CONCORRENCIA", "4"))
+JUIZ_TAMANHO_PAGINA = int(os.getenv("JUIZ_TAMANHO_PAGINA", "200"))
 
-        # 2. Processa cada erro
-        for erro in erros_nao_julgados:
-            try:
-                # 2.1 Verifica se o PDF existe no cache
-                pdf_path = CACHE_DIR / f"{erro.reference}.pdf"
-                if not pdf_path.exists():
-                    logger.warning(f"PDF não encontrado para {erro.reference}")
-                    continue
-
-                # 2.2 Extrai texto do PDF
-                with open(pdf_path, "rb") as f:
-                    pdf_document = fitz.open(stream=f.read())
-                    texto_carta = ""
-                    for pagina in pdf_document:
-                        texto_carta += pagina.get_text("text") + "\n"
-
-                # 2.3 Prepara prompt para o Juiz (GPT)
-                prompt = f"""
+# Um prompt por carta com todos os seus erros candidatos, em vez de um prompt por erro
+JUIZ_AGRUPAR_POR_CARTA = os.getenv("JUIZ_AGRUPAR_POR_CARTA", "1") == "1"
+JUIZ_MAX_ERROS_POR_PROMPT = int(os.getenv("JUIZ_MAX_ERROS_POR_PROMPT", "20"))
+
+
+class ProgressoJulgamento:
+    """Estado da execução do juiz, consultado pelo endpoint de progresso"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.status = "ocioso"
+        self.total = 0
+        self.julgados = 0
+        self.ignorados = 0
+        self.falhas = 0
+        self.inicio: Optional[datetime] = None
+        self.fim: Optional[datetime] = None
+        self.erro: Optional[str] = None
+        # Tokens gastos e erros julgados por modo (prompt por carta ou por erro)
+        self.tokens = {"agrupado": 0, "individual": 0}
+        self.erros_por_modo = {"agrupado": 0, "individual": 0}
+
+    def iniciar(self, total: int):
+        with self._lock:
+            self.status = "executando"
+            self.total = total
+            self.julgados = self.ignorados = self.falhas = 0
+            self.tokens = {"agrupado": 0, "individual": 0}
+            self.erros_por_modo = {"agrupado": 0, "individual": 0}
+            self.inicio = datetime.utcnow()
+            self.fim = None
+            self.erro = None
+
+    def registrar(self, julgados: int = 0, ignorados: int = 0, falhas: int = 0):
+        with self._lock:
+            self.julgados += julgados
+            self.ignorados += ignorados
+            self.falhas += falhas
+
+    def registrar_tokens(self, modo: str, tokens: int, erros_julgados: int):
+        with self._lock:
+            self.tokens[modo] += tokens
+            self.erros_por_modo[modo] += erros_julgados
+
+    def tokens_por_erro(self) -> Dict[str, Optional[float]]:
+        return {
+            modo: round(self.tokens[modo] / self.erros_por_modo[modo], 1) if self.erros_por_modo[modo] else None
+            for modo in self.tokens
+        }
+
+    def finalizar(self, erro: Optional[str] = None):
+        with self._lock:
+            self.status = "falhou" if erro else "concluido"
+            self.erro = erro
+            self.fim = datetime.utcnow()
+
+    @property
+    def em_execucao(self) -> bool:
+        return self.status == "executando"
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            processados = self.julgados + self.ignorados + self.falhas
+            fim = self.fim or datetime.utcnow()
+            decorrido = (fim - self.inicio).total_seconds() if self.inicio else 0.0
+            return {
+                "status": self.status,
+                "total": self.total,
+                "julgados": self.julgados,
+                "ignorados": self.ignorados,
+                "falhas": self.falhas,
+                "processados": processados,
+                "erros_por_minuto": round(processados / decorrido * 60, 2) if decorrido else None,
+                "tokens": dict(self.tokens),
+                "tokens_por_erro": self.tokens_por_erro(),
+                "inicio": self.inicio,
+                "fim": self.fim,
+                "erro": self.erro,
+            }
+
+
+progresso = ProgressoJulgamento()
+_inicio_lock = threading.Lock()
+
+def montar_prompt(erro: Dict, texto_carta: str) -> str:
+    """Prompt de reavaliação de um erro de catalogação"""
+    with ETAPAS_JULGAMENTO.medir(etapa="montagem_prompt"):
+        return PROMPT_JUIZ.montar(lambda texto: f"""
                 Reavalie este possível erro de catalogação:
 
                 **Dados do Erro**:
-                - Reference: {erro.reference}
-                - Campo: {erro.campo}
-                - Valor Catalogado: {erro.conteudo_errado}
-                - Sugestão de Correção: {erro.resposta_correta}
-                - Motivo: {erro.motivo}
+                - Reference: {erro["reference"]}
+                - Campo: {erro["campo"]}
+                - Valor Catalogado: {erro["conteudo_errado"]}
+                - Sugestão de Correção: {erro["resposta_correta"]}
+                - Motivo: {erro["motivo"]}
 
                 **Conteúdo Original da Carta**:
-                {texto_carta}...  # Limita o tamanho para o prompt
+                {texto}
 
                 **Sua Tarefa**:
                 1. Verifique se a correção sugerida está correta
@@ -85,44 +157,316 @@ def julgar_erros(db: Session):
                     "grau_certeza": 0.95,
                     "correcao_necessaria": true/false
                 }}
-                """
-
-                # 2.4 Chama o GPT para julgamento
-                response = gpt_client.generate_content(
-                    assistant_prompt="Você é um especialista em documentos históricos da América portuguesa.",
-                    user_prompt=prompt
-                )
-                print("Resposta original do llm")
-                print(response)
-
-                resposta_gpt = response.get("response", "{}").strip("```json").strip("```").strip()
-                resultado = json.loads(resposta_gpt)
-                print("resultado do juiz")
-                print(resultado)
-
-                # 2.5 Registra o julgamento
-                julgamento = Julgamento(
-                    erro_id=erro.id,
-                    reference=erro.reference,
-                    resultado_analise=resultado["analise"],
-                    resposta_correta=resultado["valor_correto_final"],
-                    grau_certeza=resultado.get("grau_certeza", 0.9)
-                )
-                db.add(julgamento)
-
-                # 2.6 Marca o erro como julgado
-                erro.julgado = True
-                erro.resposta_correta = resultado["valor_correto_final"]
-                db.commit()
-
-                logger.info(f"Erro {erro.id} julgado com sucesso")
+                """, texto_carta)
+
+
+def chamar_juiz(prompt: str) -> Tuple[Dict, int]:
+    """
+    Chama o LLM e retorna a resposta em JSON e os tokens consumidos. Novas tentativas e a
+    pausa compartilhada no limite de taxa ficam a cargo do GPTClient (LLM_MAX_TENTATIVAS)
+    """
+    with ETAPAS_JULGAMENTO.medir(etapa="chamada_llm"):
+        response = gpt_client.generate_content(
+            assistant_prompt=ASSISTENTE_JUIZ,
+            user_prompt=prompt
+        )
+
+    try:
+        # Mesmo parser tolerante a cercas de código usado nas respostas do analisador
+        with ETAPAS_JULGAMENTO.medir(etapa="interpretacao_json"):
+            return extrair_objeto(response.get("response", "")), response.get("tokens_used", 0)
+    except LLMRespostaInvalidaErro as e:
+        # Sem isso, julgar de novo repetiria a mesma resposta guardada no cache
+        gpt_client.invalidar(ASSISTENTE_JUIZ, prompt)
+        raise LLMRespostaInvalidaErro(f"Resposta do juiz inválida: {str(e)}") from e
+
+
+def montar_prompt_agrupado(reference: str, erros: List[Dict], texto_carta: str) -> str:
+    """Prompt único com todos os erros candidatos de uma mesma carta"""
+    candidatos = json_compacto(
+        [
+            {
+                "erro_id": erro["id"],
+                "campo": erro["campo"],
+                "valor_catalogado": erro["conteudo_errado"],
+                "sugestao_correcao": erro["resposta_correta"],
+                "motivo": erro["motivo"],
+            }
+            for erro in erros
+        ]
+    )
+    with ETAPAS_JULGAMENTO.medir(etapa="montagem_prompt"):
+        return PROMPT_JUIZ.montar(lambda texto: f"""
+                Reavalie estes possíveis erros de catalogação da mesma carta:
+
+                **Erros Candidatos (Reference: {reference})**:
+                {candidatos}
+
+                **Conteúdo Original da Carta**:
+                {texto}
+
+                **Sua Tarefa** (para cada erro, identificado pelo erro_id):
+                1. Verifique se a correção sugerida está correta
+                2. Caso não esteja, indique o valor correto
+                3. Atribua um grau de certeza (0.0 a 1.0)
+
+                **Formato de Resposta**:
+                {{
+                    "julgamentos": [
+                        {{
+                            "erro_id": 123,
+                            "analise": "Explicação detalhada",
+                            "valor_correto_final": "valor corrigido ou confirmado",
+                            "grau_certeza": 0.95,
+                            "correcao_necessaria": true/false
+                        }}
+                    ]
+                }}
+                """, texto_carta)
+
+
+def _veredito_valido(veredito) -> bool:
+    return isinstance(veredito, dict) and "analise" in veredito and "valor_correto_final" in veredito
+
+
+class _TextosCartas:
+    """Texto das cartas recentes em memória, compartilhado entre as threads da execução"""
 
+    def __init__(self, max_itens: int = 256):
+        self._textos: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._max_itens = max_itens
+        self._lock = threading.Lock()
+
+    def obter(self, reference: str) -> Optional[str]:
+        with self._lock:
+            if reference in self._textos:
+                self._textos.move_to_end(reference)
+                return self._textos[reference]
+
+        pdf_path = CACHE_DIR / f"{reference}.pdf"
+        with ETAPAS_JULGAMENTO.medir(etapa="texto_carta"):
+            texto = text_cache.obter_ou_extrair(str(pdf_path)) if pdf_path.exists() else None
+        with self._lock:
+            self._textos[reference] = texto
+            if len(self._textos) > self._max_itens:
+                self._textos.popitem(last=False)
+        return texto
+
+
+def _julgar_individual(erro: Dict, texto_carta: str) -> Dict:
+    prompt = montar_prompt(erro, texto_carta)
+    resultado, tokens = chamar_juiz(prompt)
+    if not _veredito_valido(resultado):
+        gpt_client.invalidar(ASSISTENTE_JUIZ, prompt)
+        raise LLMRespostaInvalidaErro(f"Veredito incompleto para o erro {erro['id']}")
+    progresso.registrar_tokens("individual", tokens, 1)
+    return resultado
+
+
+def _julgar_grupo(erros: List[Dict], textos: _TextosCartas) -> List[Tuple[Dict, object]]:
+    """
+    Julga os erros de uma carta. Com mais de um erro, usa um único prompt e recorre a
+    chamadas individuais só para os vereditos ausentes ou malformados. Uma falha transitória
+    do LLM (limite de taxa, timeout) não multiplica as chamadas: o grupo todo fica como falha
+    e os erros continuam não julgados para a próxima execução.
+    Retorna (erro, resultado) onde resultado é o veredito, None (PDF ausente) ou a exceção.
+    """
+    reference = erros[0]["reference"]
+    texto_carta = textos.obter(reference)
+    if texto_carta is None:
+        logger.warning(f"PDF não encontrado para {reference}")
+        return [(erro, None) for erro in erros]
+
+    vereditos: Dict[int, Dict] = {}
+    if JUIZ_AGRUPAR_POR_CARTA and len(erros) > 1:
+        prompt = montar_prompt_agrupado(reference, erros, texto_carta)
+        try:
+            resposta, tokens = chamar_juiz(prompt)
+        except LLMRespostaInvalidaErro as e:
+            logger.warning(f"Resposta agrupada inválida para {reference}, julgando individualmente: {str(e)}")
+        except LLMErro as e:
+            return [(erro, e) for erro in erros]
+        else:
+            ids = {erro["id"] for erro in erros}
+            julgamentos = resposta.get("julgamentos") if isinstance(resposta, dict) else None
+            for veredito in julgamentos if isinstance(julgamentos, list) else []:
+                if _veredito_valido(veredito) and veredito.get("erro_id") in ids:
+                    vereditos[veredito["erro_id"]] = veredito
+            progresso.registrar_tokens("agrupado", tokens, len(vereditos))
+
+        if len(vereditos) < len(erros):
+            gpt_client.invalidar(ASSISTENTE_JUIZ, prompt)
+            logger.info(f"{len(erros) - len(vereditos)} erros de {reference} sem veredito no prompt agrupado")
+
+    resultados = []
+    falha_transitoria = None
+    for erro in erros:
+        if erro["id"] in vereditos:
+            resultados.append((erro, vereditos[erro["id"]]))
+        elif falha_transitoria is not None:
+            resultados.append((erro, falha_transitoria))
+        else:
+            try:
+                resultados.append((erro, _julgar_individual(erro, texto_carta)))
+            except LLMErro as e:
+                if e.transitorio:
+                    # O GPTClient já esgotou as tentativas: os demais erros ficam para depois
+                    falha_transitoria = e
+                resultados.append((erro, e))
             except Exception as e:
-                logger.error(f"Erro ao processar {erro.reference}: {str(e)}")
-                db.rollback()
+                resultados.append((erro, e))
+    return resultados
+
+
+def _agendar_gravacao(julgados: List[Tuple[Dict, Dict]], ao_concluir=None) -> Future:
+    """
+    Agenda os julgamentos e a marcação dos erros como julgados no escritor em lote.
+    Os dois entram no mesmo commit: uma queda antes dele só deixa os erros para a próxima execução
+    """
+    agora = datetime.utcnow()
+    return escritor_catalogacao.enfileirar([
+        (INSERIR, Julgamento, [
+            {
+                "erro_id": erro["id"],
+                "reference": erro["reference"],
+                "resultado_analise": resultado["analise"],
+                "resposta_correta": resultado["valor_correto_final"],
+                "grau_certeza": resultado.get("grau_certeza", 0.9),
+                "data_julgamento": agora,
+            }
+            for erro, resultado in julgados
+        ]),
+        (ATUALIZAR, CatalogacaoErro, [
+            {"id": erro["id"], "julgado": True, "resposta_correta": resultado["valor_correto_final"]}
+            for erro, resultado in julgados
+        ]),
+    ], ao_concluir)
+
+
+def _cartas_nao_julgadas(db: Session) -> Iterator[List[Dict]]:
+    """
+    Percorre os erros não julgados com paginação por chave em (reference, id)
+    e produz os erros agrupados por carta, em grupos de até JUIZ_MAX_ERROS_POR_PROMPT.
+    """
+    ultima_reference, ultimo_id = "", 0
+    grupo: List[Dict] = []
+    while True:
+        inicio = time.perf_counter()
+        pagina = db.query(
+            CatalogacaoErro.id,
+            CatalogacaoErro.reference,
+            CatalogacaoErro.campo,
+            CatalogacaoErro.conteudo_errado,
+            CatalogacaoErro.resposta_correta,
+            CatalogacaoErro.motivo,
+        ).filter(
+            CatalogacaoErro.julgado == False,
+            or_(
+                CatalogacaoErro.reference > ultima_reference,
+                and_(CatalogacaoErro.reference == ultima_reference, CatalogacaoErro.id > ultimo_id)
+            )
+        ).order_by(CatalogacaoErro.reference, CatalogacaoErro.id).limit(JUIZ_TAMANHO_PAGINA).all()
+        ETAPAS_JULGAMENTO.observar(time.perf_counter() - inicio, etapa="leitura_fila")
+
+        if not pagina:
+            break
+        ultima_reference, ultimo_id = pagina[-1].reference, pagina[-1].id
+
+        # O grupo da última carta da página pode continuar na página seguinte
+        for linha in pagina:
+            erro = dict(linha._mapping)
+            if grupo and (grupo[0]["reference"] != erro["reference"] or len(grupo) >= JUIZ_MAX_ERROS_POR_PROMPT):
+                yield grupo
+                grupo = []
+            grupo.append(erro)
 
+    if grupo:
+        yield grupo
+
+
+def julgar_erros(db: Session):
+    """
+    Consulta erros não julgados, reavalia com LLM e registra julgamentos.
+    Acessa os PDFs originais no diretório de cache para análise.
+    """
+    try:
+        total = db.query(CatalogacaoErro).filter(CatalogacaoErro.julgado == False).count()
+        progresso.iniciar(total)
+
+        if not total:
+            logger.info("Nenhum erro pendente para julgamento")
+            progresso.finalizar()
+            return
+
+        logger.info(f"Iniciando julgamento de {total} erros ({JUIZ_CONCORRENCIA} chamadas simultâneas)")
+        textos = _TextosCartas()
+
+        def contabilizar_gravacao(quantidade: int, erro: Optional[Exception]):
+            # Só conta como julgado depois do commit
+            if erro is None:
+                progresso.registrar(julgados=quantidade)
+            else:
+                progresso.registrar(falhas=quantidade)
+
+        def registrar_resultados(resultados: List[Tuple[Dict, object]]):
+            julgados = []
+            for erro, resultado in resultados:
+                if resultado is None:
+                    progresso.registrar(ignorados=1)
+                elif isinstance(resultado, Exception):
+                    ERROS.incrementar(componente="juiz", tipo=type(resultado).__name__)
+                    logger.error(f"Erro ao processar {erro['reference']}: {str(resultado)}")
+                    progresso.registrar(falhas=1)
+                else:
+                    julgados.append((erro, resultado))
+            if julgados:
+                # O escritor junta os julgamentos de várias cartas num mesmo commit
+                _agendar_gravacao(julgados, partial(contabilizar_gravacao, len(julgados)))
+
+        with ThreadPoolExecutor(max_workers=JUIZ_CONCORRENCIA, thread_name_prefix="juiz") as executor:
+            em_andamento = set()
+            for grupo in _cartas_nao_julgadas(db):
+                em_andamento.add(executor.submit(_julgar_grupo, grupo, textos))
+                # Mantém poucas cartas enfileiradas além das chamadas em curso
+                if len(em_andamento) >= JUIZ_CONCORRENCIA * 2:
+                    concluidos, em_andamento = wait(em_andamento, return_when=FIRST_COMPLETED)
+                    for futuro in concluidos:
+                        registrar_resultados(futuro.result())
+
+            for futuro in as_completed(em_andamento):
+                registrar_resultados(futuro.result())
+
+        with ETAPAS_JULGAMENTO.medir(etapa="gravacao_banco"):
+            escritor_catalogacao.descarregar()
+
+        tokens = progresso.tokens_por_erro()
+        logger.info(
+            f"Tokens por erro julgado: agrupado={tokens['agrupado']}, individual={tokens['individual']}"
+        )
         logger.info("Processo de julgamento concluído")
+        progresso.finalizar()
 
     except Exception as e:
         logger.error(f"Falha crítica no julgamento: {str(e)}")
-        raise
\ No newline at end of file
+        progresso.finalizar(erro=str(e))
+        raise
+
+
+def iniciar_julgamento_em_segundo_plano() -> bool:
+    """Executa julgar_erros numa thread própria; retorna False se já houver uma execução em andamento"""
+    with _inicio_lock:
+        if progresso.em_execucao:
+            return False
+        progresso.iniciar(0)
+
+    def executar():
+        db = CatalogacaoSessionLocal()
+        try:
+            julgar_erros(db)
+        except Exception:
+            logger.exception("Erro ao julgar erros")
+        finally:
+            db.close()
+
+    threading.Thread(target=executar, name="juiz", daemon=True).start()
+    return True
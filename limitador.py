@@ -0,0 +1,106 @@
+import os
+import time
+import asyncio
+import threading
+from typing import Dict
+from dotenv import load_dotenv
+
+# Carrega as variáveis do arquivo .env
+load_dotenv()
+
+# Limites do provedor (0 desativa o respectivo limite)
+LLM_RPM = float(os.getenv("LLM_RPM", "0"))
+LLM_TPM = float(os.getenv("LLM_TPM", "0"))
+
+
+class _Balde:
+    """Token bucket que se reabastece continuamente até a capacidade de um minuto"""
+
+    def __init__(self, por_minuto: float):
+        self.capacidade = por_minuto
+        self.taxa = por_minuto / 60.0
+        self.disponivel = por_minuto
+        self.atualizado = time.monotonic()
+
+    def _reabastecer(self, agora: float):
+        self.disponivel = min(self.capacidade, self.disponivel + (agora - self.atualizado) * self.taxa)
+        self.atualizado = agora
+
+    def espera(self, quantidade: float, agora: float) -> float:
+        self._reabastecer(agora)
+        quantidade = min(quantidade, self.capacidade)  # Um pedido maior que o balde nunca seria atendido
+        if self.disponivel >= quantidade:
+            return 0.0
+        return (quantidade - self.disponivel) / self.taxa
+
+    def consumir(self, quantidade: float):
+        self.disponivel -= min(quantidade, self.capacidade)
+
+
+class LimitadorTaxa:
+    """
+    Limita requisições/min e tokens/min de forma compartilhada entre threads e tarefas async.
+    Os tokens de cada chamada são estimados antes e corrigidos depois com o valor real.
+    """
+
+    def __init__(self, requisicoes_por_minuto: float = LLM_RPM, tokens_por_minuto: float = LLM_TPM):
+        self._lock = threading.Lock()
+        self._requisicoes = _Balde(requisicoes_por_minuto) if requisicoes_por_minuto > 0 else None
+        self._tokens = _Balde(tokens_por_minuto) if tokens_por_minuto > 0 else None
+        self._pausa_ate = 0.0
+
+    def _tentar(self, tokens: int) -> float:
+        """Reserva a chamada se houver saldo; caso contrário retorna quantos segundos esperar"""
+        with self._lock:
+            agora = time.monotonic()
+            espera = max(0.0, self._pausa_ate - agora)
+            if self._requisicoes is not None:
+                espera = max(espera, self._requisicoes.espera(1, agora))
+            if self._tokens is not None:
+                espera = max(espera, self._tokens.espera(tokens, agora))
+            if espera == 0.0:
+                if self._requisicoes is not None:
+                    self._requisicoes.consumir(1)
+                if self._tokens is not None:
+                    self._tokens.consumir(tokens)
+            return espera
+
+    def adquirir(self, tokens: int = 0):
+        while True:
+            espera = self._tentar(tokens)
+            if espera == 0.0:
+                return
+            time.sleep(espera)
+
+    async def adquirir_async(self, tokens: int = 0):
+        while True:
+            espera = self._tentar(tokens)
+            if espera == 0.0:
+                return
+            await asyncio.sleep(espera)
+
+    def pausar(self, segundos: float):
+        """Suspende todas as chamadas (ex.: após um 429 com Retry-After)"""
+        with self._lock:
+            self._pausa_ate = max(self._pausa_ate, time.monotonic() + segundos)
+
+    def ajustar(self, tokens_estimados: int, tokens_reais: int):
+        """Devolve (ou cobra) a diferença entre a estimativa e o consumo real"""
+        if self._tokens is None:
+            return
+        with self._lock:
+            self._tokens.disponivel = min(
+                self._tokens.capacidade, self._tokens.disponivel + tokens_estimados - tokens_reais
+            )
+
+
+_limitadores: Dict[str, LimitadorTaxa] = {}
+_limitadores_lock = threading.Lock()
+
+
+def obter_limitador(chave: str) -> LimitadorTaxa:
+    """Um limitador por backend/modelo, compartilhado por todos os clientes do processo"""
+    with _limitadores_lock:
+        if chave not in _limitadores:
+            _limitadores[chave] = LimitadorTaxa()
+        return _limitadores[chave]
@@ -0,0 +1,133 @@
+import os
+import io
+import csv
+import json
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy.orm import Query, Session
+from db import CatalogacaoSessionLocal
+from models import CatalogacaoErro, Julgamento
+import logging
+from dotenv import load_dotenv
+
+# Carrega as variáveis do arquivo .env
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Linhas lidas do banco por vez na exportação
+LISTAGEM_LOTE_EXPORTACAO = int(os.getenv("LISTAGEM_LOTE_EXPORTACAO", "1000"))
+
+FORMATOS_EXPORTACAO = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def serializar(registro) -> Dict:
+    """Colunas da linha como dicionário"""
+    return {coluna.name: getattr(registro, coluna.name) for coluna in registro.__table__.columns}
+
+
+def _texto(valor) -> str:
+    """Texto de um valor no CSV e no NDJSON; datas em ISO 8601, como na resposta JSON"""
+    if valor is None:
+        return ""
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return str(valor)
+
+
+def consulta_erros(db: Session,
+                   reference: Optional[str] = None,
+                   campo: Optional[str] = None,
+                   julgado: Optional[bool] = None,
+                   origem: Optional[str] = None,
+                   data_inicio: Optional[datetime] = None,
+                   data_fim: Optional[datetime] = None) -> Query:
+    consulta = db.query(CatalogacaoErro)
+    if reference is not None:
+        consulta = consulta.filter(CatalogacaoErro.reference == reference)
+    if campo is not None:
+        consulta = consulta.filter(CatalogacaoErro.campo == campo)
+    if julgado is not None:
+        consulta = consulta.filter(CatalogacaoErro.julgado == julgado)
+    if origem is not None:
+        consulta = consulta.filter(CatalogacaoErro.origem == origem)
+    if data_inicio is not None:
+        consulta = consulta.filter(CatalogacaoErro.data_registro >= data_inicio)
+    if data_fim is not None:
+        consulta = consulta.filter(CatalogacaoErro.data_registro < data_fim)
+    return consulta
+
+
+def consulta_julgamentos(db: Session,
+                         reference: Optional[str] = None,
+                         erro_id: Optional[int] = None,
+                         grau_certeza_min: Optional[float] = None,
+                         data_inicio: Optional[datetime] = None,
+                         data_fim: Optional[datetime] = None) -> Query:
+    consulta = db.query(Julgamento)
+    if reference is not None:
+        consulta = consulta.filter(Julgamento.reference == reference)
+    if erro_id is not None:
+        consulta = consulta.filter(Julgamento.erro_id == erro_id)
+    if grau_certeza_min is not None:
+        consulta = consulta.filter(Julgamento.grau_certeza >= grau_certeza_min)
+    if data_inicio is not None:
+        consulta = consulta.filter(Julgamento.data_julgamento >= data_inicio)
+    if data_fim is not None:
+        consulta = consulta.filter(Julgamento.data_julgamento < data_fim)
+    return consulta
+
+
+def _apos_cursor(consulta: Query, modelo, depois_de: Optional[int]) -> Query:
+    # Paginação por chave: o índice da chave primária evita o custo crescente do OFFSET
+    if depois_de is not None:
+        consulta = consulta.filter(modelo.id > depois_de)
+    return consulta.order_by(modelo.id)
+
+
+def paginar(consulta: Query, modelo, depois_de: Optional[int], limite: int) -> Tuple[List[Dict], Optional[int]]:
+    """
+    Uma página de até limite linhas com id maior que depois_de.
+    Retorna (itens, proximo); proximo é o cursor da página seguinte ou None na última
+    """
+    # Uma linha a mais diz se existe próxima página sem precisar de COUNT
+    linhas = _apos_cursor(consulta, modelo, depois_de).limit(limite + 1).all()
+    proximo = linhas[limite - 1].id if len(linhas) > limite else None
+    return [serializar(linha) for linha in linhas[:limite]], proximo
+
+
+def exportar(montar_consulta: Callable[[Session], Query], modelo, formato: str,
+             depois_de: Optional[int] = None) -> Iterator[str]:
+    """
+    Gera as linhas em NDJSON ou CSV lendo o banco em lotes (yield_per). A resposta
+    continua depois que as dependências do endpoint são encerradas, então usa sessão própria.
+    """
+    db = CatalogacaoSessionLocal()
+    try:
+        colunas = [coluna.name for coluna in modelo.__table__.columns]
+        consulta = _apos_cursor(montar_consulta(db), modelo, depois_de).yield_per(LISTAGEM_LOTE_EXPORTACAO)
+
+        if formato == "ndjson":
+            for linha in consulta:
+                yield json.dumps(serializar(linha), ensure_ascii=False, default=_texto) + "\n"
+            return
+
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        escritor.writerow(colunas)
+        for posicao, linha in enumerate(consulta, start=1):
+            escritor.writerow([_texto(getattr(linha, coluna)) for coluna in colunas])
+            if posicao % LISTAGEM_LOTE_EXPORTACAO == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    except Exception as e:
+        # O status HTTP já foi enviado: só resta registrar e interromper a resposta
+        logger.error(f"Erro ao exportar {modelo.__tablename__}: {str(e)}")
+        raise
+    finally:
+        db.close()
@@ -0,0 +1,318 @@
+import os
+import re
+import json
+import time
+import hashlib
+from pathlib import Path
+from typing import Dict, Generator, List, NamedTuple, Optional
+import openai
+import requests
+import logging
+from dotenv import load_dotenv
+
+# Carrega as variáveis do arquivo .env
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+LLM_REPLAY_DIR = Path(os.getenv("LLM_REPLAY_DIR", "respostas"))
+LLM_REPLAY_LATENCIA_S = float(os.getenv("LLM_REPLAY_LATENCIA_S", "0"))
+
+
+class LLMErro(Exception):
+    """Falha ao obter uma resposta do backend de LLM"""
+
+    # Falhas transitórias valem uma nova tentativa; as demais são devolvidas na hora
+    transitorio = False
+
+
+class LLMTimeoutErro(LLMErro):
+    """O backend não respondeu dentro do timeout"""
+
+    transitorio = True
+
+
+class LLMLimiteTaxaErro(LLMErro):
+    """O provedor recusou a chamada por limite de taxa (HTTP 429)"""
+
+    transitorio = True
+
+    def __init__(self, mensagem: str, retry_after: Optional[float] = None):
+        super().__init__(mensagem)
+        self.retry_after = retry_after
+
+
+class LLMIndisponivelErro(LLMErro):
+    """Falha de conexão ou erro 5xx do provedor"""
+
+    transitorio = True
+
+
+class LLMRequisicaoInvalidaErro(LLMErro):
+    """Requisição recusada pelo provedor (autenticação, parâmetros, contexto excedido)"""
+
+
+class LLMRespostaInvalidaErro(LLMErro, ValueError):
+    """O modelo respondeu, mas o conteúdo não está no formato esperado"""
+
+
+def _retry_after(headers) -> Optional[float]:
+    """Lê o cabeçalho Retry-After (em segundos); datas HTTP são ignoradas"""
+    if not headers:
+        return None
+    valor = headers.get("retry-after-ms")
+    if valor is not None:
+        try:
+            return float(valor) / 1000
+        except ValueError:
+            pass
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _erro_http(status: int, mensagem: str, headers=None) -> LLMErro:
+    if status == 429:
+        return LLMLimiteTaxaErro(mensagem, retry_after=_retry_after(headers))
+    if status == 408:
+        return LLMTimeoutErro(mensagem)
+    if status >= 500:
+        return LLMIndisponivelErro(mensagem)
+    return LLMRequisicaoInvalidaErro(mensagem)
+
+
+def _erro_openai(e: "openai.OpenAIError") -> LLMErro:
+    if isinstance(e, openai.APITimeoutError):
+        return LLMTimeoutErro(str(e))
+    if isinstance(e, openai.APIConnectionError):
+        return LLMIndisponivelErro(str(e))
+    if isinstance(e, openai.APIStatusError):
+        return _erro_http(e.status_code, str(e), e.response.headers)
+    return LLMErro(str(e))
+
+
+def _erro_requests(e: Exception) -> LLMErro:
+    if isinstance(e, requests.Timeout):
+        return LLMTimeoutErro(str(e))
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return _erro_http(e.response.status_code, str(e), e.response.headers)
+    if isinstance(e, ValueError):
+        # JSON malformado (requests.JSONDecodeError também é RequestException)
+        return LLMRespostaInvalidaErro(str(e))
+    return LLMIndisponivelErro(str(e))
+
+
+class RespostaLLM(NamedTuple):
+    texto: str
+    tokens_used: int
+
+
+class LLMBackend:
+    """
+    Interface comum dos backends. O GPTClient cuida de cache e novas tentativas;
+    o backend só executa uma chamada, respeitando o timeout, e levanta uma subclasse de LLMErro em caso de falha.
+    """
+
+    nome = "base"
+
+    def completar(self, messages: List[Dict], model: str, temperature: float,
+                  max_tokens: int, timeout: float) -> RespostaLLM:
+        raise NotImplementedError
+
+    def completar_stream(self, messages: List[Dict], model: str, temperature: float,
+                         max_tokens: int, timeout: float) -> Generator[str, None, int]:
+        """
+        Produz a resposta em pedaços e, ao terminar, retorna os tokens usados (0 se o provedor não informar).
+        Por padrão entrega a resposta completa de uma vez
+        """
+        resposta = self.completar(messages, model, temperature, max_tokens, timeout)
+        yield resposta.texto
+        return resposta.tokens_used
+
+
+class OpenAIBackend(LLMBackend):
+    nome = "openai"
+
+    def __init__(self, api_key: Optional[str] = None, client=None):
+        # client permite injetar um stub com a mesma interface de openai.OpenAI.
+        # As novas tentativas ficam a cargo do GPTClient, que respeita o limitador compartilhado
+        self.client = client if client is not None else openai.OpenAI(api_key=api_key, max_retries=0)
+
+    def completar(self, messages, model, temperature, max_tokens, timeout) -> RespostaLLM:
+        try:
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout
+            )
+        except openai.OpenAIError as e:
+            raise _erro_openai(e) from e
+        return RespostaLLM(response.choices[0].message.content, response.usage.total_tokens)
+
+    def completar_stream(self, messages, model, temperature, max_tokens, timeout) -> Generator[str, None, int]:
+        tokens = 0
+        try:
+            stream = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout,
+                stream=True,
+                stream_options={"include_usage": True}  # O último chunk traz o uso, sem choices
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+                if getattr(chunk, "usage", None):
+                    tokens = chunk.usage.total_tokens
+        except openai.OpenAIError as e:
+            raise _erro_openai(e) from e
+        return tokens
+
+
+class OllamaBackend(LLMBackend):
+    """Servidor compatível com a API HTTP do Ollama (/api/chat)"""
+
+    nome = "ollama"
+
+    def __init__(self, base_url: str = OLLAMA_BASE_URL):
+        self.url = f"{base_url.rstrip('/')}/api/chat"
+        self.session = requests.Session()
+
+    def _payload(self, messages, model, temperature, max_tokens, stream: bool) -> Dict:
+        return {
+            "model": model,
+            "messages": messages,
+            "stream": stream,
+            "options": {"temperature": temperature, "num_predict": max_tokens},
+        }
+
+    def completar(self, messages, model, temperature, max_tokens, timeout) -> RespostaLLM:
+        try:
+            response = self.session.post(
+                self.url, json=self._payload(messages, model, temperature, max_tokens, False), timeout=timeout
+            )
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise _erro_requests(e) from e
+        tokens = data.get("prompt_eval_count", 0) + data.get("eval_count", 0)
+        return RespostaLLM(data["message"]["content"], tokens)
+
+    def completar_stream(self, messages, model, temperature, max_tokens, timeout) -> Generator[str, None, int]:
+        tokens = 0
+        try:
+            with self.session.post(
+                self.url, json=self._payload(messages, model, temperature, max_tokens, True),
+                timeout=timeout, stream=True
+            ) as response:
+                response.raise_for_status()
+                for linha in response.iter_lines():
+                    if not linha:
+                        continue
+                    parte = json.loads(linha)
+                    if parte.get("message", {}).get("content"):
+                        yield parte["message"]["content"]
+                    if parte.get("done"):
+                        # Só a última parte traz as contagens
+                        tokens = parte.get("prompt_eval_count", 0) + parte.get("eval_count", 0)
+                        break
+        except (requests.RequestException, ValueError) as e:
+            raise _erro_requests(e) from e
+        return tokens
+
+
+class ReplayBackend(LLMBackend):
+    """
+    Backend local e determinístico que devolve as respostas gravadas em respostas/*.txt.
+    Escolhe o arquivo pela reference citada no prompt e pelo modelo; sem reference,
+    escolhe um arquivo a partir do hash do prompt. Serve para testes de carga sem rede.
+    As gravações são de extração de campos, não de julgamento: os prompts do juiz recebem
+    vereditos gerados a partir dos próprios erros candidatos, que confirmam a correção sugerida.
+    """
+
+    nome = "replay"
+    _PADRAO_REFERENCE = re.compile(r"Reference:\s*([A-Za-z]{2}-[A-Za-z]{2}\d+)")
+    _CABECALHO = "Resposta do Modelo:\n"
+    # Marcas dos prompts do juiz (juiz.montar_prompt_agrupado e juiz.montar_prompt)
+    _CANDIDATOS_JUIZ = "**Erros Candidatos"
+    _SUGESTAO_JUIZ = re.compile(r"^\s*- Sugestão de Correção: (.*)$", re.MULTILINE)
+    _ANALISE_REPLAY = "Veredito gerado pelo backend replay: correção sugerida confirmada"
+
+    def __init__(self, diretorio: Path = LLM_REPLAY_DIR, latencia_s: float = LLM_REPLAY_LATENCIA_S):
+        self.latencia_s = latencia_s
+        self.respostas: Dict[tuple, str] = {}
+        for arquivo in sorted(Path(diretorio).glob("*_response.txt")):
+            # Ex.: pe-al0001.pdf_gpt-4o-mini_response.txt
+            documento, modelo = arquivo.name[:-len("_response.txt")].split("_", 1)
+            reference = documento.split(".")[0].upper()
+            conteudo = arquivo.read_text(encoding="utf-8")
+            self.respostas[(reference, modelo)] = conteudo.rsplit(self._CABECALHO, 1)[-1].strip()
+
+        if not self.respostas:
+            raise LLMErro(f"Nenhuma resposta gravada em {diretorio}")
+        self._ordenadas = [self.respostas[chave] for chave in sorted(self.respostas)]
+
+    def _escolher(self, prompt: str, model: str) -> str:
+        encontrada = self._PADRAO_REFERENCE.search(prompt)
+        if encontrada:
+            reference = encontrada.group(1).upper()
+            if (reference, model) in self.respostas:
+                return self.respostas[(reference, model)]
+            for (ref, _), texto in sorted(self.respostas.items()):
+                if ref == reference:
+                    return texto
+        indice = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16) % len(self._ordenadas)
+        return self._ordenadas[indice]
+
+    @classmethod
+    def _veredito(cls, sugestao, erro_id=None) -> Dict:
+        veredito = {
+            "analise": cls._ANALISE_REPLAY,
+            "valor_correto_final": sugestao,
+            "grau_certeza": 0.5,
+            "correcao_necessaria": True,
+        }
+        if erro_id is not None:
+            veredito["erro_id"] = erro_id
+        return veredito
+
+    @classmethod
+    def _julgar(cls, prompt: str) -> Optional[str]:
+        """Resposta para um prompt do juiz; None se o prompt não é do juiz"""
+        posicao = prompt.find(cls._CANDIDATOS_JUIZ)
+        if posicao >= 0:
+            candidatos, _ = json.JSONDecoder().raw_decode(prompt, prompt.index("[", posicao))
+            return json.dumps({"julgamentos": [
+                cls._veredito(candidato.get("sugestao_correcao"), candidato.get("erro_id"))
+                for candidato in candidatos
+            ]}, ensure_ascii=False)
+
+        encontrada = cls._SUGESTAO_JUIZ.search(prompt)
+        if encontrada and "Reavalie" in prompt:
+            return json.dumps(cls._veredito(encontrada.group(1).strip()), ensure_ascii=False)
+        return None
+
+    def completar(self, messages, model, temperature, max_tokens, timeout) -> RespostaLLM:
+        prompt = "\n".join(mensagem["content"] for mensagem in messages)
+        texto = self._julgar(prompt) or self._escolher(prompt, model)
+        if self.latencia_s:
+            time.sleep(self.latencia_s)
+        # Estimativa de ~4 caracteres por token
+        return RespostaLLM(texto, (len(prompt) + len(texto)) // 4)
+
+
+def criar_backend(nome: str, api_key: Optional[str] = None) -> LLMBackend:
+    nome = (nome or "openai").lower()
+    if nome == "openai":
+        return OpenAIBackend(api_key=api_key)
+    if nome == "ollama":
+        return OllamaBackend()
+    if nome == "replay":
+        return ReplayBackend()
+    raise ValueError(f"Backend de LLM desconhecido: {nome}")
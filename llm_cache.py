@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+from dotenv import load_dotenv
+
+# Carrega as variáveis do arquivo .env
+load_dotenv()
+
+LLM_CACHE_ATIVO = os.getenv("LLM_CACHE_ATIVO", "0") == "1"
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", "cache/llm_respostas.sqlite3"))
+LLM_CACHE_TTL_S = float(os.getenv("LLM_CACHE_TTL_S", str(30 * 24 * 3600)))
+LLM_CACHE_MAX_ITENS = int(os.getenv("LLM_CACHE_MAX_ITENS", "50000"))
+
+
+def fingerprint(model: str, temperature: float, max_tokens: int, messages: List[Dict]) -> str:
+    """Hash dos parâmetros que determinam a resposta do modelo"""
+    chave = json.dumps(
+        {"model": model, "temperature": temperature, "max_tokens": max_tokens, "messages": messages},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(chave.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Cache persistente (SQLite) das respostas do LLM, com TTL e limite de entradas"""
+
+    def __init__(self, caminho: Path = LLM_CACHE_PATH,
+                 ttl_s: float = LLM_CACHE_TTL_S,
+                 max_itens: int = LLM_CACHE_MAX_ITENS):
+        self.caminho = Path(caminho)
+        self.ttl_s = ttl_s
+        self.max_itens = max_itens
+        self._lock = threading.Lock()
+        self._insercoes = 0
+        self.acertos = 0
+        self.falhas = 0
+
+        self.caminho.parent.mkdir(parents=True, exist_ok=True)
+        with self._conectar() as conexao:
+            conexao.execute(
+                """
+                CREATE TABLE IF NOT EXISTS respostas (
+                    chave TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    resposta TEXT NOT NULL,
+                    tokens_used INTEGER,
+                    criado_em REAL NOT NULL
+                )
+                """
+            )
+            conexao.execute("CREATE INDEX IF NOT EXISTS ix_respostas_criado_em ON respostas (criado_em)")
+
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        # Uma conexão por operação: sqlite3 não compartilha conexões entre threads
+        conexao = sqlite3.connect(self.caminho, timeout=10)
+        try:
+            with conexao:  # Commit ao final ou rollback em caso de erro
+                yield conexao
+        finally:
+            conexao.close()
+
+    def obter(self, chave: str) -> Optional[Dict]:
+        with self._conectar() as conexao:
+            linha = conexao.execute(
+                "SELECT resposta, tokens_used, criado_em FROM respostas WHERE chave = ?",
+                (chave,)
+            ).fetchone()
+
+        with self._lock:
+            if linha is None or time.time() - linha[2] > self.ttl_s:
+                self.falhas += 1
+                return None
+            self.acertos += 1
+        return {"response": linha[0], "tokens_used": linha[1]}
+
+    def salvar(self, chave: str, model: str, resposta: str, tokens_used: Optional[int]):
+        with self._conectar() as conexao:
+            conexao.execute(
+                "INSERT OR REPLACE INTO respostas (chave, model, resposta, tokens_used, criado_em) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (chave, model, resposta, tokens_used, time.time())
+            )
+
+        with self._lock:
+            self._insercoes += 1
+            limpar = self._insercoes % 100 == 0
+        if limpar:
+            self.limpar()
+
+    def remover(self, chave: str):
+        """Descarta uma resposta (ex.: que o chamador não conseguiu interpretar)"""
+        with self._conectar() as conexao:
+            conexao.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+
+    def limpar(self):
+        """Remove entradas expiradas e as mais antigas além do limite"""
+        with self._conectar() as conexao:
+            conexao.execute("DELETE FROM respostas WHERE criado_em < ?", (time.time() - self.ttl_s,))
+            conexao.execute(
+                "DELETE FROM respostas WHERE chave IN ("
+                "SELECT chave FROM respostas ORDER BY criado_em DESC LIMIT -1 OFFSET ?)",
+                (self.max_itens,)
+            )
+
+    def estatisticas(self) -> Dict:
+        consultas = self.acertos + self.falhas
+        return {
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "taxa_acerto": round(self.acertos / consultas, 4) if consultas else None,
+            "ttl_s": self.ttl_s,
+            "max_itens": self.max_itens,
+        }
+
+
+_cache_padrao: Optional[LLMCache] = None
+
+
+def obter_cache_padrao() -> Optional[LLMCache]:
+    """Cache compartilhado pelos clientes, ou None quando LLM_CACHE_ATIVO não está ligado"""
+    global _cache_padrao
+    if LLM_CACHE_ATIVO and _cache_padrao is None:
+        _cache_padrao = LLMCache()
+    return _cache_padrao
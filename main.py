@@ -1,11 +1,27 @@
-from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, Query
+from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, Query, Body
 from sqlalchemy.orm import Session
-from data_comparator import analyze_data
-from db import get_catalogacao_db, get_silb_db
-from models import Base, CatalogacaoErro
-from juiz import julgar_erros
+from typing import List, Optional
+from datetime import datetime
+from data_comparator import analyze_data, analyze_data_stream, verificacao_registrada, catalog_prefetcher, LIMITE_TEXTO_PROMPT, PROMPT_ANALISE
+from db import get_catalogacao_db, get_silb_db, CatalogacaoSessionLocal, SilbSessionLocal, catalogacao_engine, estatisticas_pools
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from models import CatalogacaoErro, Julgamento, VerificacaoJob
+import migracoes
+import juiz
+import listagem
+from pdf_extractor import extrair_texto
+from text_cache import text_cache, hash_conteudo
+from catalog_cache import catalog_cache
+from llm_cache import obter_cache_padrao
+from llm_backends import LLMErro
+import executores
+from persistencia import escritor_catalogacao
+import job_queue
+import metricas
+from metricas import ETAPAS_VERIFICACAO, MedidorColetado
 from pathlib import Path
-import fitz  # PyMuPDF
+import asyncio
+import json
 import logging
 from dotenv import load_dotenv
 import os
@@ -19,16 +35,115 @@ logger = logging.getLogger(__name__)
 
 # Configuração de diretórios (adicionar no início do arquivo)
 CACHE_DIR = Path("cache")
-CACHE_DIR.mkdir(exist_ok=True)
-
-# Cria as tabelas no banco de dados catalogacao (se não existirem)
-Base.metadata.create_all(bind=get_catalogacao_db().__next__().bind)
 
 app = FastAPI()
+
+
+def _jobs_por_status():
+    db = CatalogacaoSessionLocal()
+    try:
+        return job_queue.estatisticas(db)["jobs"]
+    finally:
+        db.close()
+
+
+def _ocupacao_executores():
+    return {
+        (nome, estado): pool[estado]
+        for nome, pool in executores.estatisticas().items()
+        for estado in ("em_execucao", "em_espera")
+    }
+
+
+def _conexoes_bancos():
+    return {
+        (nome, estado): pool[estado]
+        for nome, pool in estatisticas_pools().items()
+        for estado in ("em_uso", "livres", "overflow")
+    }
+
+
+# Medidores lidos a cada coleta de /metrics
+MedidorColetado("fila_jobs", "Jobs de verificação por status", ["status"], _jobs_por_status)
+MedidorColetado("executores_tarefas", "Tarefas em execução e em espera por pool", ["pool", "estado"],
+                _ocupacao_executores)
+MedidorColetado("persistencia_linhas_pendentes", "Linhas aguardando o próximo lote do escritor", [],
+                lambda: {(): escritor_catalogacao.estatisticas()["pendentes"]})
+MedidorColetado("banco_conexoes", "Conexões dos pools de cada banco", ["banco", "estado"], _conexoes_bancos)
+
+
+@app.on_event("startup")
+def iniciar_fila():
+    # Cria as tabelas do banco catalogacao e aplica as migrações pendentes. Se outro worker
+    # já está migrando, este não fica esperando por ele
+    if migracoes.MIGRACOES_NO_STARTUP:
+        migracoes.aplicar(catalogacao_engine, esperar=False)
+
+    # Jobs interrompidos por uma queda do servidor voltam para a fila
+    job_queue.recuperar_jobs_interrompidos()
+    job_queue.iniciar_workers()
+
+@app.on_event("shutdown")
+def encerrar_pools():
+    job_queue.parar_workers()
+    catalog_prefetcher.encerrar()
+    escritor_catalogacao.encerrar()
+    executores.encerrar()
+
+def _salvar_no_cache(cache_path: Path, contents: bytes):
+    """Grava o PDF no cache (executado no pool de I/O)"""
+    with open(cache_path, "wb") as f:
+        f.write(contents)
+
+    # Verifica se o arquivo foi salvo corretamente
+    if not cache_path.exists() or os.path.getsize(cache_path) == 0:
+        raise HTTPException(
+            status_code=500,
+            detail="Falha ao salvar arquivo temporário no cache"
+        )
+
+def _registrar_erro_sistema(catalogacao_db: Session, reference: str, analysis_error: Exception):
+    """Registra erro de análise no banco (executado no pool de I/O)"""
+    erro = CatalogacaoErro(
+        reference=reference,
+        campo="sistema",
+        conteudo_errado="N/A",
+        motivo=f"Erro na análise: {str(analysis_error)}",
+        resposta_correta="Revisar processamento"
+    )
+    catalogacao_db.add(erro)
+    catalogacao_db.commit()
+
+def _formatar_evento(evento: dict) -> str:
+    dados = json.dumps(evento["dados"], ensure_ascii=False, default=str)
+    return f"event: {evento['evento']}\ndata: {dados}\n\n"
+
+def _eventos_analise(reference: str, carta_texto: str, pdf_hash: str, catalog_data: Optional[dict]):
+    """
+    Eventos SSE da análise em streaming. A resposta continua depois que as dependências
+    do endpoint são encerradas, então usa sessões próprias.
+    """
+    catalogacao_db = CatalogacaoSessionLocal()
+    silb_db = SilbSessionLocal()
+    try:
+        for evento in analyze_data_stream(reference, carta_texto, catalogacao_db, silb_db, pdf_hash, catalog_data):
+            yield _formatar_evento(evento)
+    finally:
+        silb_db.close()
+        catalogacao_db.close()
+
+def _eventos_registrados(resultado: dict):
+    """Os mesmos eventos da análise em streaming, a partir de um resultado do histórico"""
+    for erro in resultado["erros_identificados"]:
+        yield _formatar_evento({"evento": "erro", "dados": erro})
+    yield _formatar_evento({"evento": "fim", "dados": resultado})
+
 @app.post("/verificar/")
 async def verificar_carta(
     reference: str = Query(...),
     file: UploadFile = File(...),
+    stream: bool = Query(False, description="Envia cada erro por SSE assim que é identificado"),
+    force: bool = Query(False, description="Analisa de novo mesmo que a carta e o registro do SILB não tenham mudado"),
     catalogacao_db: Session = Depends(get_catalogacao_db),
     silb_db: Session = Depends(get_silb_db)
 ):
@@ -40,24 +155,14 @@ async def verificar_carta(
         # 2. Validação e salvamento do arquivo
         try:
             # Lê e valida o conteúdo do arquivo
-            contents = await file.read()
+            with ETAPAS_VERIFICACAO.medir(etapa="leitura_upload"):
+                contents = await file.read()
             if not contents:
                 raise HTTPException(
                     status_code=400,
                     detail="O arquivo enviado está vazio"
                 )
             
-            # Salva no cache com verificação
-            with open(cache_path, "wb") as f:
-                f.write(contents)
-            
-            # Verifica se o arquivo foi salvo corretamente
-            if not cache_path.exists() or os.path.getsize(cache_path) == 0:
-                raise HTTPException(
-                    status_code=500,
-                    detail="Falha ao salvar arquivo temporário no cache"
-                )
-                
         except HTTPException:
             raise
         except Exception as file_error:
@@ -70,26 +175,38 @@ async def verificar_carta(
                 detail=f"Erro ao processar arquivo: {str(file_error)}"
             )
 
-        # 3. Processamento do PDF
+        # 3. Processamento do PDF (CPU-bound, roda no pool de processos)
         try:
-            # Abre e valida o PDF
-            pdf_document = fitz.open(cache_path)
-            if pdf_document.is_closed or pdf_document.page_count == 0:
-                raise ValueError("PDF inválido ou vazio")
-            
-            # Extrai o texto com verificação
-            carta_texto = "\n".join(
-                pagina.get_text("text") 
-                for pagina in pdf_document 
-                if pagina.get_text("text").strip()
+            # O PDF é gravado no cache (usado pelo juiz) enquanto o texto é extraído dos bytes
+            salvamento = asyncio.ensure_future(
+                executores.executar_io(_salvar_no_cache, cache_path, contents)
             )
-            
-            if not carta_texto.strip():
-                raise ValueError("PDF não contém texto legível")
-            
-            pdf_document.close()
-            
+
+            # Carta e registro do SILB iguais aos da última verificação: nada a extrair nem analisar
+            pdf_hash = hash_conteudo(contents)
+            registrado, catalog_data = None, None
+            if not force:
+                registrado, catalog_data = await executores.executar_io(
+                    verificacao_registrada, reference, pdf_hash, catalogacao_db, silb_db
+                )
+
+            # Um PDF idêntico já enviado antes reaproveita o texto extraído
+            if registrado is None:
+                carta_texto = await executores.executar_io(text_cache.obter, pdf_hash, LIMITE_TEXTO_PROMPT)
+                if carta_texto is None:
+                    # Só lê as páginas necessárias para o prompt de análise
+                    with ETAPAS_VERIFICACAO.medir(etapa="extracao_pdf"):
+                        carta_texto, completo = await executores.executar_cpu(
+                            extrair_texto, contents, LIMITE_TEXTO_PROMPT
+                        )
+                    await executores.executar_io(text_cache.salvar, pdf_hash, carta_texto, completo)
+
+            await salvamento
+
+        except HTTPException:
+            raise
         except Exception as pdf_error:
+            await asyncio.gather(salvamento, return_exceptions=True)
             if cache_path.exists():
                 cache_path.unlink()
             raise HTTPException(
@@ -98,35 +215,58 @@ async def verificar_carta(
             )
 
         # 4. Análise dos dados
+        if registrado is not None:
+            if stream:
+                return StreamingResponse(
+                    _eventos_registrados(registrado),
+                    media_type="text/event-stream",
+                    headers={"Cache-Control": "no-cache"}
+                )
+            return registrado
+
+        if stream:
+            # O gerador síncrono é consumido no pool de I/O, com o mesmo limite da análise sem streaming
+            return StreamingResponse(
+                executores.iterar_io(_eventos_analise(reference, carta_texto, pdf_hash, catalog_data)),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache"}
+            )
+
         try:
             
-            resultado = analyze_data(
+            # SILB, LLM e commits são bloqueantes: rodam no pool de threads
+            resultado = await executores.executar_io(
+                analyze_data,
                 reference=reference,
                 carta_texto=carta_texto,
                 catalogacao_db=catalogacao_db,
-                silb_db=silb_db
+                silb_db=silb_db,
+                pdf_hash=pdf_hash,
+                catalog_data=catalog_data
             )
            
             # Limpeza final
             '''
             if cache_path.exists():
                 cache_path.unlink()   
-            return resultado
             '''
+            return resultado
+        except LLMErro as llm_error:
+            # analyze_data só deixa passar falhas temporárias do LLM: o cliente pode reenviar mais tarde
+            retry_after = getattr(llm_error, "retry_after", None)
+            raise HTTPException(
+                status_code=503,
+                detail=f"Serviço de análise indisponível: {str(llm_error)}",
+                headers={"Retry-After": str(int(retry_after or 30))}
+            )
         except Exception as analysis_error:
             # Mantém o arquivo para debug em caso de erro na análise
             logger.error(f"Arquivo mantido em {cache_path} para análise do erro")
             
             # Registra erro no banco
-            erro = CatalogacaoErro(
-                reference=reference,
-                campo="sistema",
-                conteudo_errado="N/A",
-                motivo=f"Erro na análise: {str(analysis_error)}",
-                resposta_correta="Revisar processamento"
+            await executores.executar_io(
+                _registrar_erro_sistema, catalogacao_db, reference, analysis_error
             )
-            catalogacao_db.add(erro)
-            catalogacao_db.commit()
             
             raise HTTPException(
                 status_code=500,
@@ -147,27 +287,134 @@ async def verificar_carta(
             detail=f"Erro interno no servidor: {str(e)}"
         )
 
-@app.post("/julgar/")
-def julgar_erros_endpoint(
-    catalogacao_db: Session = Depends(get_catalogacao_db)  # Sessão do banco catalogacao
+@app.post("/verificar/lote/", status_code=202)
+def prefetch_lote(references: List[str] = Body(..., embed=True)):
+    """Pré-carrega os dados catalogados de um lote antes do envio das cartas"""
+    agendadas = catalog_prefetcher.agendar(references)
+    return {"recebidas": len(references), "agendadas": agendadas}
+
+@app.post("/jobs/", status_code=202)
+async def criar_job_verificacao(
+    reference: str = Query(...),
+    file: UploadFile = File(...),
+    force: bool = Query(False, description="Analisa de novo mesmo que a carta e o registro do SILB não tenham mudado"),
+    catalogacao_db: Session = Depends(get_catalogacao_db)
 ):
+    """Enfileira a verificação da carta e retorna o id do job imediatamente"""
+    contents = await file.read()
+    if not contents:
+        raise HTTPException(status_code=400, detail="O arquivo enviado está vazio")
+
+    # O PDF fica no cache para que o job sobreviva a um reinício do servidor. O nome é o hash
+    # do conteúdo: dois jobs da mesma reference não sobrescrevem o arquivo um do outro
+    cache_path = CACHE_DIR / "jobs" / f"{hash_conteudo(contents)}.pdf"
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
     try:
-        # Chama a função de julgamento
-        julgar_erros(catalogacao_db)
-        return {"message": "Julgamento concluído!"}
+        await executores.executar_io(_salvar_no_cache, cache_path, contents)
+        job = await executores.executar_io(
+            job_queue.enfileirar, catalogacao_db, reference, str(cache_path), force
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Falha ao enfileirar {reference}")
+        raise HTTPException(status_code=500, detail=f"Erro ao enfileirar job: {str(e)}")
+
+    return {"job_id": job.id, "reference": reference, "status": job.status}
+
+@app.get("/jobs/{job_id}")
+def consultar_job(
+    job_id: int,
+    catalogacao_db: Session = Depends(get_catalogacao_db)
+):
+    job = catalogacao_db.get(VerificacaoJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job_queue.serializar_job(job)
+
+@app.get("/stats/")
+def estatisticas(
+    catalogacao_db: Session = Depends(get_catalogacao_db)
+):
+    """Tamanho e ocupação dos pools de execução e da fila de jobs"""
+    return {
+        "pools": executores.estatisticas(),
+        "fila": job_queue.estatisticas(catalogacao_db),
+        "cache_texto": text_cache.estatisticas(),
+        "cache_catalogo": catalog_cache.estatisticas(),
+        "prefetch": catalog_prefetcher.estatisticas(),
+        "cache_llm": obter_cache_padrao().estatisticas() if obter_cache_padrao() else None,
+        "persistencia": escritor_catalogacao.estatisticas(),
+        "bancos": estatisticas_pools(),
+        "prompts": {
+            "analisador": PROMPT_ANALISE.estatisticas(),
+            "juiz": juiz.PROMPT_JUIZ.estatisticas(),
+        },
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def exportar_metricas():
+    """Latência por etapa, chamadas e tokens do LLM, lotes gravados e ocupação no formato do Prometheus"""
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4")
+
+@app.delete("/catalogo/{reference}")
+def invalidar_catalogo(reference: str):
+    """Descarta os dados do SILB em cache para a reference"""
+    removido = catalog_cache.invalidar(reference)
+    return {"reference": reference, "invalidado": removido}
+
+@app.post("/julgar/", status_code=202)
+def julgar_erros_endpoint():
+    """Inicia o julgamento em segundo plano; o andamento é consultado em /julgar/progresso/"""
+    try:
+        iniciado = juiz.iniciar_julgamento_em_segundo_plano()
+        return {
+            "message": "Julgamento iniciado" if iniciado else "Julgamento já em andamento",
+            "progresso": juiz.progresso.to_dict(),
+        }
 
     except Exception as e:
         logger.exception("Erro ao julgar erros")
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
+@app.get("/julgar/progresso/")
+def progresso_julgamento():
+    return juiz.progresso.to_dict()
+
+def _exportacao(montar_consulta, modelo, formato: str, depois_de: Optional[int]):
+    extensao = "ndjson" if formato == "ndjson" else "csv"
+    return StreamingResponse(
+        listagem.exportar(montar_consulta, modelo, formato, depois_de),
+        media_type=listagem.FORMATOS_EXPORTACAO[formato],
+        headers={"Content-Disposition": f"attachment; filename={modelo.__tablename__}.{extensao}"}
+    )
+
 @app.get("/erros/")
 def listar_erros(
+    reference: Optional[str] = Query(None),
+    campo: Optional[str] = Query(None),
+    julgado: Optional[bool] = Query(None),
+    origem: Optional[str] = Query(None, description="llm ou regra"),
+    data_inicio: Optional[datetime] = Query(None, description="data_registro a partir de (inclusive)"),
+    data_fim: Optional[datetime] = Query(None, description="data_registro antes de"),
+    depois_de: Optional[int] = Query(None, description="Cursor: o campo proximo da página anterior"),
+    limite: int = Query(100, ge=1, le=1000),
+    formato: str = Query("json", pattern="^(json|ndjson|csv)$", description="ndjson e csv exportam todas as linhas filtradas"),
     catalogacao_db: Session = Depends(get_catalogacao_db)  # Sessão do banco catalogacao
 ):
+    filtros = dict(reference=reference, campo=campo, julgado=julgado, origem=origem,
+                   data_inicio=data_inicio, data_fim=data_fim)
+    if formato != "json":
+        return _exportacao(
+            lambda db: listagem.consulta_erros(db, **filtros), CatalogacaoErro, formato, depois_de
+        )
+
     try:
-        # Retorna todos os erros registrados
-        erros = catalogacao_db.query(CatalogacaoErro).all()
-        return {"erros": erros}
+        # Retorna uma página dos erros registrados
+        erros, proximo = listagem.paginar(
+            listagem.consulta_erros(catalogacao_db, **filtros), CatalogacaoErro, depois_de, limite
+        )
+        return {"erros": erros, "proximo": proximo}
 
     except Exception as e:
         logger.exception("Erro ao listar erros")
@@ -175,13 +422,30 @@ def listar_erros(
 
 @app.get("/julgamentos/")
 def listar_julgamentos(
+    reference: Optional[str] = Query(None),
+    erro_id: Optional[int] = Query(None),
+    grau_certeza_min: Optional[float] = Query(None, ge=0, le=1),
+    data_inicio: Optional[datetime] = Query(None, description="data_julgamento a partir de (inclusive)"),
+    data_fim: Optional[datetime] = Query(None, description="data_julgamento antes de"),
+    depois_de: Optional[int] = Query(None, description="Cursor: o campo proximo da página anterior"),
+    limite: int = Query(100, ge=1, le=1000),
+    formato: str = Query("json", pattern="^(json|ndjson|csv)$", description="ndjson e csv exportam todas as linhas filtradas"),
     catalogacao_db: Session = Depends(get_catalogacao_db)  # Sessão do banco catalogacao
 ):
+    filtros = dict(reference=reference, erro_id=erro_id, grau_certeza_min=grau_certeza_min,
+                   data_inicio=data_inicio, data_fim=data_fim)
+    if formato != "json":
+        return _exportacao(
+            lambda db: listagem.consulta_julgamentos(db, **filtros), Julgamento, formato, depois_de
+        )
+
     try:
-        # Retorna todos os julgamentos registrados
-        julgamentos = catalogacao_db.query(Julgamento).all()
-        return {"julgamentos": julgamentos}
+        # Retorna uma página dos julgamentos registrados
+        julgamentos, proximo = listagem.paginar(
+            listagem.consulta_julgamentos(catalogacao_db, **filtros), Julgamento, depois_de, limite
+        )
+        return {"julgamentos": julgamentos, "proximo": proximo}
 
     except Exception as e:
         logger.exception("Erro ao listar julgamentos")
-        raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
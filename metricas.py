@@ -0,0 +1,199 @@
+"""
+Métricas no formato de texto do Prometheus (servidas em /metrics).
+
+Implementação própria e mínima (contadores, histogramas e medidores calculados na
+coleta) para não acrescentar dependências; os nomes seguem as convenções do Prometheus.
+"""
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Limites (em segundos) dos histogramas de latência: de leitura de cache a chamadas longas ao LLM
+LIMITES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_MAIS_INFINITO = 'le="+Inf"'
+
+_registro: List["_Metrica"] = []
+_registro_lock = threading.Lock()
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_rotulos(nomes: Sequence[str], valores: Sequence, extra: str = "") -> str:
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+        with _registro_lock:
+            _registro.append(self)
+
+    def _chave(self, rotulos: Dict) -> Tuple:
+        return tuple(str(rotulos.get(nome, "")) for nome in self.rotulos)
+
+    def _linhas(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def exportar(self) -> str:
+        cabecalho = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+        return "\n".join(cabecalho + list(self._linhas()))
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        super().__init__(nome, ajuda, rotulos)
+        self._valores: Dict[Tuple, float] = {}
+
+    def incrementar(self, valor: float = 1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def _linhas(self) -> Iterator[str]:
+        with self._lock:
+            valores = dict(self._valores)
+        for chave, valor in sorted(valores.items()):
+            yield f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_numero(valor)}"
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = (),
+                 limites: Sequence[float] = LIMITES_LATENCIA):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(sorted(limites))
+        # chave -> (contagem por faixa, soma, total)
+        self._series: Dict[Tuple, List] = {}
+
+    def observar(self, valor: float, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            serie = self._series.setdefault(chave, [[0] * len(self.limites), 0.0, 0])
+            posicao = bisect_left(self.limites, valor)
+            if posicao < len(self.limites):
+                serie[0][posicao] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def medir(self, **rotulos):
+        """Observa a duração do bloco, mesmo quando ele termina com exceção"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **rotulos)
+
+    def _linhas(self) -> Iterator[str]:
+        with self._lock:
+            series = {chave: (list(faixas), soma, total) for chave, (faixas, soma, total) in self._series.items()}
+        for chave, (faixas, soma, total) in sorted(series.items()):
+            acumulado = 0
+            for limite, quantidade in zip(self.limites, faixas):
+                acumulado += quantidade
+                rotulos = _formatar_rotulos(self.rotulos, chave, f'le="{_numero(limite)}"')
+                yield f"{self.nome}_bucket{rotulos} {acumulado}"
+            yield f"{self.nome}_bucket{_formatar_rotulos(self.rotulos, chave, _MAIS_INFINITO)} {total}"
+            yield f"{self.nome}_sum{_formatar_rotulos(self.rotulos, chave)} {_numero(soma)}"
+            yield f"{self.nome}_count{_formatar_rotulos(self.rotulos, chave)} {total}"
+
+
+class MedidorColetado(_Metrica):
+    """Medidor lido na hora da coleta: a função retorna {valores dos rótulos: valor}"""
+    tipo = "gauge"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str], coletar: Callable[[], Dict[Tuple, float]]):
+        super().__init__(nome, ajuda, rotulos)
+        self._coletar = coletar
+
+    def _linhas(self) -> Iterator[str]:
+        try:
+            valores = self._coletar()
+        except Exception as e:
+            # Uma fonte indisponível (ex.: banco fora do ar) não derruba as demais métricas
+            logger.warning(f"Falha ao coletar {self.nome}: {str(e)}")
+            return
+        for chave, valor in sorted(valores.items()):
+            chave = chave if isinstance(chave, tuple) else (chave,)
+            yield f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {_numero(valor if valor is not None else 0)}"
+
+
+def exportar() -> str:
+    """Todas as métricas registradas no formato de texto 0.0.4"""
+    with _registro_lock:
+        metricas = list(_registro)
+    return "\n".join(metrica.exportar() for metrica in metricas) + "\n"
+
+
+# Métricas do pipeline
+
+ETAPAS_VERIFICACAO = Histograma(
+    "verificacao_etapa_segundos",
+    "Duração de cada etapa da verificação de uma carta",
+    ["etapa"],
+)
+ETAPAS_JULGAMENTO = Histograma(
+    "julgamento_etapa_segundos",
+    "Duração de cada etapa do julgamento dos erros",
+    ["etapa"],
+)
+LLM_CHAMADAS = Histograma(
+    "llm_chamada_segundos",
+    "Duração das chamadas ao backend de LLM, incluindo novas tentativas",
+    ["estagio", "model"],
+)
+LLM_TOKENS = Contador(
+    "llm_tokens_total",
+    "Tokens consumidos informados pelo backend de LLM",
+    ["estagio", "model"],
+)
+PERSISTENCIA_LOTES = Histograma(
+    "persistencia_lote_segundos",
+    "Duração do commit de cada lote do escritor em lote",
+    ["escritor"],
+)
+PERSISTENCIA_LINHAS = Contador(
+    "persistencia_linhas_total",
+    "Linhas gravadas pelo escritor em lote",
+    ["escritor"],
+)
+BANCO_ESPERA_CONEXAO = Histograma(
+    "banco_espera_conexao_segundos",
+    "Espera por uma conexão livre no pool de cada banco",
+    ["banco"],
+)
+BANCO_TIMEOUTS_CONEXAO = Contador(
+    "banco_timeouts_conexao_total",
+    "Checkouts que esgotaram o pool_timeout sem conseguir conexão",
+    ["banco"],
+)
+ERROS = Contador(
+    "erros_total",
+    "Falhas por componente e tipo de exceção",
+    ["componente", "tipo"],
+)
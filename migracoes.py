@@ -0,0 +1,219 @@
+"""
+Migrações do esquema do banco catalogacao.
+
+Cada migração roda uma única vez e fica registrada na tabela schema_versao. Elas são
+idempotentes (checam colunas e índices antes de criar), porque um banco novo já nasce
+com o esquema atual na migração 1 e bancos antigos podem ter parte das mudanças.
+
+No PostgreSQL os índices são criados com CREATE INDEX CONCURRENTLY, fora de transação,
+para não bloquear as gravações em tabelas grandes. O servidor aplica as pendentes ao
+iniciar (desligue com MIGRACOES_NO_STARTUP=0 para rodar só por esta linha de comando).
+
+Uso:
+    python migracoes.py            # aplica as pendentes
+    python migracoes.py --status   # lista as aplicadas e as pendentes
+"""
+import os
+import sys
+import argparse
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateIndex
+from models import Base, CatalogacaoErro, Julgamento
+import logging
+
+logger = logging.getLogger(__name__)
+
+_metadata = MetaData()
+schema_versao = Table(
+    "schema_versao", _metadata,
+    Column("versao", Integer, primary_key=True),
+    Column("descricao", String(200), nullable=False),
+    Column("data_aplicacao", DateTime, default=datetime.utcnow),
+)
+
+# Índices das consultas mais frequentes (fila do juiz, listagens e julgamentos por erro)
+INDICES_CONSULTAS = [
+    "ix_catalogacao_erros_pendentes",
+    "ix_catalogacao_erros_reference_campo",
+    "ix_julgamentos_erro_id",
+]
+
+# Com "0", o servidor não migra ao iniciar: as migrações rodam só por esta linha de comando
+MIGRACOES_NO_STARTUP = os.getenv("MIGRACOES_NO_STARTUP", "1") == "1"
+
+# Chave do advisory lock do PostgreSQL: dois workers do uvicorn não migram ao mesmo tempo
+_CHAVE_LOCK = 20250601
+
+
+class Migracao(NamedTuple):
+    versao: int
+    descricao: str
+    aplicar: Callable[[Connection], None]
+    # Roda fora de transação no PostgreSQL (ex.: CREATE INDEX CONCURRENTLY)
+    fora_de_transacao: bool = False
+
+
+def _colunas(conexao: Connection, tabela: str) -> set:
+    return {coluna["name"] for coluna in inspect(conexao).get_columns(tabela)}
+
+
+def _adicionar_coluna(tabela: str, coluna: str, definicao: str) -> Callable[[Connection], None]:
+    def aplicar(conexao: Connection):
+        if coluna not in _colunas(conexao, tabela):
+            conexao.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {definicao}"))
+    return aplicar
+
+
+def _criar_indice_concorrente(conexao: Connection, indice):
+    # Um CONCURRENTLY interrompido deixa o índice marcado como inválido: recomeça do zero
+    invalido = conexao.execute(text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :nome AND NOT i.indisvalid"
+    ), {"nome": indice.name}).first()
+    if invalido:
+        conexao.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {indice.name}"))
+    elif indice.name in {existente["name"] for existente in inspect(conexao).get_indexes(indice.table.name)}:
+        return
+
+    indice.dialect_options["postgresql"]["concurrently"] = True
+    try:
+        conexao.execute(CreateIndex(indice))
+    finally:
+        indice.dialect_options["postgresql"]["concurrently"] = False
+
+
+def _alterar_tamanho(tabela: str, coluna: str, tamanho: int) -> Callable[[Connection], None]:
+    def aplicar(conexao: Connection):
+        # O SQLite não impõe o tamanho de VARCHAR; só o PostgreSQL precisa do ALTER
+        if conexao.dialect.name == "postgresql":
+            conexao.execute(text(f"ALTER TABLE {tabela} ALTER COLUMN {coluna} TYPE VARCHAR({tamanho})"))
+    return aplicar
+
+
+def criar_indices(conexao: Connection, nomes: List[str] = INDICES_CONSULTAS):
+    """
+    Cria os índices declarados nos modelos que ainda não existem. No PostgreSQL a conexão
+    precisa estar em autocommit: os índices são criados sem bloquear as gravações
+    """
+    concorrente = conexao.dialect.name == "postgresql"
+    for tabela in (CatalogacaoErro.__table__, Julgamento.__table__):
+        for indice in tabela.indexes:
+            if indice.name not in nomes:
+                continue
+            if concorrente:
+                _criar_indice_concorrente(conexao, indice)
+            else:
+                indice.create(conexao, checkfirst=True)
+
+
+def _tabelas_iniciais(conexao: Connection):
+    Base.metadata.create_all(conexao)
+
+
+MIGRACOES = [
+    Migracao(1, "tabelas do catalogacao", _tabelas_iniciais),
+    Migracao(2, "coluna origem em catalogacao_erros",
+             _adicionar_coluna("catalogacao_erros", "origem", "VARCHAR(10) NOT NULL DEFAULT 'llm'")),
+    Migracao(3, "coluna forcar em verificacao_jobs",
+             _adicionar_coluna("verificacao_jobs", "forcar", "BOOLEAN NOT NULL DEFAULT '0'")),
+    Migracao(4, "índices da fila do juiz, das listagens e de julgamentos por erro", criar_indices,
+             fora_de_transacao=True),
+    Migracao(5, "coluna disponivel_em em verificacao_jobs",
+             _adicionar_coluna("verificacao_jobs", "disponivel_em", "TIMESTAMP")),
+    Migracao(6, "prompt_version com até 100 caracteres em verificacao_registros",
+             _alterar_tamanho("verificacao_registros", "prompt_version", 100)),
+]
+
+
+def _aplicadas(conexao: Connection) -> set:
+    return set(conexao.execute(select(schema_versao.c.versao)).scalars())
+
+
+def _registrar(conexao: Connection, migracao: Migracao):
+    conexao.execute(schema_versao.insert().values(
+        versao=migracao.versao, descricao=migracao.descricao, data_aplicacao=datetime.utcnow()
+    ))
+
+
+def _aplicar_fora_de_transacao(engine: Engine, migracao: Migracao):
+    conexao = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+    try:
+        # Criar índices em tabelas grandes pode passar do statement_timeout das conexões
+        conexao.execute(text("SET statement_timeout = 0"))
+        migracao.aplicar(conexao)
+        _registrar(conexao, migracao)
+    finally:
+        # O SET vale para a sessão inteira: a conexão não volta para o pool
+        conexao.invalidate()
+        conexao.close()
+
+
+def aplicar(engine: Engine, esperar: bool = True) -> Optional[List[int]]:
+    """
+    Aplica as migrações pendentes e retorna as versões aplicadas. No PostgreSQL um advisory
+    lock impede dois processos de migrarem ao mesmo tempo; com esperar=False, se outro
+    processo já está migrando, retorna None na hora em vez de esperar por ele
+    """
+    postgres = engine.dialect.name == "postgresql"
+    with engine.begin() as conexao:
+        schema_versao.create(conexao, checkfirst=True)
+
+    trava = engine.connect().execution_options(isolation_level="AUTOCOMMIT") if postgres else None
+    try:
+        if trava is not None:
+            # A espera pelo lock (e o lock em si) não podem cair no statement_timeout das conexões
+            trava.execute(text("SET statement_timeout = 0"))
+            if esperar:
+                trava.execute(text("SELECT pg_advisory_lock(:chave)"), {"chave": _CHAVE_LOCK})
+            elif not trava.execute(text("SELECT pg_try_advisory_lock(:chave)"), {"chave": _CHAVE_LOCK}).scalar():
+                logger.info("Outro processo está aplicando as migrações; seguindo sem esperar")
+                return None
+
+        with engine.connect() as conexao:
+            aplicadas = _aplicadas(conexao)
+
+        novas = []
+        for migracao in MIGRACOES:
+            if migracao.versao in aplicadas:
+                continue
+            logger.info(f"Aplicando migração {migracao.versao}: {migracao.descricao}")
+            if postgres and migracao.fora_de_transacao:
+                _aplicar_fora_de_transacao(engine, migracao)
+            else:
+                with engine.begin() as conexao:
+                    migracao.aplicar(conexao)
+                    _registrar(conexao, migracao)
+            novas.append(migracao.versao)
+        return novas
+    finally:
+        if trava is not None:
+            # Fechar a sessão libera o lock; a conexão sem timeout não volta para o pool
+            trava.invalidate()
+            trava.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Migrações do banco catalogacao")
+    parser.add_argument("--status", action="store_true", help="Só lista as migrações aplicadas e pendentes")
+    args = parser.parse_args(argv)
+
+    from db import catalogacao_engine
+
+    if args.status:
+        with catalogacao_engine.connect() as conexao:
+            aplicadas = _aplicadas(conexao) if inspect(conexao).has_table("schema_versao") else set()
+        for migracao in MIGRACOES:
+            situacao = "aplicada" if migracao.versao in aplicadas else "pendente"
+            print(f"{migracao.versao:>3}  {situacao:<9} {migracao.descricao}")
+        return
+
+    novas = aplicar(catalogacao_engine)
+    print(f"Migrações aplicadas: {novas}" if novas else "Esquema já está atualizado")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main(sys.argv[1:])
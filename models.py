@@ -1,8 +1,8 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Float, Date
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Float, Date, Index, UniqueConstraint, text
+from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 
+# Base única dos dois bancos; o esquema do catalogacao é criado e migrado por migracoes.py
 Base = declarative_base()
 
 class File(Base):
@@ -45,9 +45,21 @@ class Request(Base):
 
     files = relationship("FileRequests", back_populates="request")
 
+# Origem de um erro de catalogação: resposta do LLM ou conferência determinística
+ORIGEM_LLM = "llm"
+ORIGEM_REGRA = "regra"
+
 # Modelos para o banco 'catalogacao' (mantidos como estão)
 class CatalogacaoErro(Base):
     __tablename__ = "catalogacao_erros"
+    __table_args__ = (
+        # Fila do juiz: erros não julgados percorridos por (reference, id). Índice parcial
+        # no PostgreSQL e no SQLite; nos demais bancos vira um índice comum
+        Index("ix_catalogacao_erros_pendentes", "reference", "id",
+              postgresql_where=text("julgado = false"), sqlite_where=text("julgado = 0")),
+        # Listagem por carta (e por carta e campo) em /erros/
+        Index("ix_catalogacao_erros_reference_campo", "reference", "campo"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     reference = Column(String, nullable=False)
@@ -57,14 +69,48 @@ class CatalogacaoErro(Base):
     motivo = Column(String, nullable=False)
     julgado = Column(Boolean, default=False)
     resposta_correta = Column(Text)
+    origem = Column(String(10), nullable=False, default=ORIGEM_LLM, server_default=ORIGEM_LLM)
 
 class Julgamento(Base):
     __tablename__ = "julgamentos"
 
     id = Column(Integer, primary_key=True, index=True)
-    erro_id = Column(Integer, ForeignKey("catalogacao_erros.id"), nullable=False)
+    erro_id = Column(Integer, ForeignKey("catalogacao_erros.id"), nullable=False, index=True)
     reference = Column(String, nullable=False)
     resultado_analise = Column(Text, nullable=False)
     resposta_correta = Column(Text, nullable=False)
     grau_certeza = Column(Float)
-    data_julgamento = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    data_julgamento = Column(DateTime, default=datetime.utcnow)
+
+class VerificacaoJob(Base):
+    __tablename__ = "verificacao_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    reference = Column(String, nullable=False)
+    pdf_path = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pendente", index=True)  # pendente, processando, concluido, erro
+    tentativas = Column(Integer, default=0)
+    resultado = Column(Text)  # JSON retornado por analyze_data
+    erro = Column(Text)
+    forcar = Column(Boolean, nullable=False, default=False, server_default="0")  # Ignora o histórico de verificações
+    disponivel_em = Column(DateTime)  # Depois de uma falha transitória, só é reservado a partir daqui
+    data_criacao = Column(DateTime, default=datetime.utcnow)
+    data_inicio = Column(DateTime)
+    data_conclusao = Column(DateTime)
+
+class VerificacaoRegistro(Base):
+    """Última verificação bem-sucedida de uma carta com o mesmo PDF, registro do SILB, modelo e prompt"""
+    __tablename__ = "verificacao_registros"
+    __table_args__ = (
+        UniqueConstraint("reference", "pdf_hash", "catalog_hash", "model", "prompt_version",
+                         name="uq_verificacao_registro"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    reference = Column(String, nullable=False)
+    pdf_hash = Column(String(64), nullable=False)
+    catalog_hash = Column(String(64), nullable=False)
+    model = Column(String, nullable=False)
+    prompt_version = Column(String(100), nullable=False)
+    resultado = Column(Text, nullable=False)  # JSON retornado por analyze_data
+    data_verificacao = Column(DateTime, default=datetime.utcnow)
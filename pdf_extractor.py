@@ -0,0 +1,76 @@
+import os
+import time
+from typing import Iterator, Optional, Tuple
+import fitz  # PyMuPDF
+import logging
+from dotenv import load_dotenv
+
+# Carrega as variáveis do arquivo .env
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Páginas que levam mais que isso são registradas como suspeitas (scans problemáticos)
+PDF_PAGINA_LENTA_S = float(os.getenv("PDF_PAGINA_LENTA_S", "1.0"))
+
+
+def iterar_paginas(conteudo: bytes) -> Iterator[str]:
+    """
+    Abre o PDF a partir dos bytes e produz o texto de cada página não vazia,
+    chamando get_text uma única vez por página.
+    """
+    pdf_document = fitz.open(stream=conteudo, filetype="pdf")
+    try:
+        if pdf_document.is_closed or pdf_document.page_count == 0:
+            raise ValueError("PDF inválido ou vazio")
+
+        for numero, pagina in enumerate(pdf_document, start=1):
+            inicio = time.perf_counter()
+            texto = pagina.get_text("text")
+            duracao = time.perf_counter() - inicio
+
+            logger.debug(f"Página {numero}: {len(texto)} caracteres em {duracao * 1000:.1f} ms")
+            if duracao > PDF_PAGINA_LENTA_S:
+                logger.warning(f"Página {numero} lenta: {duracao:.2f}s para extrair {len(texto)} caracteres")
+
+            if texto.strip():
+                yield texto
+    finally:
+        pdf_document.close()
+
+
+def extrair_texto(conteudo: bytes, limite_caracteres: Optional[int] = None) -> Tuple[str, bool]:
+    """
+    Extrai o texto do PDF em uma única passada.
+    Com limite_caracteres, para de ler páginas assim que o limite é atingido.
+    Retorna o texto e se o documento foi lido por completo.
+    Função de módulo para poder ser executada no pool de processos.
+    """
+    inicio = time.perf_counter()
+    paginas = []
+    total = 0
+    completo = True
+
+    for texto in iterar_paginas(conteudo):
+        paginas.append(texto)
+        total += len(texto) + 1
+        if limite_caracteres and total >= limite_caracteres:
+            completo = False
+            break
+
+    carta_texto = "\n".join(paginas)
+    if not carta_texto.strip():
+        raise ValueError("PDF não contém texto legível")
+
+    logger.info(
+        f"Extraídas {len(paginas)} páginas ({len(carta_texto)} caracteres) "
+        f"em {time.perf_counter() - inicio:.2f}s"
+    )
+    return carta_texto, completo
+
+
+def extrair_texto_pdf(caminho: str) -> str:
+    """Extrai o texto completo de um PDF em disco"""
+    with open(caminho, "rb") as f:
+        carta_texto, _ = extrair_texto(f.read())
+    return carta_texto
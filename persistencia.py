@@ -0,0 +1,224 @@
+import os
+import time
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from db import CatalogacaoSessionLocal
+from metricas import ERROS, PERSISTENCIA_LINHAS, PERSISTENCIA_LOTES
+import logging
+from dotenv import load_dotenv
+
+# Carrega as variáveis do arquivo .env
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Um lote é gravado quando junta PERSISTENCIA_MAX_LINHAS linhas ou quando a linha mais
+# antiga espera PERSISTENCIA_INTERVALO_S, o que vier primeiro
+PERSISTENCIA_MAX_LINHAS = int(os.getenv("PERSISTENCIA_MAX_LINHAS", "500"))
+PERSISTENCIA_INTERVALO_S = float(os.getenv("PERSISTENCIA_INTERVALO_S", "0.2"))
+
+INSERIR = "inserir"
+ATUALIZAR = "atualizar"  # Update em massa pela chave primária (cada linha traz o "id")
+
+# (ação, modelo, linhas)
+Operacao = Tuple[str, type, List[Dict]]
+# Chamado pela thread do escritor antes de resolver o Future, com a exceção da gravação (ou None)
+AoConcluir = Optional[Callable[[Optional[Exception]], None]]
+
+
+class EscritorLote:
+    """
+    Grava inserts e updates de várias cartas (ou julgamentos) numa única transação.
+    Cada chamada a enfileirar retorna um Future resolvido quando o commit do lote que a
+    contém termina; quem precisa de durabilidade (ex.: antes de registrar a verificação
+    ou de responder ao cliente) espera por ele. Operações de uma mesma chamada sempre
+    entram juntas no mesmo commit, então uma queda nunca deixa só parte delas gravada.
+    Se o lote falha, cada chamada é gravada de novo sozinha: só a que tem a linha inválida falha.
+    """
+
+    def __init__(self, nome: str, criar_sessao: Callable[[], Session],
+                 max_linhas: int = PERSISTENCIA_MAX_LINHAS, intervalo: float = PERSISTENCIA_INTERVALO_S):
+        self.nome = nome
+        self.max_linhas = max_linhas
+        self.intervalo = intervalo
+        self._criar_sessao = criar_sessao
+        self._condicao = threading.Condition()
+        self._pendentes: List[Tuple[List[Operacao], Future, AoConcluir]] = []
+        self._linhas_pendentes = 0
+        self._em_gravacao: List[Future] = []
+        self._inicio_lote = 0.0
+        self._descarregar = False
+        self._encerrado = False
+        self._thread: Optional[threading.Thread] = None
+        self.lotes = 0
+        self.linhas = 0
+        self.falhas = 0
+        self._tempo_gravacao = 0.0
+        self._latencia_max = 0.0
+
+    def _iniciar(self):
+        # Criada sob demanda, como os pools de executores
+        if self._thread is None or not self._thread.is_alive():
+            self._encerrado = False
+            self._thread = threading.Thread(target=self._executar, name=f"escritor-{self.nome}", daemon=True)
+            self._thread.start()
+
+    def enfileirar(self, operacoes: List[Operacao], ao_concluir: AoConcluir = None) -> Future:
+        """
+        Agenda as operações para o próximo lote; o Future traz o número de linhas gravadas.
+        ao_concluir roda antes do Future ser resolvido, então já rodou quando descarregar retorna
+        """
+        operacoes = [(acao, modelo, linhas) for acao, modelo, linhas in operacoes if linhas]
+        futuro = Future()
+        if not operacoes:
+            if ao_concluir:
+                ao_concluir(None)
+            futuro.set_result(0)
+            return futuro
+
+        with self._condicao:
+            self._iniciar()
+            if not self._pendentes:
+                self._inicio_lote = time.monotonic()
+            self._pendentes.append((operacoes, futuro, ao_concluir))
+            self._linhas_pendentes += sum(len(linhas) for _, _, linhas in operacoes)
+            self._condicao.notify()
+        return futuro
+
+    def gravar(self, operacoes: List[Operacao]) -> int:
+        """Enfileira e espera o commit"""
+        return self.enfileirar(operacoes).result()
+
+    def descarregar(self):
+        """Grava já o que está pendente e espera o commit"""
+        with self._condicao:
+            futuros = self._em_gravacao + [futuro for _, futuro, _ in self._pendentes]
+            if self._pendentes:
+                self._descarregar = True
+                self._condicao.notify()
+        for futuro in futuros:
+            futuro.exception()  # Espera sem propagar: quem enfileirou trata a falha
+
+    def _executar(self):
+        while True:
+            with self._condicao:
+                while not self._pendentes and not self._encerrado:
+                    self._condicao.wait()
+                if not self._pendentes:
+                    return
+
+                # Espera o lote encher ou a linha mais antiga atingir o intervalo
+                prazo = self._inicio_lote + self.intervalo
+                while (self._linhas_pendentes < self.max_linhas and not self._descarregar
+                       and not self._encerrado):
+                    restante = prazo - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._condicao.wait(restante)
+
+                lote = self._pendentes
+                self._pendentes, self._linhas_pendentes, self._descarregar = [], 0, False
+                self._em_gravacao = [futuro for _, futuro, _ in lote]
+            self._gravar_lote(lote)
+
+    @staticmethod
+    def _concluir(futuro: Future, ao_concluir: AoConcluir, resultado: int, erro: Optional[Exception] = None):
+        if ao_concluir:
+            try:
+                ao_concluir(erro)
+            except Exception:
+                logger.exception("Erro no retorno de uma gravação em lote")
+        if erro is None:
+            futuro.set_result(resultado)
+        else:
+            futuro.set_exception(erro)
+
+    def _gravar_lote(self, lote: List[Tuple[List[Operacao], Future, AoConcluir]]):
+        erro = self._commit(lote)
+        if erro is None:
+            return
+        if len(lote) == 1:
+            self._falhar(lote, erro)
+            return
+
+        # Uma linha inválida não pode derrubar as chamadas de outras cartas do mesmo lote:
+        # cada chamada é repetida na sua própria transação e só a culpada falha
+        logger.warning(f"Lote de {len(lote)} chamadas ({self.nome}) falhou; gravando cada chamada separadamente")
+        for chamada in lote:
+            erro = self._commit([chamada])
+            if erro is not None:
+                self._falhar([chamada], erro)
+
+    def _commit(self, lote: List[Tuple[List[Operacao], Future, AoConcluir]]) -> Optional[Exception]:
+        """Grava as chamadas numa transação e resolve os Futures; em caso de falha, só retorna a exceção"""
+        # Junta as linhas de todas as chamadas por (ação, modelo): um executemany por grupo
+        grupos: Dict[Tuple[str, type], List[Dict]] = {}
+        for operacoes, _, _ in lote:
+            for acao, modelo, linhas in operacoes:
+                grupos.setdefault((acao, modelo), []).extend(linhas)
+        total = sum(len(linhas) for linhas in grupos.values())
+
+        inicio = time.perf_counter()
+        db = self._criar_sessao()
+        try:
+            for (acao, modelo), linhas in grupos.items():
+                instrucao = insert(modelo) if acao == INSERIR else update(modelo)
+                db.execute(instrucao, linhas)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            return e
+        finally:
+            db.close()
+
+        duracao = time.perf_counter() - inicio
+        with self._condicao:
+            self.lotes += 1
+            self.linhas += total
+            self._tempo_gravacao += duracao
+            self._latencia_max = max(self._latencia_max, duracao)
+        PERSISTENCIA_LOTES.observar(duracao, escritor=self.nome)
+        PERSISTENCIA_LINHAS.incrementar(total, escritor=self.nome)
+        logger.debug(f"Lote de {total} linhas ({len(lote)} chamadas) gravado em {duracao * 1000:.1f}ms")
+        for operacoes, futuro, ao_concluir in lote:
+            self._concluir(futuro, ao_concluir, sum(len(linhas) for _, _, linhas in operacoes))
+        return None
+
+    def _falhar(self, lote: List[Tuple[List[Operacao], Future, AoConcluir]], erro: Exception):
+        total = sum(len(linhas) for operacoes, _, _ in lote for _, _, linhas in operacoes)
+        with self._condicao:
+            self.falhas += 1
+        ERROS.incrementar(componente=f"escritor_{self.nome}", tipo=type(erro).__name__)
+        logger.error(f"Erro ao gravar {total} linhas ({self.nome}): {str(erro)}")
+        for _, futuro, ao_concluir in lote:
+            self._concluir(futuro, ao_concluir, 0, erro)
+
+    def estatisticas(self) -> Dict:
+        with self._condicao:
+            return {
+                "max_linhas": self.max_linhas,
+                "intervalo_s": self.intervalo,
+                "pendentes": self._linhas_pendentes,
+                "lotes": self.lotes,
+                "linhas": self.linhas,
+                "falhas": self.falhas,
+                "linhas_por_lote": round(self.linhas / self.lotes, 1) if self.lotes else None,
+                "linhas_por_segundo": round(self.linhas / self._tempo_gravacao) if self._tempo_gravacao else None,
+                "latencia_media_ms": round(self._tempo_gravacao / self.lotes * 1000, 2) if self.lotes else None,
+                "latencia_max_ms": round(self._latencia_max * 1000, 2) if self.lotes else None,
+            }
+
+    def encerrar(self):
+        """Grava o que falta e para a thread"""
+        with self._condicao:
+            self._encerrado = True
+            self._condicao.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+
+escritor_catalogacao = EscritorLote("catalogacao", CatalogacaoSessionLocal)
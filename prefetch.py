@@ -0,0 +1,109 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+from dotenv import load_dotenv
+
+# Carrega as variáveis do arquivo .env
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_MAX_ITENS = int(os.getenv("PREFETCH_MAX_ITENS", "2000"))
+PREFETCH_TAMANHO_LOTE = int(os.getenv("PREFETCH_TAMANHO_LOTE", "200"))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "2"))
+PREFETCH_ESPERA_MAX_S = float(os.getenv("PREFETCH_ESPERA_MAX_S", "300"))
+
+
+class CatalogPrefetcher:
+    """
+    Carrega os dados catalogados em lotes antes do estágio de LLM.
+    Os registros ficam num mapa limitado e são consumidos uma vez por reference.
+    """
+
+    def __init__(self,
+                 carregar_lote: Callable[[List[str]], Dict[str, Dict]],
+                 max_itens: int = PREFETCH_MAX_ITENS,
+                 tamanho_lote: int = PREFETCH_TAMANHO_LOTE,
+                 workers: int = PREFETCH_WORKERS):
+        self._carregar_lote = carregar_lote
+        self.max_itens = max_itens
+        self.tamanho_lote = tamanho_lote
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._registros: "OrderedDict[str, Tuple[Dict, float]]" = OrderedDict()
+        self._pendentes = set()
+        self._condicao = threading.Condition()
+
+        self.acertos = 0
+        self.falhas = 0
+        self.carregados = 0
+        self.descartados = 0
+        self._antecedencia_total = 0.0
+
+    def agendar(self, references: List[str]) -> int:
+        """Agenda o carregamento das references ainda não disponíveis; retorna quantas foram agendadas"""
+        with self._condicao:
+            novas = [
+                reference for reference in dict.fromkeys(references)
+                if reference not in self._registros and reference not in self._pendentes
+            ]
+            self._pendentes.update(novas)
+
+        for inicio in range(0, len(novas), self.tamanho_lote):
+            self._executor.submit(self._carregar, novas[inicio:inicio + self.tamanho_lote])
+        return len(novas)
+
+    def _carregar(self, lote: List[str]):
+        try:
+            registros = self._carregar_lote(lote)
+        except Exception as e:
+            logger.error(f"Falha no prefetch de {len(lote)} references: {str(e)}")
+            registros = {}
+
+        with self._condicao:
+            # Espera espaço no mapa; se os consumidores não aparecerem, descarta os mais antigos
+            limite = time.monotonic() + PREFETCH_ESPERA_MAX_S
+            while len(self._registros) + len(registros) > self.max_itens and time.monotonic() < limite:
+                self._condicao.wait(timeout=1.0)
+            while self._registros and len(self._registros) + len(registros) > self.max_itens:
+                self._registros.popitem(last=False)
+                self.descartados += 1
+
+            agora = time.monotonic()
+            for reference, dados in registros.items():
+                self._registros[reference] = (dados, agora)
+            self.carregados += len(registros)
+            self._pendentes.difference_update(lote)
+
+    def obter(self, reference: str) -> Optional[Dict]:
+        """Consome o registro pré-carregado da reference, se houver"""
+        with self._condicao:
+            registro = self._registros.pop(reference, None)
+            if registro is None:
+                self.falhas += 1
+                return None
+            dados, carregado_em = registro
+            self.acertos += 1
+            self._antecedencia_total += time.monotonic() - carregado_em
+            self._condicao.notify_all()
+        return dados
+
+    def estatisticas(self) -> Dict:
+        consultas = self.acertos + self.falhas
+        return {
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "taxa_acerto": round(self.acertos / consultas, 4) if consultas else None,
+            "antecedencia_media_s": round(self._antecedencia_total / self.acertos, 3) if self.acertos else None,
+            "carregados": self.carregados,
+            "descartados": self.descartados,
+            "em_memoria": len(self._registros),
+            "pendentes": len(self._pendentes),
+            "max_itens": self.max_itens,
+        }
+
+    def encerrar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,241 @@
+import os
+import re
+import json
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+from dotenv import load_dotenv
+
+# tiktoken é opcional: sem ele, os tokens são estimados em ~4 caracteres por token
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Carrega as variáveis do arquivo .env
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Janela de contexto dos modelos conhecidos; os demais usam a menor delas
+JANELAS_CONTEXTO = {
+    "gpt-4o-mini": 128000,
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-4": 8192,
+    "gpt-3.5-turbo": 16385,
+}
+JANELA_PADRAO = 8192
+
+MARCA_TRUNCADO = "[texto truncado]"
+
+# Orçamento padrão do prompt e espaço mínimo reservado ao texto da carta. Os ~10 mil caracteres
+# que o prompt original enviava dão cerca de 3000 tokens; com o modelo e o catálogo, ~6000
+PROMPT_MAX_TOKENS_PADRAO = 6000
+PROMPT_MIN_TOKENS_TEXTO_PADRAO = 3000
+
+
+class PromptSemEspacoErro(ValueError):
+    """A parte fixa do prompt não deixa espaço para o texto na janela do modelo"""
+
+_codificadores: Dict[str, object] = {}
+_codificadores_lock = threading.Lock()
+
+
+def _codificador(model: str):
+    if tiktoken is None:
+        return None
+    with _codificadores_lock:
+        if model not in _codificadores:
+            try:
+                _codificadores[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                # Modelos fora da OpenAI (ex.: Ollama) usam uma codificação aproximada
+                _codificadores[model] = tiktoken.get_encoding("cl100k_base")
+        return _codificadores[model]
+
+
+def contar_tokens(texto: str, model: str) -> int:
+    codificador = _codificador(model)
+    if codificador is None:
+        return (len(texto) + 3) // 4
+    return len(codificador.encode(texto, disallowed_special=()))
+
+
+def json_compacto(dados) -> str:
+    """JSON sem indentação nem espaços após separadores"""
+    return json.dumps(dados, ensure_ascii=False, separators=(",", ":"))
+
+
+def _cortar_em_palavra(texto: str, max_tokens: int, model: str) -> str:
+    """Maior prefixo que cabe no orçamento, terminando numa frase ou palavra inteira"""
+    inicio, fim = 0, len(texto)
+    while inicio < fim:  # Busca binária pelo número de caracteres
+        meio = (inicio + fim + 1) // 2
+        if contar_tokens(texto[:meio], model) <= max_tokens:
+            inicio = meio
+        else:
+            fim = meio - 1
+    prefixo = texto[:inicio]
+    for separador in (". ", "\n", " "):
+        posicao = prefixo.rfind(separador)
+        if posicao > len(prefixo) // 2:
+            return prefixo[:posicao + 1].rstrip()
+    return prefixo
+
+
+def ajustar_texto(texto: str, max_tokens: int, model: str) -> Tuple[str, bool]:
+    """
+    Corta o texto em limites de parágrafo para caber em max_tokens.
+    Retorna (texto, truncado); a marca de truncamento só é incluída quando há corte.
+    """
+    if contar_tokens(texto, model) <= max_tokens:
+        return texto, False
+
+    orcamento = max(0, max_tokens - contar_tokens(f"\n{MARCA_TRUNCADO}", model))
+    paragrafos = re.split(r"(\n\s*\n)", texto)
+    partes = []
+    usados = 0
+    for paragrafo in paragrafos:
+        tokens = contar_tokens(paragrafo, model)
+        if usados + tokens > orcamento:
+            restante = orcamento - usados
+            if not partes or restante > orcamento // 4:
+                # Parágrafo longo demais: aproveita o que sobra até a última palavra inteira
+                partes.append(_cortar_em_palavra(paragrafo, restante, model))
+            break
+        partes.append(paragrafo)
+        usados += tokens
+
+    return f"{''.join(partes).rstrip()}\n{MARCA_TRUNCADO}", True
+
+
+def _final_em_palavra(texto: str, max_tokens: int, model: str) -> str:
+    """Maior sufixo que cabe no orçamento, começando numa palavra inteira"""
+    inicio, fim = 0, len(texto)
+    while inicio < fim:  # Busca binária pela posição inicial
+        meio = (inicio + fim) // 2
+        if contar_tokens(texto[meio:], model) <= max_tokens:
+            fim = meio
+        else:
+            inicio = meio + 1
+    sufixo = texto[inicio:]
+    espaco = sufixo.find(" ")
+    return sufixo[espaco + 1:] if 0 <= espaco < len(sufixo) // 2 else sufixo
+
+
+def dividir_texto(texto: str, max_tokens: int, sobreposicao: int, model: str) -> List[str]:
+    """
+    Divide o texto em partes de até max_tokens, em limites de parágrafo (ou de palavra,
+    para parágrafos longos). Cada parte repete o final da anterior (sobreposicao tokens)
+    para que um trecho na fronteira apareça inteiro em pelo menos uma delas.
+    """
+    if max_tokens <= 0 or contar_tokens(texto, model) <= max_tokens:
+        return [texto]
+
+    sobreposicao = min(sobreposicao, max_tokens // 4)
+    capacidade = max_tokens - sobreposicao
+
+    partes, atual, usados = [], [], 0
+    for paragrafo in re.split(r"\n\s*\n", texto):
+        while paragrafo.strip():
+            tokens = contar_tokens(paragrafo, model)
+            if usados + tokens <= capacidade:
+                atual.append(paragrafo)
+                usados += tokens
+                break
+            restante = capacidade - usados
+            if not atual or restante > capacidade // 4:
+                # Parágrafo não cabe: completa a parte até a última palavra inteira
+                pedaco = _cortar_em_palavra(paragrafo, restante, model) or paragrafo
+                atual.append(pedaco)
+                paragrafo = paragrafo[len(pedaco):].lstrip()
+            partes.append("\n\n".join(atual))
+            atual, usados = [], 0
+    if atual:
+        partes.append("\n\n".join(atual))
+
+    for i in range(len(partes) - 1, 0, -1):
+        partes[i] = f"{_final_em_palavra(partes[i - 1], sobreposicao, model)}\n\n{partes[i]}"
+    return partes
+
+
+class ConstrutorPrompt:
+    """
+    Monta prompts de um estágio dentro de um orçamento de tokens. O orçamento vem de
+    PROMPT_MAX_TOKENS_<ESTAGIO>, limitado pela janela do modelo menos a resposta.
+    O texto sempre recebe ao menos PROMPT_MIN_TOKENS_TEXTO_<ESTAGIO>, mesmo que a parte
+    fixa (modelo e catálogo) ocupe o orçamento todo; aí o prompt passa do orçamento.
+    """
+
+    def __init__(self, estagio: str, model: str, max_tokens_resposta: int,
+                 orcamento: Optional[int] = None):
+        self.estagio = estagio
+        self.model = model
+        configurado = orcamento or int(os.getenv(f"PROMPT_MAX_TOKENS_{estagio.upper()}", PROMPT_MAX_TOKENS_PADRAO))
+        janela = JANELAS_CONTEXTO.get(model, JANELA_PADRAO)
+        self.maximo = janela - max_tokens_resposta
+        self.orcamento = min(configurado, self.maximo)
+        self.minimo_texto = min(
+            int(os.getenv(f"PROMPT_MIN_TOKENS_TEXTO_{estagio.upper()}", PROMPT_MIN_TOKENS_TEXTO_PADRAO)),
+            self.orcamento,
+        )
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.tokens = 0
+        self.truncados = 0
+
+    @property
+    def limite_caracteres(self) -> int:
+        """Texto a extrair do PDF: um pouco mais do que o orçamento comporta, para o corte ficar aqui"""
+        return self.orcamento * 5
+
+    def _orcamento_texto(self, fixos: int) -> int:
+        disponivel = self.maximo - fixos
+        if disponivel <= 0:
+            raise PromptSemEspacoErro(
+                f"Prompt {self.estagio}: a parte fixa ({fixos} tokens) não deixa espaço para o texto "
+                f"na janela do modelo ({self.maximo} tokens)"
+            )
+        return min(max(self.orcamento - fixos, self.minimo_texto), disponivel)
+
+    def orcamento_texto(self, modelo: Callable[[str], str]) -> int:
+        """Tokens para o texto depois da parte fixa do prompt, nunca menos que o mínimo reservado"""
+        return self._orcamento_texto(contar_tokens(modelo(""), self.model))
+
+    def montar(self, modelo: Callable[[str], str], texto: str) -> str:
+        """
+        modelo(texto) produz o prompt completo; a parte fixa é medida com o texto vazio
+        e o texto recebe o restante do orçamento.
+        """
+        fixos = contar_tokens(modelo(""), self.model)
+        if fixos + self.minimo_texto > self.orcamento:
+            logger.warning(
+                f"Prompt {self.estagio}: parte fixa de {fixos} tokens; o texto usa o mínimo reservado "
+                f"e o prompt passa do orçamento de {self.orcamento}"
+            )
+        texto, truncado = ajustar_texto(texto or "", self._orcamento_texto(fixos), self.model)
+        prompt = modelo(texto)
+        tokens = contar_tokens(prompt, self.model)
+
+        with self._lock:
+            self.prompts += 1
+            self.tokens += tokens
+            if truncado:
+                self.truncados += 1
+        logger.info(
+            f"Prompt {self.estagio}: {tokens} tokens (fixos {fixos}, orçamento {self.orcamento})"
+            f"{', texto truncado' if truncado else ''}"
+        )
+        return prompt
+
+    def estatisticas(self) -> Dict:
+        with self._lock:
+            return {
+                "model": self.model,
+                "orcamento": self.orcamento,
+                "prompts": self.prompts,
+                "tokens_medio": round(self.tokens / self.prompts, 1) if self.prompts else None,
+                "truncados": self.truncados,
+                "tokenizador": "tiktoken" if tiktoken is not None else "estimativa",
+            }
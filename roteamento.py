@@ -0,0 +1,149 @@
+import os
+import re
+import unicodedata
+from typing import Dict, List, NamedTuple
+from prompt_builder import contar_tokens
+from dotenv import load_dotenv
+
+# Carrega as variáveis do arquivo .env
+load_dotenv()
+
+# Tokens de texto da carta enviados em cada prompt focado
+ROTEAMENTO_MAX_TOKENS_TRECHO = int(os.getenv("ROTEAMENTO_MAX_TOKENS_TRECHO", "600"))
+
+# Blocos de texto maiores que isso são divididos nas quebras de linha
+_TAMANHO_BLOCO = 400
+
+
+class GrupoCampos(NamedTuple):
+    nome: str
+    descricao: str
+    campos: List[str]   # Campos traduzidos (valores de DataParser.FIELD_MAPPING)
+    termos: List[str]   # Radicais, sem acento, que indicam um trecho relevante
+
+
+# Observações, fontes e referência antiga não são conferíveis com o texto da carta
+# e ficam fora dos prompts focados
+GRUPOS_CAMPOS = [
+    GrupoCampos(
+        "partes", "os sesmeiros, seus procuradores e onde moram",
+        ["Nome", "Total de sesmeiros que solicitaram a sesmaria", "Capitania onde mora",
+         "Nome do procurador", "Nome do provedor", "Tipo de petição",
+         "Solicitaram repartição da terra em mesma medida"],
+        ["diz", "dizem", "morador", "suplicante", "sesmeir", "procurador", "provedor",
+         "capitao", "capitania", "filho", "viuva", "mulher", "herdeir", "irmao", "cada um"],
+    ),
+    GrupoCampos(
+        "datas", "as datas da petição e da concessão",
+        ["Data da petição", "Data da concessão"],
+        ["janeiro", "fevereiro", "marco", "abril", "maio", "junho", "julho", "agosto",
+         "setembro", "outubro", "novembro", "dezembro", "dias do mes", "ano de", "anno"],
+    ),
+    GrupoCampos(
+        "localizacao", "a localização da terra, seus limites e confrontantes",
+        ["Localidade", "Marcos Geográficos", "Ribeira", "Confrontantes", "Histórico da terra"],
+        ["ribeira", "rio", "riacho", "serra", "lagoa", "sitio", "olho", "extrem", "confront",
+         "pegando", "piao", "testada", "banda", "devolut", "acabam", "comecando", "chamad", "povoad"],
+    ),
+    GrupoCampos(
+        "area", "a área, a largura e o comprimento da terra",
+        ["Área", "Largura", "Comprimento"],
+        ["legua", "legoa", "braca", "largura", "comprimento", "de largo", "de comprido",
+         "quadra", "em quadro", "meia"],
+    ),
+    GrupoCampos(
+        "deferimento", "o despacho, a forma de deferimento e as exigências",
+        ["Despacho favorável", "Forma de Deferimento", "Exigências do Deferimento", "Justificativas"],
+        ["concedo", "conced", "hei por bem", "dou de sesmaria", "inform", "foro", "dizimo",
+         "confirma", "registr", "condic", "pagara", "ordenacao", "sem prejuizo", "cultiv"],
+    ),
+]
+
+_PALAVRA = re.compile(r"\w{4,}")
+_PADRAO_ANO = re.compile(r"\b1[5-8]\d\d\b")
+
+
+def _normalizar(texto: str) -> str:
+    """Minúsculas e sem acentos, para comparar com os termos dos grupos"""
+    decomposto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(caractere for caractere in decomposto if not unicodedata.combining(caractere))
+
+
+def _blocos(texto: str) -> List[str]:
+    """Divide a carta em frases; frases muito longas são quebradas nas linhas"""
+    blocos = []
+    for frase in re.split(r"(?<=[.;])\s+", texto):
+        atual = ""
+        for linha in frase.splitlines(keepends=True):
+            if len(atual) + len(linha) > _TAMANHO_BLOCO and atual.strip():
+                blocos.append(atual)
+                atual = ""
+            atual += linha
+        if atual.strip():
+            blocos.append(atual)
+    return blocos
+
+
+def agrupar_campos(catalog_data: Dict) -> Dict[str, Dict]:
+    """Dados catalogados de cada grupo; grupos sem nenhum campo preenchido ficam de fora"""
+    grupos = {}
+    for grupo in GRUPOS_CAMPOS:
+        dados = {campo: catalog_data[campo] for campo in grupo.campos if campo in catalog_data}
+        if dados:
+            if "referencia" in catalog_data:
+                dados["referencia"] = catalog_data["referencia"]
+            grupos[grupo.nome] = dados
+    return grupos
+
+
+def _padrao(grupo: GrupoCampos, dados: Dict) -> re.Pattern:
+    # Palavras dos próprios valores catalogados (nomes, lugares) também indicam o trecho
+    termos = set(grupo.termos)
+    for campo in grupo.campos:
+        if campo in dados:
+            termos.update(_PALAVRA.findall(_normalizar(str(dados[campo]))))
+    alternativas = "|".join(sorted((re.escape(termo) for termo in termos), key=len, reverse=True))
+    return re.compile(rf"\b(?:{alternativas})")
+
+
+def selecionar_trechos(texto: str, grupo: GrupoCampos, dados: Dict, model: str,
+                       max_tokens: int = ROTEAMENTO_MAX_TOKENS_TRECHO) -> str:
+    """
+    Escolhe os blocos da carta com mais termos do grupo (e seus vizinhos imediatos) até
+    max_tokens, mantendo a ordem original. Sem nenhum termo encontrado, usa o início da carta.
+    """
+    blocos = _blocos(texto)
+    padrao = _padrao(grupo, dados)
+    pontuacoes = []
+    for posicao, bloco in enumerate(blocos):
+        normalizado = _normalizar(bloco)
+        pontos = len(padrao.findall(normalizado))
+        if grupo.nome == "datas":
+            pontos += 2 * len(_PADRAO_ANO.findall(normalizado))
+        pontuacoes.append((pontos, posicao))
+
+    escolhidos = set()
+    usados = 0
+    candidatos = [posicao for pontos, posicao in sorted(pontuacoes, key=lambda item: (-item[0], item[1])) if pontos]
+    if not candidatos:
+        candidatos = list(range(len(blocos)))
+
+    for posicao in candidatos:
+        # O bloco seguinte costuma completar a frase que o termo começou
+        for vizinho in (posicao, posicao + 1):
+            if vizinho >= len(blocos) or vizinho in escolhidos:
+                continue
+            tokens = contar_tokens(blocos[vizinho], model)
+            if usados + tokens > max_tokens:
+                continue
+            escolhidos.add(vizinho)
+            usados += tokens
+
+    trechos = []
+    anterior = None
+    for posicao in sorted(escolhidos):
+        if anterior is not None and posicao != anterior + 1:
+            trechos.append("[...]")
+        trechos.append(blocos[posicao].strip())
+        anterior = posicao
+    return "\n".join(trechos)
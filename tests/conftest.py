@@ -0,0 +1,23 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Os módulos criam engines e clientes ao serem importados: os testes não usam rede nem bancos reais
+os.environ.setdefault("SILB_DATABASE_URL", "sqlite://")
+os.environ.setdefault("CATALOGACAO_DATABASE_URL", "sqlite://")
+os.environ.setdefault("OPENAI_API_KEY", "teste")
+os.environ["LLM_CACHE_ATIVO"] = "0"
+
+
+@pytest.fixture
+def catalogacao_sessoes():
+    """Banco catalogacao em memória, com o esquema de models.py"""
+    from models import Base
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
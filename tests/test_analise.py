@@ -0,0 +1,139 @@
+import json
+import time
+
+import pytest
+
+import data_comparator
+from data_comparator import HistoricalDocumentAnalyzer, verificacao_registrada
+from gpt_client import GPTClient
+from limitador import LimitadorTaxa
+from llm_backends import LLMBackend, RespostaLLM
+from persistencia import EscritorLote
+from prefetch import CatalogPrefetcher
+
+REFERENCE = "PE-AL0001"
+REGISTRO_API = {"reference": REFERENCE, "landrecord_location": "Olinda", "captaincy_name": "Pernambuco"}
+CARTA = "Carta de sesmaria de terras em Olinda, capitania de Pernambuco."
+RESPOSTA = json.dumps({
+    "erros": [{"campo": "Localidade", "valor_incorreto": "Olinda", "valor_correto": "Recife", "motivo": "texto"}],
+    "analise_geral": "Um erro.",
+})
+
+
+class BackendFixo(LLMBackend):
+    nome = "fixo"
+
+    def __init__(self, resposta: str):
+        self.resposta = resposta
+        self.chamadas = 0
+
+    def completar(self, messages, model, temperature, max_tokens, timeout):
+        self.chamadas += 1
+        return RespostaLLM(self.resposta, 10)
+
+
+@pytest.fixture
+def ambiente(monkeypatch, catalogacao_sessoes):
+    """Analisador com LLM, SILB, prefetch e escritor locais"""
+    backend = BackendFixo(RESPOSTA)
+    monkeypatch.setattr(data_comparator, "GPT_CLIENT", GPTClient(
+        api_key="teste", backend=backend, limitador=LimitadorTaxa(0, 0), estagio="teste"
+    ))
+
+    buscas = []
+
+    def buscar_na_api(reference, usar_cache=True):
+        buscas.append(reference)
+        return dict(REGISTRO_API)
+
+    monkeypatch.setattr(data_comparator.SILBDataFetcher, "fetch_catalog_data", staticmethod(buscar_na_api))
+    prefetcher = CatalogPrefetcher(lambda references: {reference: dict(REGISTRO_API) for reference in references})
+    monkeypatch.setattr(data_comparator, "catalog_prefetcher", prefetcher)
+
+    escritor = EscritorLote("teste", catalogacao_sessoes, intervalo=0.01)
+    monkeypatch.setattr(data_comparator, "escritor_catalogacao", escritor)
+
+    yield {"backend": backend, "buscas": buscas, "prefetcher": prefetcher, "sessoes": catalogacao_sessoes}
+    escritor.encerrar()
+    prefetcher.encerrar()
+
+
+def _aguardar_prefetch(prefetcher: CatalogPrefetcher):
+    limite = time.monotonic() + 5
+    while prefetcher.estatisticas()["em_memoria"] == 0 and time.monotonic() < limite:
+        time.sleep(0.01)
+
+
+def test_catalogo_do_historico_segue_para_a_analise(ambiente):
+    prefetcher = ambiente["prefetcher"]
+    prefetcher.agendar([REFERENCE])
+    _aguardar_prefetch(prefetcher)
+    db = ambiente["sessoes"]()
+
+    registrado, catalog_data = verificacao_registrada(REFERENCE, "hash", db, None)
+    resultado = HistoricalDocumentAnalyzer.analyze_document(REFERENCE, CARTA, db, None, "hash", catalog_data)
+
+    assert registrado is None
+    assert catalog_data["Localidade"] == "Olinda"
+    assert resultado["status"] == "success"
+    # O registro do prefetch é consumido uma única vez e a API não é consultada
+    assert prefetcher.estatisticas()["acertos"] == 1
+    assert prefetcher.estatisticas()["falhas"] == 0
+    assert ambiente["buscas"] == []
+    db.close()
+
+
+def test_resposta_truncada_nao_entra_no_historico(ambiente):
+    ambiente["backend"].resposta = RESPOSTA[:-30]
+    db = ambiente["sessoes"]()
+
+    _, catalog_data = verificacao_registrada(REFERENCE, "hash", db, None)
+    resultado = HistoricalDocumentAnalyzer.analyze_document(REFERENCE, CARTA, db, None, "hash", catalog_data)
+    registrado, _ = verificacao_registrada(REFERENCE, "hash", db, None)
+
+    assert resultado["truncada"] is True
+    assert resultado["erros_identificados"][0]["campo"] == "Localidade"
+    # A próxima verificação da mesma carta chama o LLM de novo
+    assert registrado is None
+    db.close()
+
+
+def test_resposta_completa_e_reaproveitada(ambiente):
+    db = ambiente["sessoes"]()
+
+    _, catalog_data = verificacao_registrada(REFERENCE, "hash", db, None)
+    resultado = HistoricalDocumentAnalyzer.analyze_document(REFERENCE, CARTA, db, None, "hash", catalog_data)
+    registrado, _ = verificacao_registrada(REFERENCE, "hash", db, None)
+
+    assert resultado["truncada"] is False
+    assert registrado["erros_identificados"] == resultado["erros_identificados"]
+    assert ambiente["backend"].chamadas == 1
+    db.close()
+
+
+def test_trecho_truncado_marca_o_resultado_combinado():
+    combinado = HistoricalDocumentAnalyzer._combinar([
+        {"parte": 1, "erros": [], "analise_geral": "", "truncada": True},
+        {"parte": 0, "erros": [], "analise_geral": "ok"},
+    ])
+
+    assert combinado["truncada"] is True
+
+
+def test_verificacao_forcada_substitui_os_erros_anteriores(ambiente):
+    from models import CatalogacaoErro
+
+    db = ambiente["sessoes"]()
+    _, catalog_data = verificacao_registrada(REFERENCE, "hash", db, None)
+    HistoricalDocumentAnalyzer.analyze_document(REFERENCE, CARTA, db, None, "hash", catalog_data)
+    julgado = CatalogacaoErro(reference=REFERENCE, campo="Data", conteudo_errado="1698",
+                              motivo="julgado antes", julgado=True)
+    db.add(julgado)
+    db.commit()
+
+    # Verificação forçada: o histórico não é consultado e o registro é sobrescrito
+    HistoricalDocumentAnalyzer.analyze_document(REFERENCE, CARTA, db, None, "hash", catalog_data)
+
+    erros = db.query(CatalogacaoErro).filter_by(reference=REFERENCE).all()
+    assert sorted((erro.campo, erro.julgado) for erro in erros) == [("Data", True), ("Localidade", False)]
+    db.close()
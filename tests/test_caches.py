@@ -0,0 +1,25 @@
+from catalog_cache import CatalogCache
+from text_cache import TextCache
+
+
+def test_cache_do_catalogo_cria_o_arquivo_na_primeira_gravacao(tmp_path):
+    caminho = tmp_path / "cache" / "silb.sqlite3"
+    cache = CatalogCache(caminho)
+    assert not caminho.exists()
+
+    cache.salvar("PE-AL0001", {"Localidade": "Olinda"}, etag="v1")
+
+    assert caminho.exists()
+    assert CatalogCache(caminho).obter("PE-AL0001").etag == "v1"
+
+
+def test_cache_de_texto_cria_o_diretorio_na_primeira_gravacao(tmp_path):
+    diretorio = tmp_path / "cache" / "texto"
+    cache = TextCache(diretorio)
+    assert cache.obter("hash") is None
+    assert not diretorio.exists()
+
+    cache.salvar("hash", "texto da carta")
+
+    assert cache.obter("hash") == "texto da carta"
+    assert TextCache(diretorio).estatisticas()["tamanho_mb"] == cache.estatisticas()["tamanho_mb"]
@@ -0,0 +1,28 @@
+import pytest
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+import db
+import metricas
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    """Pool de uma conexão só, com pool_timeout curto"""
+    monkeypatch.setattr(db, "_engines", {})
+    monkeypatch.setattr(db, "_metricas", {})
+    monkeypatch.setenv("TESTE_DB_POOL_TIMEOUT", "0.05")
+    engine = db.criar_engine("teste", "sqlite://", pool_size=1, max_overflow=0,
+                             pool_recycle=-1, statement_timeout_ms=0)
+    yield engine
+    engine.dispose()
+
+
+def test_esperas_e_timeouts_do_pool_saem_em_metrics(engine):
+    with engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+
+    exportado = metricas.exportar()
+    assert 'banco_espera_conexao_segundos_count{banco="teste"} 1' in exportado
+    assert 'banco_timeouts_conexao_total{banco="teste"} 1' in exportado
+    assert db.estatisticas_pools()["teste"]["timeouts"] == 1
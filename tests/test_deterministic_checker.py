@@ -0,0 +1,135 @@
+import pytest
+
+from data_comparator import DeterministicChecker
+
+ENCHIMENTO = " ".join(["e mais terras ao redor do rio"] * 8)
+
+
+def _carta(peticao: str, concessao: str) -> str:
+    # As datas ficam a mais de _JANELA_DATA caracteres uma da palavra-chave da outra
+    return (
+        f"Diz o suplicante em sua Petição, feita em {peticao}, que deseja terras. {ENCHIMENTO}. "
+        f"Hei por bem fazer a Concessão em {concessao} das terras pedidas."
+    )
+
+
+def test_datas_iguais_as_da_carta_sao_confirmadas():
+    carta = _carta("3 de maio de 1700", "10 de junho de 1701")
+    catalogo = {"Data da petição": "1700-05-03", "Data da concessão": "10/06/1701"}
+
+    erros, resolvidos = DeterministicChecker.check(catalogo, carta)
+
+    assert erros == []
+    assert resolvidos == {"Data da petição", "Data da concessão"}
+
+
+def test_datas_trocadas_ficam_para_o_llm():
+    carta = _carta("3 de maio de 1700", "10 de junho de 1701")
+    catalogo = {"Data da petição": "1701-06-10", "Data da concessão": "1700-05-03"}
+
+    erros, resolvidos = DeterministicChecker.check(catalogo, carta)
+
+    assert erros == []
+    assert resolvidos == set()
+
+
+def test_data_com_um_componente_diferente_e_apontada():
+    carta = _carta("3 de maio de 1700", "10 de junho de 1701")
+    catalogo = {"Data da petição": "1700-05-08"}
+
+    erros, resolvidos = DeterministicChecker.check(catalogo, carta)
+
+    assert resolvidos == {"Data da petição"}
+    assert erros[0]["valor_correto"] == "1700-05-03"
+
+
+def test_data_longe_de_palavra_chave_nao_conta():
+    carta = f"Feito em 3 de maio de 1700. {ENCHIMENTO}."
+
+    _, resolvidos = DeterministicChecker.check({"Data da petição": "1700-05-03"}, carta)
+
+    assert resolvidos == set()
+
+
+def test_medidas_em_leguas_sao_conferidas():
+    carta = "Pede duas léguas de terra de comprido e uma légua e meia de largo no sertão."
+    catalogo = {"Comprimento": "2 léguas", "Largura": "1 légua"}
+
+    erros, resolvidos = DeterministicChecker.check(catalogo, carta)
+
+    assert resolvidos == {"Comprimento", "Largura"}
+    assert [erro["campo"] for erro in erros] == ["Largura"]
+    assert erros[0]["valor_correto"] == "1.5 léguas"
+
+
+def test_legua_em_quadro_vale_para_as_duas_dimensoes():
+    carta = "Pede uma légua de terra em quadro."
+
+    erros, resolvidos = DeterministicChecker.check({"Comprimento": "1 légua", "Largura": "1"}, carta)
+
+    assert erros == []
+    assert resolvidos == {"Comprimento", "Largura"}
+
+
+def test_medida_em_bracas_fica_para_o_llm():
+    carta = "Pede quinhentas braças de terra de comprido."
+
+    _, resolvidos = DeterministicChecker.check({"Comprimento": "500 braças"}, carta)
+
+    assert resolvidos == set()
+
+
+def test_datas_por_extenso_sao_conferidas():
+    carta = (
+        "Diz o suplicante em sua Petição, feita aos vinte e tres dias do mês de maio de mil setecentos "
+        f"e dois, que deseja terras. {ENCHIMENTO}. Hei por bem fazer a Concessão no primeiro dia do mês "
+        "de junho do ano de mil e setecentos e tres das terras pedidas."
+    )
+    catalogo = {"Data da petição": "1702-05-23", "Data da concessão": "01/06/1703"}
+
+    erros, resolvidos = DeterministicChecker.check(catalogo, carta)
+
+    assert erros == []
+    assert resolvidos == {"Data da petição", "Data da concessão"}
+
+
+def test_data_por_extenso_com_um_componente_diferente_e_apontada():
+    carta = "Diz em sua petição, aos dezoito dias do mês de setembro de mil seiscentos e noventa e oito, que"
+
+    erros, _ = DeterministicChecker.check({"Data da petição": "1698-09-08"}, carta)
+
+    assert erros[0]["valor_correto"] == "1698-09-18"
+
+
+TOTAL = DeterministicChecker.CAMPO_TOTAL_SESMEIROS
+CARTA_SESMEIROS = "Dizem Apolinário Fernandes Padilha e Gonçalo de Serqueira, moradores nesta capitania, que"
+
+
+def test_total_de_sesmeiros_igual_aos_nomeados_na_carta():
+    catalogo = {"Nome": "Apolinário Fernandes Padilha e Gonçalo de Serqueira", TOTAL: "2"}
+
+    erros, resolvidos = DeterministicChecker.check(catalogo, CARTA_SESMEIROS)
+
+    assert erros == []
+    assert resolvidos == {TOTAL}
+
+
+def test_total_de_sesmeiros_menor_que_os_nomeados_e_apontado():
+    catalogo = {"Nome": "Apolinário Fernandes Padilha; Gonçalo de Serqueira", TOTAL: "1"}
+
+    erros, resolvidos = DeterministicChecker.check(catalogo, CARTA_SESMEIROS)
+
+    assert resolvidos == {TOTAL}
+    assert erros[0]["valor_correto"] == "2"
+
+
+@pytest.mark.parametrize("nomes, total", [
+    ("Apolinário Fernandes Padilha", "2"),  # A carta pode nomear sesmeiros que o campo Nome não lista
+    ("Apolinário Fernandes Padilha e Manuel Rodrigues", "2"),  # Nome que não aparece na carta
+    ("Apolinário Fernandes Padilha e outros", "3"),
+])
+def test_total_de_sesmeiros_inconclusivo_fica_para_o_llm(nomes, total):
+    erros, resolvidos = DeterministicChecker.check({"Nome": nomes, TOTAL: total}, CARTA_SESMEIROS)
+
+    assert erros == []
+    assert resolvidos == set()
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+import time
+
+from executores import PoolLimitado, iterar_io
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _pool(max_concorrente: int = 2) -> PoolLimitado:
+    return PoolLimitado("teste", lambda workers: ThreadPoolExecutor(max_workers=workers), 4, max_concorrente)
+
+
+def test_submeter_respeita_o_limite_do_pool():
+    pool = _pool()
+    liberar = threading.Event()
+    ocupadas = [pool.submeter(liberar.wait) for _ in range(2)]
+
+    terceira = []
+    thread = threading.Thread(target=lambda: terceira.append(pool.submeter(time.sleep, 0)))
+    thread.start()
+    time.sleep(0.1)
+
+    assert terceira == []
+    assert pool.estatisticas()["em_espera"] == 1
+    liberar.set()
+    thread.join(timeout=5)
+    terceira[0].result(timeout=5)
+    for futuro in ocupadas:
+        futuro.result(timeout=5)
+    assert pool.estatisticas()["concluidas"] == 3
+    pool.encerrar()
+
+
+def test_executar_espera_as_vagas_ocupadas_por_submeter():
+    pool = _pool(max_concorrente=1)
+    liberar = threading.Event()
+    ocupada = pool.submeter(liberar.wait)
+
+    async def executar():
+        tarefa = asyncio.ensure_future(pool.executar(lambda: "ok"))
+        await asyncio.sleep(0.1)
+        assert not tarefa.done()
+        liberar.set()
+        return await tarefa
+
+    assert asyncio.run(executar()) == "ok"
+    ocupada.result(timeout=5)
+    pool.encerrar()
+
+
+def test_iterar_io_consome_e_fecha_o_gerador():
+    fechado = []
+
+    def gerador():
+        try:
+            yield 1
+            yield 2
+        finally:
+            fechado.append(threading.current_thread().name)
+
+    async def consumir():
+        return [item async for item in iterar_io(gerador())]
+
+    assert asyncio.run(consumir()) == [1, 2]
+    assert fechado and fechado[0].startswith("io")
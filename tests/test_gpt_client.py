@@ -0,0 +1,101 @@
+import pytest
+
+import gpt_client
+from gpt_client import GPTClient
+from limitador import LimitadorTaxa
+from llm_backends import (LLMBackend, LLMIndisponivelErro, LLMLimiteTaxaErro,
+                          LLMRequisicaoInvalidaErro, RespostaLLM)
+from llm_cache import LLMCache
+
+
+class BackendStub(LLMBackend):
+    """Devolve as respostas (ou levanta os erros) da lista, uma por chamada"""
+
+    nome = "stub"
+
+    def __init__(self, *respostas):
+        self.respostas = list(respostas)
+        self.chamadas = 0
+
+    def completar(self, messages, model, temperature, max_tokens, timeout):
+        self.chamadas += 1
+        resposta = self.respostas.pop(0)
+        if isinstance(resposta, Exception):
+            raise resposta
+        return RespostaLLM(resposta, 10)
+
+
+@pytest.fixture(autouse=True)
+def sem_espera(monkeypatch):
+    """Registra o backoff calculado para cada nova tentativa, mas não espera"""
+    esperas = []
+    calcular_espera = gpt_client.calcular_espera
+
+    def registrar(tentativa, erro):
+        esperas.append(calcular_espera(tentativa, erro))
+        return 0.0
+
+    monkeypatch.setattr(gpt_client, "calcular_espera", registrar)
+    return esperas
+
+
+def _cliente(backend, cache=None, max_tentativas=3):
+    return GPTClient(api_key="teste", backend=backend, cache=cache, max_tentativas=max_tentativas,
+                     limitador=LimitadorTaxa(0, 0), estagio="teste")
+
+
+def test_falha_transitoria_e_repetida(sem_espera):
+    backend = BackendStub(LLMIndisponivelErro("503"), LLMLimiteTaxaErro("429", retry_after=2), "ok")
+
+    resposta = _cliente(backend).generate_content("sistema", "usuario")
+
+    assert resposta["response"] == "ok"
+    assert backend.chamadas == 3
+    assert len(sem_espera) == 2 and sem_espera[1] >= 2
+
+
+def test_falha_definitiva_nao_e_repetida():
+    backend = BackendStub(LLMRequisicaoInvalidaErro("400"), "ok")
+
+    with pytest.raises(LLMRequisicaoInvalidaErro):
+        _cliente(backend).generate_content("sistema", "usuario")
+    assert backend.chamadas == 1
+
+
+def test_tentativas_esgotadas_levantam_o_ultimo_erro():
+    backend = BackendStub(*[LLMIndisponivelErro("503")] * 2)
+
+    with pytest.raises(LLMIndisponivelErro):
+        _cliente(backend, max_tentativas=2).generate_content("sistema", "usuario")
+    assert backend.chamadas == 2
+
+
+def test_resposta_em_cache_nao_chama_o_backend(tmp_path):
+    backend = BackendStub("primeira", "segunda")
+    cliente = _cliente(backend, cache=LLMCache(tmp_path / "cache.sqlite3"))
+
+    assert cliente.generate_content("sistema", "usuario")["response"] == "primeira"
+    repetida = cliente.generate_content("sistema", "usuario")
+
+    assert repetida == {"response": "primeira", "tokens_used": 0, "cache": True}
+    assert backend.chamadas == 1
+
+
+def test_invalidar_descarta_a_resposta_do_cache(tmp_path):
+    backend = BackendStub("invalida", "valida")
+    cliente = _cliente(backend, cache=LLMCache(tmp_path / "cache.sqlite3"))
+
+    cliente.generate_content("sistema", "usuario")
+    cliente.invalidar("sistema", "usuario")
+
+    assert cliente.generate_content("sistema", "usuario")["response"] == "valida"
+    assert backend.chamadas == 2
+
+
+def test_stream_entrega_a_resposta_e_grava_no_cache(tmp_path):
+    backend = BackendStub("completa")
+    cliente = _cliente(backend, cache=LLMCache(tmp_path / "cache.sqlite3"))
+
+    assert list(cliente.generate_content_stream("sistema", "usuario")) == ["completa"]
+    assert list(cliente.generate_content_stream("sistema", "usuario")) == ["completa"]
+    assert backend.chamadas == 1
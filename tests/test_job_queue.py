@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import job_queue
+from models import VerificacaoJob
+
+
+@pytest.fixture
+def sessoes(monkeypatch, catalogacao_sessoes):
+    """Fila sobre o banco catalogacao em memória"""
+    monkeypatch.setattr(job_queue, "CatalogacaoSessionLocal", catalogacao_sessoes)
+    return catalogacao_sessoes
+
+
+def _criar_job(sessoes, **campos) -> int:
+    db = sessoes()
+    job = VerificacaoJob(reference="PE-AL0001", pdf_path="carta.pdf", **campos)
+    db.add(job)
+    db.commit()
+    job_id = job.id
+    db.close()
+    return job_id
+
+
+def _status(sessoes, job_id: int) -> str:
+    db = sessoes()
+    try:
+        return db.get(VerificacaoJob, job_id).status
+    finally:
+        db.close()
+
+
+def test_recuperacao_devolve_apenas_jobs_abandonados(sessoes):
+    antigo = datetime.utcnow() - timedelta(seconds=job_queue.JOB_TIMEOUT_S + 60)
+    abandonado = _criar_job(sessoes, status=job_queue.STATUS_PROCESSANDO, tentativas=1, data_inicio=antigo)
+    sem_inicio = _criar_job(sessoes, status=job_queue.STATUS_PROCESSANDO, tentativas=1)
+    em_andamento = _criar_job(sessoes, status=job_queue.STATUS_PROCESSANDO, tentativas=1,
+                              data_inicio=datetime.utcnow())
+
+    job_queue.recuperar_jobs_interrompidos()
+
+    assert _status(sessoes, abandonado) == job_queue.STATUS_PENDENTE
+    assert _status(sessoes, sem_inicio) == job_queue.STATUS_PENDENTE
+    # Pode estar rodando em outro worker ou réplica
+    assert _status(sessoes, em_andamento) == job_queue.STATUS_PROCESSANDO
+
+
+def test_recuperacao_encerra_jobs_sem_tentativas_restantes(sessoes):
+    antigo = datetime.utcnow() - timedelta(seconds=job_queue.JOB_TIMEOUT_S + 60)
+    esgotado = _criar_job(sessoes, status=job_queue.STATUS_PROCESSANDO,
+                          tentativas=job_queue.JOB_MAX_TENTATIVAS, data_inicio=antigo)
+
+    job_queue.recuperar_jobs_interrompidos()
+
+    db = sessoes()
+    job = db.get(VerificacaoJob, esgotado)
+    assert job.status == job_queue.STATUS_ERRO
+    assert job.data_conclusao is not None
+    db.close()
+
+
+def test_reserva_marca_o_inicio_do_processamento(sessoes):
+    job_id = _criar_job(sessoes, status=job_queue.STATUS_PENDENTE)
+    db = sessoes()
+
+    job = job_queue._reservar_proximo(db)
+
+    assert job.id == job_id
+    assert job.status == job_queue.STATUS_PROCESSANDO
+    assert job.tentativas == 1
+    assert job.data_inicio is not None
+    # Recém-reservado: a recuperação não o devolve para a fila
+    job_queue.recuperar_jobs_interrompidos()
+    assert _status(sessoes, job_id) == job_queue.STATUS_PROCESSANDO
+    db.close()
+
+
+def test_reserva_respeita_o_backoff_de_jobs_devolvidos(sessoes):
+    em_espera = _criar_job(sessoes, status=job_queue.STATUS_PENDENTE,
+                           disponivel_em=datetime.utcnow() + timedelta(minutes=5))
+    disponivel = _criar_job(sessoes, status=job_queue.STATUS_PENDENTE,
+                            disponivel_em=datetime.utcnow() - timedelta(seconds=1))
+    db = sessoes()
+
+    assert job_queue._reservar_proximo(db).id == disponivel
+    assert job_queue._reservar_proximo(db) is None
+    assert _status(sessoes, em_espera) == job_queue.STATUS_PENDENTE
+    db.close()
+
+
+def test_backoff_cresce_com_as_tentativas_e_respeita_o_retry_after():
+    from llm_backends import LLMLimiteTaxaErro
+
+    erro = LLMLimiteTaxaErro("limite de taxa")
+    assert job_queue._espera_nova_tentativa(1, erro) == job_queue.JOB_BACKOFF_BASE_S
+    assert job_queue._espera_nova_tentativa(2, erro) == 2 * job_queue.JOB_BACKOFF_BASE_S
+    assert job_queue._espera_nova_tentativa(50, erro) == job_queue.JOB_BACKOFF_MAX_S
+
+    erro = LLMLimiteTaxaErro("limite de taxa", retry_after=job_queue.JOB_BACKOFF_MAX_S * 2)
+    assert job_queue._espera_nova_tentativa(1, erro) == job_queue.JOB_BACKOFF_MAX_S * 2
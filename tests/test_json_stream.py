@@ -0,0 +1,74 @@
+import pytest
+
+from json_stream import ParserErrosIncremental, extrair_objeto, interpretar_resposta
+from llm_backends import LLMRespostaInvalidaErro
+
+RESPOSTA = (
+    '```json\n'
+    '{"erros": [\n'
+    '  {"campo": "Largura", "valor_incorreto": "1 légua", "valor_correto": "2 léguas", "motivo": "a carta diz {duas}"},\n'
+    '  {"campo": "Sesmeiro", "valor_incorreto": "João", "valor_correto": "José", "motivo": "aspas \\" e ] no texto"}\n'
+    '], "analise_geral": "Dois erros."}\n'
+    '```'
+)
+
+
+def alimentar_em_pedacos(texto: str, tamanho: int) -> ParserErrosIncremental:
+    parser = ParserErrosIncremental()
+    for inicio in range(0, len(texto), tamanho):
+        parser.alimentar(texto[inicio:inicio + tamanho])
+    return parser
+
+
+@pytest.mark.parametrize("tamanho", [1, 3, 7, len(RESPOSTA)])
+def test_pedacos_de_qualquer_tamanho_dao_o_mesmo_resultado(tamanho):
+    resultado = alimentar_em_pedacos(RESPOSTA, tamanho).finalizar()
+
+    assert [erro["campo"] for erro in resultado["erros"]] == ["Largura", "Sesmeiro"]
+    assert resultado["analise_geral"] == "Dois erros."
+    assert "truncada" not in resultado
+
+
+def test_erro_e_entregue_assim_que_o_objeto_fecha():
+    parser = ParserErrosIncremental()
+    corte = RESPOSTA.index("}", RESPOSTA.index("{duas}") + 6) + 1
+
+    assert parser.alimentar(RESPOSTA[:corte - 1]) == []
+    novos = parser.alimentar(RESPOSTA[corte - 1:corte])
+    assert [erro["campo"] for erro in novos] == ["Largura"]
+
+
+def test_chaves_e_colchetes_dentro_de_strings_sao_ignorados():
+    resultado = interpretar_resposta(RESPOSTA)
+
+    assert resultado["erros"][0]["motivo"] == "a carta diz {duas}"
+    assert resultado["erros"][1]["motivo"] == 'aspas " e ] no texto'
+
+
+def test_resposta_truncada_mantem_os_erros_completos():
+    truncada = RESPOSTA[:RESPOSTA.index('"valor_correto": "José"')]
+
+    resultado = alimentar_em_pedacos(truncada, 5).finalizar()
+
+    assert resultado["truncada"] is True
+    assert [erro["campo"] for erro in resultado["erros"]] == ["Largura"]
+
+
+def test_resposta_sem_json_e_invalida():
+    with pytest.raises(LLMRespostaInvalidaErro):
+        interpretar_resposta("Não encontrei erros.")
+
+
+@pytest.mark.parametrize("texto", [
+    '```json\n{"analise": "ok", "valor_correto_final": "Jason"}\n```',
+    '{"analise": "ok", "valor_correto_final": "Jason"}',
+    'Segue o veredito:\n```\n{"analise": "ok", "valor_correto_final": "Jason"}\n```\nObservação final.',
+])
+def test_extrair_objeto_tolera_cercas_e_texto_em_volta(texto):
+    assert extrair_objeto(texto) == {"analise": "ok", "valor_correto_final": "Jason"}
+
+
+@pytest.mark.parametrize("texto", ["", "sem JSON", '{"a": ', "[1, 2]"])
+def test_extrair_objeto_rejeita_respostas_sem_objeto(texto):
+    with pytest.raises(LLMRespostaInvalidaErro):
+        extrair_objeto(texto)
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+import juiz
+from gpt_client import GPTClient
+from limitador import LimitadorTaxa
+from llm_backends import LLMBackend, LLMLimiteTaxaErro, RespostaLLM
+
+ERROS = [
+    {"id": i, "reference": "PE-AL0001", "campo": "Localidade", "conteudo_errado": f"v{i}",
+     "resposta_correta": "Olinda", "motivo": "texto"}
+    for i in (1, 2, 3)
+]
+
+
+def _veredito(erro_id=None) -> dict:
+    veredito = {"analise": "ok", "valor_correto_final": "Olinda", "grau_certeza": 0.9, "correcao_necessaria": True}
+    if erro_id is not None:
+        veredito["erro_id"] = erro_id
+    return veredito
+
+
+class BackendRoteiro(LLMBackend):
+    """Responde o prompt agrupado com a primeira resposta e cada prompt individual com um veredito"""
+
+    nome = "roteiro"
+
+    def __init__(self, agrupada):
+        self.agrupada = agrupada
+        self.agrupadas = 0
+        self.individuais = 0
+
+    def completar(self, messages, model, temperature, max_tokens, timeout):
+        if "julgamentos" in messages[-1]["content"]:
+            self.agrupadas += 1
+            if isinstance(self.agrupada, Exception):
+                raise self.agrupada
+            return RespostaLLM(self.agrupada, 10)
+        self.individuais += 1
+        return RespostaLLM(json.dumps(_veredito()), 10)
+
+
+class TextosFixos:
+    def obter(self, reference):
+        return "Carta de sesmaria em Olinda."
+
+
+@pytest.fixture
+def julgar(monkeypatch):
+    def julgar(agrupada):
+        backend = BackendRoteiro(agrupada)
+        monkeypatch.setattr(juiz, "gpt_client", GPTClient(
+            api_key="teste", backend=backend, max_tentativas=1, limitador=LimitadorTaxa(0, 0), estagio="teste"
+        ))
+        return backend, juiz._julgar_grupo(ERROS, TextosFixos())
+    return julgar
+
+
+def test_grupo_julgado_num_unico_prompt(julgar):
+    resposta = json.dumps({"julgamentos": [_veredito(erro["id"]) for erro in ERROS]})
+
+    backend, resultados = julgar(f"```json\n{resposta}\n```")
+
+    assert (backend.agrupadas, backend.individuais) == (1, 0)
+    assert all(isinstance(resultado, dict) for _, resultado in resultados)
+
+
+def test_resposta_agrupada_malformada_recorre_a_prompts_individuais(julgar):
+    backend, resultados = julgar("não é JSON")
+
+    assert (backend.agrupadas, backend.individuais) == (1, 3)
+    assert all(isinstance(resultado, dict) for _, resultado in resultados)
+
+
+def test_so_os_vereditos_ausentes_ou_com_id_errado_sao_refeitos(julgar):
+    resposta = json.dumps({"julgamentos": [_veredito(1), _veredito(99), {"erro_id": 3}]})
+
+    backend, resultados = julgar(resposta)
+
+    assert (backend.agrupadas, backend.individuais) == (1, 2)
+    assert [erro["id"] for erro, _ in resultados] == [1, 2, 3]
+
+
+def test_limite_de_taxa_nao_multiplica_as_chamadas(julgar):
+    backend, resultados = julgar(LLMLimiteTaxaErro("429"))
+
+    assert (backend.agrupadas, backend.individuais) == (1, 0)
+    assert all(isinstance(resultado, LLMLimiteTaxaErro) for _, resultado in resultados)
+
+
+def test_veredito_com_texto_depois_da_cerca(julgar):
+    resposta = json.dumps({"julgamentos": [_veredito(erro["id"]) for erro in ERROS]})
+
+    backend, resultados = julgar(f"```json\n{resposta}\n```\nObservação: julgamentos conferidos.")
+
+    assert (backend.agrupadas, backend.individuais) == (1, 0)
@@ -0,0 +1,53 @@
+import json
+from pathlib import Path
+
+import pytest
+
+import juiz
+from gpt_client import GPTClient
+from limitador import LimitadorTaxa
+from llm_backends import ReplayBackend
+
+RESPOSTAS = Path(__file__).resolve().parent.parent / "respostas"
+
+ERROS = [
+    {"id": i, "reference": "PE-AL0001", "campo": "Localidade", "conteudo_errado": "Recife",
+     "resposta_correta": f"Gitihiba {i}", "motivo": "texto"}
+    for i in (7, 8)
+]
+
+
+@pytest.fixture
+def replay(monkeypatch):
+    cliente = GPTClient(api_key="teste", backend=ReplayBackend(RESPOSTAS), max_tentativas=1,
+                        limitador=LimitadorTaxa(0, 0), estagio="teste")
+    monkeypatch.setattr(juiz, "gpt_client", cliente)
+    return cliente
+
+
+def test_replay_devolve_a_resposta_gravada_da_reference(replay):
+    resposta = replay.generate_content("sistema", "Carta (Reference: PE-AL0001)")["response"]
+
+    assert "Gitihiba" in resposta
+
+
+def test_replay_julga_o_prompt_agrupado_do_juiz(replay):
+    prompt = juiz.montar_prompt_agrupado("PE-AL0001", ERROS, "Texto da carta.")
+
+    resposta, _ = juiz.chamar_juiz(prompt)
+
+    assert [veredito["erro_id"] for veredito in resposta["julgamentos"]] == [7, 8]
+    assert resposta["julgamentos"][1]["valor_correto_final"] == "Gitihiba 8"
+
+
+def test_replay_julga_o_prompt_individual_do_juiz(replay):
+    resposta, _ = juiz.chamar_juiz(juiz.montar_prompt(ERROS[0], "Texto da carta."))
+
+    assert resposta["valor_correto_final"] == "Gitihiba 7"
+    assert juiz._veredito_valido(resposta)
+
+
+def test_replay_e_deterministico(replay):
+    prompt = juiz.montar_prompt_agrupado("PE-AL0001", ERROS, "Texto da carta.")
+
+    assert replay.generate_content("sistema", prompt) == replay.generate_content("sistema", prompt)
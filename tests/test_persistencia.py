@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import Column, Integer, String, create_engine, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from persistencia import ATUALIZAR, INSERIR, EscritorLote
+
+Base = declarative_base()
+
+
+class Linha(Base):
+    __tablename__ = "linhas"
+
+    id = Column(Integer, primary_key=True)
+    reference = Column(String, nullable=False)
+    valor = Column(String)
+
+
+@pytest.fixture
+def sessoes():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def escritor(sessoes):
+    # Intervalo longo: as chamadas só são gravadas no descarregar, todas no mesmo lote
+    escritor = EscritorLote("teste", sessoes, max_linhas=1000, intervalo=60)
+    yield escritor
+    escritor.encerrar()
+
+
+def _references(sessoes):
+    with sessoes() as db:
+        return sorted(db.scalars(select(Linha.reference)))
+
+
+def test_chamadas_de_um_lote_sao_gravadas_numa_transacao(escritor, sessoes):
+    futuros = [
+        escritor.enfileirar([(INSERIR, Linha, [{"reference": f"PE-AL{i:04d}"}, {"reference": f"PE-AL{i:04d}"}])])
+        for i in range(3)
+    ]
+    escritor.descarregar()
+
+    assert [futuro.result() for futuro in futuros] == [2, 2, 2]
+    assert escritor.lotes == 1
+    assert len(_references(sessoes)) == 6
+
+
+def test_chamada_invalida_nao_derruba_as_demais(escritor, sessoes):
+    concluidas = []
+    boa1 = escritor.enfileirar([(INSERIR, Linha, [{"reference": "A"}])], concluidas.append)
+    ruim = escritor.enfileirar([(INSERIR, Linha, [{"reference": "B"}, {"reference": None}])], concluidas.append)
+    boa2 = escritor.enfileirar([(INSERIR, Linha, [{"reference": "C"}])], concluidas.append)
+    escritor.descarregar()
+
+    assert boa1.result() == 1 and boa2.result() == 1
+    assert isinstance(ruim.exception(), IntegrityError)
+    assert _references(sessoes) == ["A", "C"]
+    assert escritor.falhas == 1
+    assert sum(erro is not None for erro in concluidas) == 1
+
+
+def test_atualizacao_em_massa_pela_chave(escritor, sessoes):
+    escritor.enfileirar([(INSERIR, Linha, [{"id": 1, "reference": "A"}, {"id": 2, "reference": "B"}])])
+    escritor.descarregar()
+
+    escritor.enfileirar([(ATUALIZAR, Linha, [{"id": 1, "valor": "x"}, {"id": 2, "valor": "y"}])])
+    escritor.descarregar()
+
+    with sessoes() as db:
+        assert sorted(db.scalars(select(Linha.valor))) == ["x", "y"]
+
+
+def test_chamada_sem_linhas_resolve_na_hora(escritor):
+    assert escritor.enfileirar([(INSERIR, Linha, [])]).result() == 0
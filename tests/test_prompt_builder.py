@@ -0,0 +1,44 @@
+from prompt_builder import contar_tokens, dividir_texto
+
+MODELO = "gpt-4o-mini"
+
+
+def _texto(paragrafos: int, palavras: int = 60) -> str:
+    return "\n\n".join(
+        " ".join(f"p{i}w{j}" for j in range(palavras)) for i in range(paragrafos)
+    )
+
+
+def test_texto_que_cabe_nao_e_dividido():
+    texto = _texto(2, 10)
+
+    assert dividir_texto(texto, 1000, 50, MODELO) == [texto]
+
+
+def test_partes_respeitam_o_limite_e_cobrem_todo_o_texto():
+    texto = _texto(12)
+
+    partes = dividir_texto(texto, 300, 40, MODELO)
+
+    assert len(partes) > 1
+    assert all(contar_tokens(parte, MODELO) <= 300 for parte in partes)
+    palavras = set(texto.split())
+    assert palavras == set(" ".join(partes).split())
+
+
+def test_cada_parte_repete_o_final_da_anterior():
+    partes = dividir_texto(_texto(12), 300, 40, MODELO)
+
+    for anterior, parte in zip(partes, partes[1:]):
+        assert parte.split()[0] in anterior.split()
+
+
+def test_paragrafo_maior_que_o_limite_e_cortado_em_palavra():
+    texto = _texto(1, 400)
+
+    partes = dividir_texto(texto, 200, 20, MODELO)
+
+    assert len(partes) > 1
+    palavras = set(texto.split())
+    for parte in partes:
+        assert set(parte.split()) <= palavras
@@ -0,0 +1,126 @@
+import os
+import hashlib
+import threading
+from pathlib import Path
+from typing import Optional
+import logging
+from dotenv import load_dotenv
+from pdf_extractor import extrair_texto
+
+# Carrega as variáveis do arquivo .env
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+TEXT_CACHE_DIR = Path(os.getenv("TEXT_CACHE_DIR", "cache/texto"))
+TEXT_CACHE_MAX_MB = int(os.getenv("TEXT_CACHE_MAX_MB", "512"))
+
+
+def hash_conteudo(conteudo: bytes) -> str:
+    """Chave do cache: SHA-256 do conteúdo do PDF"""
+    return hashlib.sha256(conteudo).hexdigest()
+
+
+class TextCache:
+    """
+    Cache em disco do texto extraído dos PDFs, endereçado pelo hash do conteúdo.
+    Quando o tamanho total passa do limite, remove os arquivos acessados há mais tempo.
+    """
+
+    def __init__(self, diretorio: Path = TEXT_CACHE_DIR, max_bytes: int = TEXT_CACHE_MAX_MB * 1024 * 1024):
+        self.diretorio = Path(diretorio)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # O diretório só é criado no primeiro salvar: importar o módulo não grava nada
+        self._tamanho = 0
+        if self.diretorio.is_dir():
+            self._tamanho = sum(entrada.stat().st_size for entrada in os.scandir(self.diretorio) if entrada.is_file())
+        self.acertos = 0
+        self.falhas = 0
+
+    def _caminho(self, pdf_hash: str, completo: bool = True) -> Path:
+        # Extrações interrompidas pelo limite de caracteres ficam em arquivo separado
+        return self.diretorio / (f"{pdf_hash}.txt" if completo else f"{pdf_hash}.parcial.txt")
+
+    def obter(self, pdf_hash: str, limite_caracteres: Optional[int] = None) -> Optional[str]:
+        """
+        Retorna o texto completo do PDF. Com limite_caracteres, aceita também uma
+        extração parcial que já tenha pelo menos esse tamanho.
+        """
+        candidatos = [self._caminho(pdf_hash)]
+        if limite_caracteres:
+            candidatos.append(self._caminho(pdf_hash, completo=False))
+
+        for caminho in candidatos:
+            try:
+                texto = caminho.read_text(encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            if caminho.name.endswith(".parcial.txt") and len(texto) < limite_caracteres:
+                continue
+            # Atualiza o mtime para a remoção por antiguidade de acesso
+            os.utime(caminho)
+            self.acertos += 1
+            return texto
+
+        self.falhas += 1
+        return None
+
+    def salvar(self, pdf_hash: str, texto: str, completo: bool = True):
+        caminho = self._caminho(pdf_hash, completo)
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        temporario = caminho.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        temporario.write_text(texto, encoding="utf-8")
+        novo = temporario.stat().st_size
+
+        with self._lock:
+            # Ao sobrescrever um hash já salvo, o tamanho do arquivo antigo sai da conta
+            try:
+                antigo = caminho.stat().st_size
+            except FileNotFoundError:
+                antigo = 0
+            os.replace(temporario, caminho)  # Escrita atômica: leitores nunca veem arquivo parcial
+            self._tamanho += novo - antigo
+            if self._tamanho > self.max_bytes:
+                self._remover_antigos()
+
+    def _remover_antigos(self):
+        entradas = sorted(
+            (entrada for entrada in os.scandir(self.diretorio) if entrada.name.endswith(".txt")),
+            key=lambda entrada: entrada.stat().st_mtime
+        )
+        self._tamanho = sum(entrada.stat().st_size for entrada in entradas)
+        alvo = self.max_bytes * 0.9
+        for entrada in entradas:
+            if self._tamanho <= alvo:
+                break
+            try:
+                tamanho = entrada.stat().st_size
+                os.remove(entrada.path)
+                self._tamanho -= tamanho
+            except FileNotFoundError:
+                pass
+        logger.info(f"Cache de texto reduzido para {self._tamanho / (1024 * 1024):.1f} MB")
+
+    def obter_ou_extrair(self, pdf_path: str) -> str:
+        """Retorna o texto completo do PDF, extraindo apenas se o conteúdo ainda não estiver no cache"""
+        with open(pdf_path, "rb") as f:
+            conteudo = f.read()
+        pdf_hash = hash_conteudo(conteudo)
+
+        texto = self.obter(pdf_hash)
+        if texto is None:
+            texto, _ = extrair_texto(conteudo)
+            self.salvar(pdf_hash, texto)
+        return texto
+
+    def estatisticas(self):
+        return {
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "tamanho_mb": round(self._tamanho / (1024 * 1024), 2),
+            "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+        }
+
+
+text_cache = TextCache()